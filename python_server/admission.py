@@ -0,0 +1,241 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from latency_stats import Histogram
+from session_store import SessionStore, DEFAULT_SESSION_ID, normalize_session_id
+from server_logging import get_logger
+
+# Admission Control
+# Without a gate every /detect request goes straight into the pipeline, so
+# under overload frames queue up until each answer is stale when it arrives.
+# Admitted frames wait here, in arrival order, for one of ADMIT_CONCURRENCY
+# processing slots. Each new frame's latency is predicted from the frames
+# ahead of it and the recent time per frame, then checked against
+# ADMIT_LATENCY_BUDGET_MS:
+#   - a newer frame from a session takes the place of that session's older
+#     waiting frame, which is answered {"skipped": true} (only the newest
+#     frame is worth its latency, as in /stream)
+#   - a session already holding ADMIT_SESSION_LIMIT frames gets 429
+#   - a frame that would miss the budget gets 503 straight away
+#   - a waiting frame that used up the budget is skipped as stale
+# Requests without a sessionId (legacy clients) may come from any number of
+# users, so they are never superseded or held to the per-session limit.
+# 429 and 503 carry Retry-After. /health reports the same load figures.
+#
+#   ADMISSION=1                    0 = no gate, every frame goes straight in
+#   ADMIT_CONCURRENCY=0            frames processed at once (0 = sized to the
+#                                  inference setup, see main.py)
+#   ADMIT_LATENCY_BUDGET_MS=500    max predicted wait + processing time
+#   ADMIT_SESSION_LIMIT=2          frames one session may have admitted
+
+ADMISSION = os.environ.get('ADMISSION', '1').lower() in ('1', 'true', 'yes')
+ADMIT_CONCURRENCY = int(os.environ.get('ADMIT_CONCURRENCY', 0))
+ADMIT_LATENCY_BUDGET_MS = float(os.environ.get('ADMIT_LATENCY_BUDGET_MS', 500))
+ADMIT_SESSION_LIMIT = int(os.environ.get('ADMIT_SESSION_LIMIT', 2))
+SERVICE_SMOOTHING = 0.2  # EWMA weight of the newest frame's processing time
+ADMISSION_IDLE_TIMEOUT = 120  # seconds
+
+WAITING, RUNNING, SUPERSEDED, STALE, DONE = 'waiting', 'running', 'superseded', 'stale', 'done'
+
+log = get_logger('admission')
+
+
+class Rejected(Exception):
+    """A frame refused at the door: HTTP `status` with a Retry-After of `retry_after` seconds."""
+
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class SessionLoad:
+    """One session's admitted frames (waiting + running) and its recent queue wait."""
+    __slots__ = ('admitted', 'waiting', 'wait_ms')
+
+    def __init__(self):
+        self.admitted = 0
+        self.waiting = None  # Its Ticket still waiting for a slot, if any
+        self.wait_ms = 0.0   # EWMA
+
+
+class Ticket:
+    __slots__ = ('session', 'state', 'queued_at', 'started_at')
+
+    def __init__(self, session):
+        self.session = session
+        self.state = WAITING
+        self.queued_at = time.perf_counter()
+        self.started_at = None
+
+    @property
+    def waited_ms(self):
+        return ((self.started_at or time.perf_counter()) - self.queued_at) * 1000
+
+
+class AdmissionController:
+    def __init__(self, concurrency, budget_ms=ADMIT_LATENCY_BUDGET_MS, session_limit=ADMIT_SESSION_LIMIT,
+                 idle_timeout=ADMISSION_IDLE_TIMEOUT):
+        self.concurrency = max(1, concurrency)
+        self.budget_ms = budget_ms
+        self.session_limit = max(1, session_limit)
+        self.sessions = SessionStore(lambda session_id: SessionLoad(), idle_timeout=idle_timeout)
+        self._cond = threading.Condition()
+        self._queue = deque()  # Waiting tickets, arrival order
+        self.running = 0
+        self.service_ms = 0.0  # EWMA of admitted frames' processing time
+        self.admitted = 0
+        self.superseded = 0
+        self.stale = 0
+        self.rejected = {429: 0, 503: 0}
+        self._wait = Histogram()
+        log.info("🚦 Admission control: %d slot(s), %.0f ms budget", self.concurrency, budget_ms)
+
+    def _predict(self, ahead):
+        """Wait + processing time (ms) of a frame with `ahead` frames waiting before it."""
+        backlog = max(0, self.running + ahead + 1 - self.concurrency)
+        return math.ceil(backlog / self.concurrency) * self.service_ms + self.service_ms
+
+    def _accepts(self, ahead, predicted_ms):
+        # A free slot always takes the frame: an idle server must not refuse work on an old estimate
+        return self.running + ahead < self.concurrency or predicted_ms <= self.budget_ms
+
+    def _retry_after(self, predicted_ms):
+        return max(1, math.ceil((predicted_ms - self.budget_ms) / 1000))
+
+    def enter(self, session_id):
+        """
+        Admit a frame or raise Rejected. The returned Ticket goes to wait()
+        and, whatever happens, to leave().
+        """
+        if normalize_session_id(session_id) == DEFAULT_SESSION_ID:
+            session = SessionLoad()  # Anonymous: each frame stands alone
+        else:
+            session = self.sessions.get(session_id)
+        with self._cond:
+            older = session.waiting
+            if older is not None:
+                # Take the older frame's place in line; it is answered as skipped
+                ticket = Ticket(session)
+                self._queue[self._queue.index(older)] = ticket
+                older.state = SUPERSEDED
+                session.waiting = ticket
+                self.superseded += 1
+                self.admitted += 1
+                self._cond.notify_all()
+                return ticket
+
+            if session.admitted >= self.session_limit:
+                self.rejected[429] += 1
+                raise Rejected(429, "Too many frames in flight for this session",
+                               self._retry_after(max(session.wait_ms, self.service_ms) + self.budget_ms))
+            predicted = self._predict(len(self._queue))
+            if not self._accepts(len(self._queue), predicted):
+                self.rejected[503] += 1
+                raise Rejected(503, "Server busy", self._retry_after(predicted))
+
+            ticket = Ticket(session)
+            self._queue.append(ticket)
+            session.admitted += 1
+            session.waiting = ticket
+            self.admitted += 1
+            return ticket
+
+    def wait(self, ticket):
+        """Block until the frame may be processed: True, or False when it was skipped."""
+        deadline = ticket.queued_at + self.budget_ms / 1000
+        with self._cond:
+            while True:
+                if ticket.state != WAITING:
+                    return False  # Superseded by a newer frame of its session
+                if self.running < self.concurrency and self._queue[0] is ticket:
+                    self._queue.popleft()
+                    self._start(ticket)
+                    return True
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._queue.remove(ticket)
+                    ticket.state = STALE
+                    ticket.session.waiting = None
+                    self.stale += 1
+                    self._cond.notify_all()
+                    return False
+                self._cond.wait(remaining)
+
+    def _start(self, ticket):
+        ticket.state = RUNNING
+        ticket.started_at = time.perf_counter()
+        self.running += 1
+        session = ticket.session
+        if session.waiting is ticket:
+            session.waiting = None
+        waited = ticket.waited_ms
+        session.wait_ms += SERVICE_SMOOTHING * (waited - session.wait_ms)
+        self._wait.record(waited)
+
+    def leave(self, ticket):
+        """Release a ticket (processed, skipped or failed)."""
+        with self._cond:
+            session = ticket.session
+            if ticket.state == WAITING:  # Never got to wait()
+                self._queue.remove(ticket)
+                if session.waiting is ticket:
+                    session.waiting = None
+            elif ticket.state == RUNNING:
+                self.running -= 1
+                elapsed = (time.perf_counter() - ticket.started_at) * 1000
+                self.service_ms += SERVICE_SMOOTHING * (elapsed - self.service_ms) if self.service_ms else elapsed
+            if ticket.state in (WAITING, RUNNING, STALE):
+                session.admitted -= 1  # A superseded frame's place went to the newer one
+            ticket.state = DONE
+            self._cond.notify_all()
+
+    def pressure(self):
+        """
+        Queueing load (0..1) for the frame scheduler: how long the frames
+        queued now will wait, as a share of the latency budget.
+        """
+        with self._cond:
+            backlog = max(0, self.running + len(self._queue) - self.concurrency)
+            return min(1.0, math.ceil(backlog / self.concurrency) * self.service_ms / self.budget_ms)
+
+    def load(self):
+        """Current load, as /health reports it to load balancers."""
+        with self._cond:
+            predicted = self._predict(len(self._queue))
+            return {
+                "running": self.running,
+                "queued": len(self._queue),
+                "capacity": self.concurrency,
+                "utilization": round((self.running + len(self._queue)) / self.concurrency, 3),
+                "service_ms": round(self.service_ms, 1),
+                "predicted_ms": round(predicted, 1),
+                "budget_ms": self.budget_ms,
+                "accepting": self._accepts(len(self._queue), predicted),
+            }
+
+    def stats(self):
+        load = self.load()
+        with self._cond:
+            return {
+                **load,
+                "sessions": len(self.sessions),
+                "admitted": self.admitted,
+                "superseded": self.superseded,
+                "stale": self.stale,
+                "rejected_429": self.rejected[429],
+                "rejected_503": self.rejected[503],
+                "wait_ms": self._wait.summary(),
+                "session_limit": self.session_limit,
+            }
+
+
+def create_admission(default_concurrency):
+    """The /detect gate, or None with ADMISSION=0. ADMIT_CONCURRENCY overrides `default_concurrency`."""
+    if not ADMISSION:
+        return None
+    return AdmissionController(ADMIT_CONCURRENCY or default_concurrency)
@@ -1,111 +1,244 @@
 
 import numpy as np
 
-def calculate_angle(a, b, c):
+from exercise_configs import EXERCISE_CONFIGS
+from form_validator import FORM_CHECK_ANGLES
+from server_logging import get_logger
+
+# Joint-definition table: (angle name, first point, vertex, end point).
+# Order matters - it is the order angles appear in the result dict.
+JOINT_ANGLES = (
+    ('left_elbow', 11, 13, 15),      # LEFT ARM (Shoulder, Elbow, Wrist)
+    ('left_shoulder', 13, 11, 23),
+    ('right_elbow', 12, 14, 16),     # RIGHT ARM
+    ('right_shoulder', 14, 12, 24),
+    ('left_knee', 23, 25, 27),       # LEFT LEG (Hip, Knee, Ankle)
+    ('left_hip', 11, 23, 25),
+    ('right_knee', 24, 26, 28),      # RIGHT LEG
+    ('right_hip', 12, 24, 26),
+)
+JOINT_NAMES = tuple(j[0] for j in JOINT_ANGLES)
+NUM_JOINTS = len(JOINT_ANGLES)
+
+# Angles filled in without the confidence filter when too few joints are visible
+FALLBACK_JOINTS = ('left_elbow', 'right_elbow', 'left_knee', 'right_knee')
+MIN_CONFIDENT_JOINTS = 4
+
+NUM_LANDMARKS = 33
+X, Y, Z, VIS = 0, 1, 2, 3
+TORSO = (11, 23)  # Shoulder -> Hip
+
+TORSO_ANGLE = 'torso_inclination'
+ANGLE_NAMES = JOINT_NAMES + (TORSO_ANGLE,)
+
+def _flat(points, coord):
+    return [p * 4 + coord for p in points]
+
+# Visibility of every joint triplet (first points | vertices | end points)
+_GATHER_VIS = np.array(
+    _flat([j[1] for j in JOINT_ANGLES], VIS) +
+    _flat([j[2] for j in JOINT_ANGLES], VIS) +
+    _flat([j[3] for j in JOINT_ANGLES], VIS))
+
+class AnglePlan:
+    """
+    Precompiled gather indices for the subset of angles one exercise needs.
+    Built once at import; get_exercise_angles only computes what is listed.
+    """
+    __slots__ = ('names', 'joints', 'torso', 'fallback', '_to', '_from', '_half')
+
+    def __init__(self, angle_names):
+        wanted = set(angle_names)
+        self.joints = tuple(i for i, name in enumerate(JOINT_NAMES) if name in wanted)
+        self.names = tuple(JOINT_NAMES[i] for i in self.joints)
+        self.torso = TORSO_ANGLE in wanted
+        # (position in this plan, angle name) in the legacy fallback order
+        self.fallback = tuple(
+            (self.joints.index(JOINT_NAMES.index(name)), name)
+            for name in FALLBACK_JOINTS if name in wanted)
+
+        a = [JOINT_ANGLES[i][1] for i in self.joints]
+        b = [JOINT_ANGLES[i][2] for i in self.joints]
+        c = [JOINT_ANGLES[i][3] for i in self.joints]
+        hip = [TORSO[1]] if self.torso else []
+        shoulder = [TORSO[0]] if self.torso else []
+        # One gather pulls every coordinate the batch needs out of the flattened array:
+        # [end y | first y | hip y] - [vertex y | vertex y | shoulder y], same for x.
+        self._to = np.array(_flat(c, Y) + _flat(a, Y) + _flat(hip, Y) +
+                            _flat(c, X) + _flat(a, X) + _flat(hip, X), dtype=np.intp)
+        self._from = np.array(_flat(b, Y) + _flat(b, Y) + _flat(shoulder, Y) +
+                              _flat(b, X) + _flat(b, X) + _flat(shoulder, X), dtype=np.intp)
+        self._half = 2 * len(self.joints) + len(hip)
+
+    @property
+    def angle_names(self):
+        return self.names + ((TORSO_ANGLE,) if self.torso else ())
+
+FULL_PLAN = AnglePlan(ANGLE_NAMES)
+
+def plan_angles(config, exercise_id=None):
+    """Angles an exercise needs: key_angles + stage ranges + form checks."""
+    names = list(config.get('key_angles', []))
+    for stage in config.get('stages', []):
+        names.extend(stage['ranges'])
+    names.extend(FORM_CHECK_ANGLES.get(exercise_id, []))
+    return names
+
+ANGLE_PLANS = {
+    exercise_id: AnglePlan(plan_angles(config, exercise_id))
+    for exercise_id, config in EXERCISE_CONFIGS.items()
+}
+
+def check_angle_plans(configs=EXERCISE_CONFIGS, plans=ANGLE_PLANS):
+    """
+    Flag configs whose stages (or key_angles / form checks) reference an angle
+    the plan can't provide - usually a typo in the angle name.
+    Returns a list of human readable problems (empty = all good).
+    """
+    problems = []
+    for exercise_id, config in configs.items():
+        plan = plans.get(exercise_id)
+        provided = set(plan.angle_names) if plan else set()
+        for stage in config.get('stages', []):
+            for joint in stage['ranges']:
+                if joint not in provided:
+                    problems.append(f"{exercise_id}: stage '{stage['name']}' uses '{joint}' which is not in its angle plan")
+        for joint in list(config.get('key_angles', [])) + FORM_CHECK_ANGLES.get(exercise_id, []):
+            if joint not in provided:
+                problems.append(f"{exercise_id}: '{joint}' is not a known angle")
+    return problems
+
+# Wire layout of one serialized NormalizedLandmark inside a NormalizedLandmarkList:
+# 0x0a <len> then fixed32 fields x(0x0d) y(0x15) z(0x1d) visibility(0x25) [presence(0x2d)].
+# Reading the floats straight out of SerializeToString() is several times faster than 132
+# protobuf attribute reads. Anything that doesn't match falls back to attributes.
+_WIRE_TAGS = ((2, 0x0d), (7, 0x15), (12, 0x1d), (17, 0x25), (22, 0x2d))
+_WIRE_CHECKS = {
+    size: [(0, b'\x0a' * NUM_LANDMARKS), (1, bytes([size - 2]) * NUM_LANDMARKS)] +
+          [(col, bytes([tag]) * NUM_LANDMARKS) for col, tag in _WIRE_TAGS if col < size]
+    for size in (22, 27)  # without / with presence
+}
+
+def _unpack_wire(message):
+    data = message.SerializeToString()
+    size, extra = divmod(len(data), NUM_LANDMARKS)
+    checks = _WIRE_CHECKS.get(size)
+    if checks is None or extra:
+        return None
+    for col, expected in checks:
+        if data[col::size] != expected:
+            return None
+    # x, y, z, visibility sit 5 bytes apart starting at byte 3 of each landmark
+    floats = np.ndarray((NUM_LANDMARKS, 4), dtype='<f4', buffer=data, offset=3, strides=(size, 5))
+    return floats.astype(np.float64)
+
+def pack_landmarks(landmarks):
     """
-    Calculate the angle at point b given points a, b, and c.
-    Points are landmarks with .x and .y attributes.
+    Pack landmarks into a contiguous (33, 4) float64 array of x, y, z, visibility.
+    Accepts a NormalizedLandmarkList (fast path), any sequence of landmarks with
+    .x/.y/.z/.visibility, or an already packed array (returned untouched).
     """
-    a = np.array([a.x, a.y]) # First point
-    b = np.array([b.x, b.y]) # Mid point (vertex)
-    c = np.array([c.x, c.y]) # End point
-    
-    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
-    angle = np.abs(radians*180.0/np.pi)
-    
-    if angle > 180.0:
-        angle = 360 - angle
-        
-    return angle
+    if isinstance(landmarks, np.ndarray):
+        return landmarks
+    if hasattr(landmarks, 'SerializeToString'):
+        packed = _unpack_wire(landmarks)
+        if packed is not None:
+            return packed
+        landmarks = landmarks.landmark
+    return np.array([(lm.x, lm.y, lm.z, lm.visibility) for lm in landmarks], dtype=np.float64)
+
+def compute_joint_angles(packed, min_confidence=0.2, plan=FULL_PLAN):
+    """
+    The plan's joint angles plus the torso direction in one batched operation
+    over a packed (33, 4) array. Returns (joint angles, visible, torso degrees):
+    angles are unrounded degrees (0-180) at each vertex, in plan order;
+    `visible` covers all JOINT_ANGLES (the fallback rule counts every joint).
+    A stacked (N, 33, 4) array gives one row per frame in each of the three.
+    """
+    flat = packed.reshape(packed.shape[:-2] + (-1,))
+    seen = flat.take(_GATHER_VIS, axis=-1) > min_confidence
+    visible = seen[..., :NUM_JOINTS] & seen[..., NUM_JOINTS:2 * NUM_JOINTS] & seen[..., 2 * NUM_JOINTS:]
+    if not plan._half:
+        return np.empty(packed.shape[:-2] + (0,)), visible, None
+
+    n = len(plan.joints)
+    delta = flat.take(plan._to, axis=-1) - flat.take(plan._from, axis=-1)
+    directions = np.arctan2(delta[..., :plan._half], delta[..., plan._half:])
+    radians = directions[..., :n] - directions[..., n:2 * n]
+    angles = np.abs(radians * 180.0 / np.pi)
+    angles = np.minimum(angles, 360 - angles)  # Same as: if angle > 180: 360 - angle
+    torso = np.degrees(directions[..., 2 * n]) if plan.torso else None
+    return angles, visible, torso
+
+def _round1(value):
+    """round(value, 1) with NumPy's semantics (scale, round-half-even, unscale)."""
+    return round(value * 10.0) / 10.0
 
 def get_exercise_angles(landmarks, exercise_id, min_confidence=0.2):
     """
-    Calculate and return only the relevant angles for a specific exercise.
+    Calculate and return only the relevant angles for a specific exercise
+    (see ANGLE_PLANS; unknown exercises get every angle).
     Uses lower confidence threshold for better mobile compatibility.
+    `landmarks` may be MediaPipe landmarks, a NormalizedLandmarkList or an
+    already packed (33, 4) array.
     """
     angles = {}
-    
-    if not landmarks:
+
+    if landmarks is None:
         return angles
+    if hasattr(landmarks, 'landmark'):
+        if len(landmarks.landmark) < NUM_LANDMARKS:
+            return angles
+    elif len(landmarks) < NUM_LANDMARKS:
+        return angles
+
+    packed = pack_landmarks(landmarks)
+    plan = ANGLE_PLANS.get(exercise_id, FULL_PLAN)
+
+    # Joint angles - visibility masking done as a vector op
+    joint_angles, visible, torso = compute_joint_angles(packed, min_confidence, plan)
+    torso_seen = plan.torso and packed[TORSO[0], VIS] > min_confidence and packed[TORSO[1], VIS] > min_confidence
+    return _angle_dict(plan, joint_angles.tolist(), visible.tolist(), torso, torso_seen)
 
-    # Helper function to safely calculate angles
-    def safe_angle(p1_idx, p2_idx, p3_idx, angle_name):
-        """Calculate angle with confidence check"""
-        try:
-            # Check confidence for all three points
-            if (landmarks[p1_idx].visibility > min_confidence and
-                landmarks[p2_idx].visibility > min_confidence and
-                landmarks[p3_idx].visibility > min_confidence):
-                angle = calculate_angle(landmarks[p1_idx], landmarks[p2_idx], landmarks[p3_idx])
-                angles[angle_name] = round(angle, 1)
-                return True
-            return False
-        except Exception as e:
-            print(f"⚠️  Error calculating {angle_name}: {e}")
-            return False
-
-    # Track if we got any angles at all
-    angles_calculated = 0
-
-    # LEFT ARM (Shoulder, Elbow, Wrist)
-    if safe_angle(11, 13, 15, 'left_elbow'):
-        angles_calculated += 1
-    if safe_angle(13, 11, 23, 'left_shoulder'):
-        angles_calculated += 1
-
-    # RIGHT ARM
-    if safe_angle(12, 14, 16, 'right_elbow'):
-        angles_calculated += 1
-    if safe_angle(14, 12, 24, 'right_shoulder'):
-        angles_calculated += 1
-
-    # LEFT LEG (Hip, Knee, Ankle)
-    if safe_angle(23, 25, 27, 'left_knee'):
-        angles_calculated += 1
-    if safe_angle(11, 23, 25, 'left_hip'):
-        angles_calculated += 1
-
-    # RIGHT LEG
-    if safe_angle(24, 26, 28, 'right_knee'):
-        angles_calculated += 1
-    if safe_angle(12, 24, 26, 'right_hip'):
-        angles_calculated += 1
+def get_batch_angles(stacked, exercise_id, min_confidence=0.2):
+    """
+    get_exercise_angles for a stacked (N, 33, 4) array of one exercise's
+    frames: the angles of every frame come out of one vectorized pass.
+    Returns N angle dicts, each equal to what get_exercise_angles gives.
+    """
+    plan = ANGLE_PLANS.get(exercise_id, FULL_PLAN)
+    joint_angles, visible, torso = compute_joint_angles(stacked, min_confidence, plan)
+    torso_seen = (stacked[:, TORSO, VIS] > min_confidence).all(axis=1).tolist()
+    torsos = torso.tolist() if plan.torso else [None] * len(stacked)
+    return [
+        _angle_dict(plan, frame_angles, frame_visible, frame_torso, plan.torso and frame_torso_seen)
+        for frame_angles, frame_visible, frame_torso, frame_torso_seen
+        in zip(joint_angles.tolist(), visible.tolist(), torsos, torso_seen)
+    ]
+
+def _angle_dict(plan, joint_angles, visible, torso, torso_seen):
+    """One frame's angles dict from compute_joint_angles' output (as lists)."""
+    angles = {}
+    joint_angles = [_round1(a) for a in joint_angles]
+
+    for index, name, angle in zip(plan.joints, plan.names, joint_angles):
+        if visible[index]:
+            angles[name] = angle
 
     # TORSO INCLINATION (Shoulder to Hip relative to vertical)
     # 0 = Upright, 90 = Horizontal, 180 = Inverted
-    def calculate_inclination(p1, p2):
-        try:
-             # Vector p1 -> p2 (e.g., Shoulder -> Hip)
-             dy = p2.y - p1.y
-             dx = p2.x - p1.x
-             angle = np.degrees(np.arctan2(dy, dx))
-             # Convert to deviation from vertical (0 degrees = upright standing)
-             # arctan2(dy, dx): -90 or 270 is up, 90 is down.
-             # Standard image coords: Y increases downwards.
-             # So Shoulder(y0) < Hip(y1). dy > 0. 
-             # Vertical (standing): dy > 0, dx ~ 0. angle ~ 90.
-             # Horizontal (plank): dy ~ 0, dx > 0 (or < 0). angle ~ 0 or 180.
-             
-             # Normalized inclination: 0 to 90
-             # 0 = Vertical (Standing)
-             # 90 = Horizontal (Plank)
-             inclination = abs(abs(angle) - 90)
-             return round(inclination, 1)
-        except:
-            return 0
-
-    if landmarks[11].visibility > min_confidence and landmarks[23].visibility > min_confidence:
-        angles['torso_inclination'] = calculate_inclination(landmarks[11], landmarks[23])
+    # arctan2(dy, dx) of Shoulder -> Hip: vertical (standing) ~ 90, horizontal (plank) ~ 0 or 180,
+    # normalised to 0 = Vertical (Standing), 90 = Horizontal (Plank)
+    if torso_seen:
+        angles[TORSO_ANGLE] = _round1(abs(abs(float(torso)) - 90))
 
     # FALLBACK: If core angles were missed due to confidence, try without filtering
     # This prevents total detection failure
-    if angles_calculated < 4: 
-        try:
-            angles['left_elbow'] = angles.get('left_elbow', round(calculate_angle(landmarks[11], landmarks[13], landmarks[15]), 1))
-            angles['right_elbow'] = angles.get('right_elbow', round(calculate_angle(landmarks[12], landmarks[14], landmarks[16]), 1))
-            angles['left_knee'] = angles.get('left_knee', round(calculate_angle(landmarks[23], landmarks[25], landmarks[27]), 1))
-            angles['right_knee'] = angles.get('right_knee', round(calculate_angle(landmarks[24], landmarks[26], landmarks[28]), 1))
-        except:
-            pass
+    if sum(visible) < MIN_CONFIDENT_JOINTS:
+        for position, name in plan.fallback:
+            angles.setdefault(name, joint_angles[position])
 
     return angles
+
+for problem in check_angle_plans():
+    get_logger('angles').warning("⚠️ Angle plan: %s", problem)
@@ -0,0 +1,178 @@
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Offline Batch Processing
+# Runs recorded workout videos through the same pose -> angles -> form -> reps
+# pipeline as /detect, for auditing and coach review. Each video is processed
+# start to finish by one process (Pose tracking and rep state follow the frame
+# order); several videos run in parallel, one per CPU core.
+#
+#   python batch_process.py squats_01.mp4 squats_02.mp4 --exercise squats --jobs 4
+#
+# Output per video: <name>.reps.jsonl.gz - one compact JSON object per frame
+# ({"f", "t", "stage", "reps", "score", "angles", "feedback"}), a
+# {"event": "rep", ...} line each time the count goes up and a final
+# {"event": "summary", ...} line.
+
+DEFAULT_JOBS = max(1, (os.cpu_count() or 1) - 1)
+
+
+class VideoClock:
+    """
+    Stands in for RepCounterStore inside analyze_frame: one session, and the
+    rep counter's debounce runs on the video timestamp instead of wall time.
+    """
+
+    def __init__(self, counter):
+        self.counter = counter
+        self.now = 0.0
+
+    def update(self, exercise_id, angles, form_is_valid=True, session_id=None):
+        return self.counter.update(exercise_id, angles, form_is_valid, now=self.now)
+
+
+def output_path(video_path, out_dir):
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(out_dir or os.path.dirname(os.path.abspath(video_path)), f"{name}.reps.jsonl.gz")
+
+
+def process_video(video_path, exercise_id, out_dir=None, stride=1, verbose=False, trace_dir=None):
+    """Analyse one video file. Returns a summary dict (frames, reps, fps, ...)."""
+    import cv2
+    from pose_pipeline import create_pose, analyze_frame
+    from rep_counter import RepCounter
+    from landmark_trace import TraceRecorder
+    from frame_preprocess import create_preprocessor
+    from landmark_filter import create_smoother
+    import server_logging
+
+    cv2.setNumThreads(1)  # Parallelism comes from running one video per process
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        return {"video": video_path, "error": "Could not open video"}
+
+    source_fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    pose = create_pose()
+    session_id = os.path.splitext(os.path.basename(video_path))[0]
+    clock = VideoClock(RepCounter(session_id=session_id))
+    recorder = TraceRecorder(trace_dir, clock=lambda: clock.now) if trace_dir else None
+    preprocessor = create_preprocessor()
+    smoother = create_smoother(clock=lambda: clock.now)
+    out_file = output_path(video_path, out_dir)
+    frames = 0
+    analysed = 0
+    last_count = 0
+    started = time.perf_counter()
+
+    server_logging.configure_logging('DEBUG' if verbose else 'WARNING')  # Pipeline logs every frame
+    try:
+        with gzip.open(out_file, 'wt', encoding='utf-8') as out:
+            while True:
+                ok, img = capture.read()
+                if not ok:
+                    break
+                index = frames
+                frames += 1
+                if index % stride:
+                    continue
+
+                clock.now = index / source_fps
+                result = analyze_frame(pose, img, exercise_id, session_id, clock, recorder=recorder,
+                                       preprocessor=preprocessor, smoother=smoother)
+                analysed += 1
+                record = {
+                    "f": index,
+                    "t": round(clock.now, 3),
+                    "stage": result["stage"],
+                    "reps": result["rep_count"],
+                    "score": result.get("form_score", 0),
+                    "angles": result["angles"],
+                    "feedback": result["feedback"],
+                }
+                out.write(json.dumps(record, separators=(',', ':')) + "\n")
+
+                if result["rep_count"] > last_count:
+                    last_count = result["rep_count"]
+                    event = {"event": "rep", "rep": last_count, "f": index, "t": record["t"], "score": record["score"]}
+                    out.write(json.dumps(event, separators=(',', ':')) + "\n")
+
+            elapsed = time.perf_counter() - started
+            summary = {
+                "event": "summary",
+                "video": video_path,
+                "exercise": exercise_id,
+                "frames": frames,
+                "analysed": analysed,
+                "reps": last_count,
+                "seconds": round(elapsed, 2),
+                "fps": round(analysed / elapsed, 1) if elapsed else 0,
+            }
+            out.write(json.dumps(summary, separators=(',', ':')) + "\n")
+    finally:
+        capture.release()
+        pose.close()
+        if recorder:
+            recorder.close()
+        server_logging.flush()
+
+    summary["output"] = out_file
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run recorded workout videos through the pose/rep pipeline.")
+    parser.add_argument('videos', nargs='+', help="Video files to analyse")
+    parser.add_argument('--exercise', '-e', required=True, help="Exercise id (see exercise_configs.py)")
+    parser.add_argument('--out-dir', '-o', help="Where to write results (default: next to each video)")
+    parser.add_argument('--jobs', '-j', type=int, default=DEFAULT_JOBS, help="Videos processed in parallel")
+    parser.add_argument('--stride', type=int, default=1, help="Analyse every Nth frame")
+    parser.add_argument('--verbose', '-v', action='store_true', help="Keep the pipeline's debug logs")
+    parser.add_argument('--trace-dir', help="Also record landmark traces here (see landmark_trace.py)")
+    args = parser.parse_args(argv)
+
+    from exercise_configs import EXERCISE_CONFIGS
+    if args.exercise not in EXERCISE_CONFIGS:
+        parser.error(f"Unknown exercise '{args.exercise}'")
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    jobs = max(1, min(args.jobs, len(args.videos)))
+    stride = max(1, args.stride)
+    print(f"🎬 Processing {len(args.videos)} video(s) for '{args.exercise}' with {jobs} process(es)")
+
+    started = time.perf_counter()
+    total_frames = 0
+    failed = 0
+    ctx = multiprocessing.get_context('spawn')  # Never fork a live MediaPipe graph
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx) as executor:
+        futures = {
+            executor.submit(process_video, path, args.exercise, args.out_dir, stride, args.verbose, args.trace_dir): path
+            for path in args.videos
+        }
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except Exception as e:
+                summary = {"video": futures[future], "error": str(e)}
+            if "error" in summary:
+                failed += 1
+                print(f"❌ {summary['video']}: {summary['error']}")
+                continue
+            total_frames += summary["analysed"]
+            print(f"✅ {summary['video']}: {summary['reps']} reps | {summary['analysed']} frames "
+                  f"in {summary['seconds']}s ({summary['fps']} fps) -> {summary['output']}")
+
+    elapsed = time.perf_counter() - started
+    fps = total_frames / elapsed if elapsed else 0
+    print(f"📊 Total: {total_frames} frames in {elapsed:.1f}s ({fps:.1f} fps across {jobs} process(es))")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
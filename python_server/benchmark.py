@@ -0,0 +1,446 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+# End-to-end Benchmark
+# Drives /detect (through the Flask app, in process: no sockets, no network)
+# with a local corpus of frames at several client concurrencies, for each
+# model_complexity and image size. Every (model_complexity, size) pair runs in
+# a fresh subprocess, so models load cold and peak memory is that process's
+# own. Results are compared with a stored baseline; a throughput drop or a
+# p95 latency / memory increase beyond the tolerances fails the run (exit 1).
+#
+#   python benchmark.py                                  # synthetic frames, every installed model
+#   python benchmark.py --corpus clips/squat.mp4 --sizes 640x480 --concurrency 1,2,4
+#   python benchmark.py --save-baseline                  # store this machine's numbers
+#   python benchmark.py --env REQUEST_PIPELINE=1         # one server setting changed
+#
+# Synthetic frames contain no person: they time decode, preprocessing and the
+# person detector, not the landmark/rep stages. Use --corpus with recorded
+# frames (a directory of JPEG/PNG files or a video) for the full path.
+# Baselines are only comparable on the same machine and server settings: the
+# run's CPU, Python and MediaPipe versions and its settings are stored with
+# it and a mismatch is reported.
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+DEFAULT_COMPLEXITIES = (0, 1, 2)
+DEFAULT_SIZES = ('480x360', '640x480', '1280x720')
+DEFAULT_CONCURRENCY = (1, 4)
+DEFAULT_FRAMES = 40           # Timed requests per client
+WARMUP_FRAMES = 5             # Per client, not timed (graph init, buffer allocation)
+STARTUP_TIMEOUT = 120         # Seconds to wait for the server's own warm-up
+DEFAULT_REPEAT = 3            # Runs per concurrency level; the fastest is kept (least scheduler noise)
+CORPUS_FRAMES = 60            # Frames kept from a corpus; clients cycle through them
+SYNTHETIC_SEED = 1234
+JPEG_QUALITY = 85
+THROUGHPUT_TOLERANCE = 0.15   # Allowed drop in requests/s
+LATENCY_TOLERANCE = 0.25      # Allowed p95 increase
+MEMORY_TOLERANCE = 0.20       # Allowed peak RSS increase
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png')
+
+# Pose landmark models; 0 and 2 are downloaded by MediaPipe on first use, which
+# this benchmark never does (it must run offline), so missing ones are skipped
+MODEL_FILES = {0: 'pose_landmark_lite.tflite', 1: 'pose_landmark_full.tflite', 2: 'pose_landmark_heavy.tflite'}
+
+# Server settings for every run, whatever the caller's shell has set: every
+# tunable is pinned, mostly to the server's defaults. Off here: frame skipping
+# and the frame cache (they answer without inference), admission control (it
+# sheds frames under load), trace recording; logs are quiet. --env KEY=VALUE
+# changes one for a run.
+BENCHMARK_ENV = {
+    # Inference
+    'POSE_TRACKERS': '4',
+    'POSE_TRACKER_SPARES': '1',
+    'TRACKER_IDLE_TIMEOUT': '120',
+    'INFERENCE_WORKERS': '0',
+    'MAX_QUEUE_PER_WORKER': '8',
+    'INFERENCE_BATCH': '0',
+    'INFERENCE_BATCH_WINDOW_MS': '10',
+    'INFERENCE_BATCH_SIZE': '8',
+    'REQUEST_PIPELINE': '0',
+    'PIPELINE_DECODE_THREADS': '2',
+    'PIPELINE_INFERENCE_WORKERS': '1',
+    'PIPELINE_QUEUE_SIZE': '8',
+    'WARMUP': '1',
+    'CUDA_VISIBLE_DEVICES': '',
+    # Per-frame work
+    'PREPROCESS_MAX_SIDE': '480',
+    'ROI_CROP': '1',
+    'ROI_PADDING': '0.3',
+    'LANDMARK_SMOOTHING': '1',
+    'SMOOTHING_MIN_CUTOFF': '1.0',
+    'SMOOTHING_BETA': '4.0',
+    'MULTI_PERSON': '0',
+    'MAX_PEOPLE': '6',
+    'PERSON_DETECT_EVERY': '10',
+    'PERSON_LOST_FRAMES': '5',
+    'GROUP_SESSIONS': '4',
+    # Frames answered without inference, or shed
+    'FRAME_SKIP': '0',
+    'FRAME_SKIP_LOAD': '0.5',
+    'FRAME_SKIP_CAPACITY': '4',
+    'FRAME_CACHE': '0',
+    'FRAME_CACHE_THRESHOLD': '6',
+    'FRAME_CACHE_SIZE': '4',
+    'FRAME_CACHE_MAX_AGE': '1.0',
+    'ADMISSION': '0',
+    'ADMIT_CONCURRENCY': '0',
+    'ADMIT_LATENCY_BUDGET_MS': '500',
+    'ADMIT_SESSION_LIMIT': '2',
+    # Sessions and rep state
+    'MAX_SESSIONS': '256',
+    'SESSION_IDLE_TIMEOUT': '900',
+    'STATE_FLUSH_INTERVAL': '2.0',
+    'STATE_COMPACT_EVERY': '500',
+    'STATE_MAX_SESSIONS': '10000',
+    # Observability
+    'TRACE_DIR': '',
+    'LOG_LEVEL': 'WARNING',
+    'LOG_FORMAT': 'text',
+    'LOG_SAMPLE_EVERY': '30',
+    'DEBUG_LOGS': '',
+    'SERVER_TIMING': '0',
+}
+
+
+def model_available(complexity):
+    import mediapipe
+    path = os.path.join(os.path.dirname(mediapipe.__file__), 'modules', 'pose_landmark', MODEL_FILES[complexity])
+    return os.path.exists(path)
+
+
+def parse_size(text):
+    w, h = text.lower().split('x')
+    return int(w), int(h)
+
+
+def machine_info():
+    import cv2
+    import mediapipe
+    cpu = platform.processor()
+    try:
+        with open('/proc/cpuinfo') as f:
+            cpu = next((line.split(':', 1)[1].strip() for line in f if line.startswith('model name')), cpu)
+    except OSError:
+        pass
+    return {
+        "cpu": cpu,
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "mediapipe": mediapipe.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+# --- Corpus ---
+
+def synthetic_frames(count=CORPUS_FRAMES, size=(1280, 720), seed=SYNTHETIC_SEED):
+    """Deterministic camera-like frames: gradient, shapes and sensor noise."""
+    import cv2
+    rng = np.random.default_rng(seed)
+    w, h = size
+    gradient = np.linspace(40, 200, w, dtype=np.float32)[None, :, None].repeat(h, 0).repeat(3, 2)
+    frames = []
+    for i in range(count):
+        img = gradient.copy()
+        img += rng.normal(0, 8, img.shape).astype(np.float32)
+        img = np.clip(img, 0, 255).astype(np.uint8)
+        cx = int(w * (0.4 + 0.2 * np.sin(i / count * 2 * np.pi)))
+        cv2.ellipse(img, (cx, h // 4), (w // 30, h // 16), 0, 0, 360, (90, 120, 170), -1)
+        cv2.rectangle(img, (cx - w // 20, h // 3), (cx + w // 20, int(h * 0.65)), (60, 60, 140), -1)
+        cv2.line(img, (cx, int(h * 0.65)), (cx - w // 25, int(h * 0.95)), (40, 40, 40), max(2, w // 80))
+        cv2.line(img, (cx, int(h * 0.65)), (cx + w // 25, int(h * 0.95)), (40, 40, 40), max(2, w // 80))
+        frames.append(img)
+    return frames
+
+
+def load_corpus(path, limit=CORPUS_FRAMES):
+    """Up to `limit` BGR frames from a directory of images or a video file."""
+    import cv2
+    if os.path.isdir(path):
+        files = sorted(p for p in glob.glob(os.path.join(path, '*')) if p.lower().endswith(IMAGE_SUFFIXES))
+        frames = [img for img in (cv2.imread(p) for p in files[:limit]) if img is not None]
+    else:
+        capture = cv2.VideoCapture(path)
+        frames = []
+        while len(frames) < limit:
+            ok, img = capture.read()
+            if not ok:
+                break
+            frames.append(img)
+        capture.release()
+    if not frames:
+        raise ValueError(f"No frames in corpus {path!r}")
+    return frames
+
+
+def encode_frames(frames, size):
+    import cv2
+    encoded = []
+    for img in frames:
+        resized = cv2.resize(img, size, interpolation=cv2.INTER_AREA) if img.shape[1::-1] != size else img
+        encoded.append(cv2.imencode('.jpg', resized, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])[1].tobytes())
+    return encoded
+
+
+# --- One configuration (runs in its own process) ---
+
+def run_clients(app, frames, exercise_id, concurrency, frames_per_client):
+    """
+    `concurrency` threads, each one client session sending frames back to back.
+    Session ids repeat across runs, so per-session state (Pose trackers, ROI
+    buffers) is reused the way a steady set of clients would.
+    """
+    latencies = [[] for _ in range(concurrency)]  # Served requests only
+    errors = [0] * concurrency
+    start = threading.Barrier(concurrency + 1)
+
+    def client(index):
+        http = app.test_client()
+        url = f"/detect?exerciseId={exercise_id}&sessionId=bench-{index}&landmarks=compact"
+        offset = index * 7  # Clients do not send identical frames in lockstep
+        for i in range(WARMUP_FRAMES):
+            http.post(url, data=frames[(offset + i) % len(frames)], content_type='image/jpeg')
+        start.wait()
+        for i in range(frames_per_client):
+            frame = frames[(offset + WARMUP_FRAMES + i) % len(frames)]
+            sent = time.perf_counter()
+            response = http.post(url, data=frame, content_type='image/jpeg')
+            took = (time.perf_counter() - sent) * 1000
+            if response.status_code != 200 or (response.get_json(silent=True) or {}).get('skipped'):
+                errors[index] += 1  # Failed, refused or shed: not served, and fast answers would flatter p95
+            else:
+                latencies[index].append(took)
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    start.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    samples = np.concatenate([np.asarray(l, dtype=float) for l in latencies])
+    p50, p95, p99 = np.percentile(samples, (50, 95, 99)) if samples.size else (0.0, 0.0, 0.0)
+    return {
+        "requests": int(samples.size),
+        "errors": sum(errors),
+        "throughput": round(samples.size / elapsed, 2),
+        "mean_ms": round(float(samples.mean()), 2) if samples.size else 0.0,
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process plus its finished children (ru_maxrss is KiB on Linux)."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round((own + children) / 1024, 1)
+
+
+def run_configuration(args):
+    size = parse_size(args.size)
+    frames = load_corpus(args.corpus) if args.corpus else synthetic_frames()
+    encoded = encode_frames(frames, size)
+    del frames
+
+    import main  # Reads POSE_MODEL_COMPLEXITY and BENCHMARK_ENV, set by the parent
+    main.startup_report.wait(STARTUP_TIMEOUT)  # Warm-up must not overlap the timed runs
+
+    results = []
+    for concurrency in args.concurrency:
+        runs = [run_clients(main.app, encoded, args.exercise, concurrency, args.frames)
+                for _ in range(max(1, args.repeat))]
+        result = max(runs, key=lambda r: r["throughput"])
+        result["concurrency"] = concurrency
+        results.append(result)
+    if main.inference_pool:
+        main.inference_pool.shutdown()  # Workers' peak memory only counts once they exit
+    memory = peak_rss_mb()
+    for result in results:
+        result["peak_rss_mb"] = memory
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f)
+    return 0
+
+
+# --- Driver ---
+
+def result_key(complexity, size, concurrency):
+    return f"complexity={complexity} size={size} concurrency={concurrency}"
+
+
+def compare(result, baseline):
+    """Regression messages for one configuration (empty = within tolerance)."""
+    problems = []
+    if baseline["throughput"] and result["throughput"] < baseline["throughput"] * (1 - THROUGHPUT_TOLERANCE):
+        problems.append(f"throughput {baseline['throughput']} -> {result['throughput']} req/s")
+    if baseline["p95_ms"] and result["p95_ms"] > baseline["p95_ms"] * (1 + LATENCY_TOLERANCE):
+        problems.append(f"p95 {baseline['p95_ms']} -> {result['p95_ms']} ms")
+    if baseline["peak_rss_mb"] and result["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + MEMORY_TOLERANCE):
+        problems.append(f"peak RSS {baseline['peak_rss_mb']} -> {result['peak_rss_mb']} MB")
+    return problems
+
+
+def _delta(value, base):
+    if not base:
+        return ""
+    return f" ({(value - base) / base * 100:+.0f}%)"
+
+
+def run_benchmark(args):
+    complexities = [int(c) for c in args.complexity.split(',')]
+    sizes = [s.strip() for s in args.sizes.split(',')]
+    concurrency = [int(c) for c in args.concurrency.split(',')]
+    for size in sizes:
+        parse_size(size)  # Fail before any run on a bad size
+
+    settings = dict(BENCHMARK_ENV)
+    for override in args.env:
+        key, sep, value = override.partition('=')
+        if not sep or not key:
+            print(f"❌ --env expects KEY=VALUE, got '{override}'")
+            return 1
+        settings[key] = value
+    env = dict(os.environ, **settings)
+    server_dir = os.path.dirname(os.path.abspath(__file__))
+    env['PYTHONPATH'] = os.pathsep.join(p for p in (server_dir, env.get('PYTHONPATH')) if p)
+    corpus = os.path.abspath(args.corpus) if args.corpus else None
+    info = machine_info()
+    print(f"🏁 Benchmark: {corpus or 'synthetic frames'} | {args.frames} requests per client | "
+          f"{info['cpus']} CPU(s), {info['cpu']}")
+
+    results = {}
+    for complexity in complexities:
+        if not model_available(complexity):
+            print(f"⏭️  model_complexity={complexity}: {MODEL_FILES[complexity]} is not installed "
+                  f"(MediaPipe downloads it on first use; this benchmark stays offline)")
+            continue
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as workdir:  # Rep state files land here, not in the repo
+                out = os.path.join(workdir, 'result.json')
+                command = [sys.executable, os.path.abspath(__file__), 'run-one', '--size', size,
+                           '--concurrency', ','.join(map(str, concurrency)), '--frames', str(args.frames),
+                           '--repeat', str(args.repeat),
+                           '--exercise', args.exercise, '--out', out]
+                if corpus:
+                    command += ['--corpus', corpus]
+                proc = subprocess.run(command, cwd=workdir, env=dict(env, POSE_MODEL_COMPLEXITY=str(complexity)),
+                                      stdout=subprocess.DEVNULL if not args.verbose else None,
+                                      stderr=subprocess.PIPE if not args.verbose else None, text=True)
+                if proc.returncode != 0 or not os.path.exists(out):
+                    print(f"❌ model_complexity={complexity} {size}: run failed")
+                    if proc.stderr:
+                        print(proc.stderr.strip().splitlines()[-1])
+                    return 1
+                with open(out) as f:
+                    for result in json.load(f):
+                        result.update(complexity=complexity, size=size)
+                        results[result_key(complexity, size, result["concurrency"])] = result
+
+    if not results:
+        print("❌ Nothing ran")
+        return 1
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        mismatched = {k: (baseline["machine"].get(k), v) for k, v in info.items() if baseline["machine"].get(k) != v}
+        if mismatched:
+            print(f"⚠️  Baseline was recorded on a different setup: {mismatched}")
+        recorded = baseline.get("settings", {})
+        changed = {k: (recorded.get(k), v) for k, v in settings.items() if recorded.get(k) != v}
+        if changed:
+            print(f"⚠️  Baseline was recorded with different server settings: {changed}")
+
+    print(f"\n📊 {'configuration':48} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'MB':>7}")
+    regressions = []
+    errors = 0
+    for key, r in results.items():
+        base = (baseline or {}).get("results", {}).get(key)
+        line = (f"   {key:48} {r['throughput']:8.1f} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} "
+                f"{r['p99_ms']:8.1f} {r['peak_rss_mb']:7.0f}")
+        if base:
+            line += f" | req/s{_delta(r['throughput'], base['throughput'])} p95{_delta(r['p95_ms'], base['p95_ms'])}"
+            problems = compare(r, base)
+            regressions.extend(f"{key}: {p}" for p in problems)
+            line += " ❌" if problems else " ✅"
+        if r["errors"]:
+            errors += r["errors"]
+            line += f" | {r['errors']} errors"
+        print(line)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"machine": info, "settings": settings, "results": results}, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({"machine": info, "settings": settings, "recorded": time.strftime('%Y-%m-%d %H:%M:%S'),
+                       "results": results}, f, indent=2)
+        print(f"\n💾 Baseline saved to {args.baseline}")
+    elif baseline is None:
+        print(f"\nℹ️  No baseline at {args.baseline} - run with --save-baseline to store one")
+
+    if errors:
+        print(f"\n❌ {errors} request(s) failed")
+    if regressions:
+        print(f"\n❌ REGRESSION ({len(regressions)}) - tolerances: throughput -{THROUGHPUT_TOLERANCE:.0%}, "
+              f"p95 +{LATENCY_TOLERANCE:.0%}, memory +{MEMORY_TOLERANCE:.0%}")
+        for regression in regressions:
+            print(f"   {regression}")
+    return 1 if regressions or errors else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark /detect end to end against a stored baseline.")
+    sub = parser.add_subparsers(dest='command')
+
+    parser.add_argument('--corpus', help="Directory of JPEG/PNG frames or a video file (default: synthetic frames)")
+    parser.add_argument('--complexity', default=','.join(map(str, DEFAULT_COMPLEXITIES)),
+                        help="model_complexity values, comma separated")
+    parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES), help="Frame sizes WxH, comma separated")
+    parser.add_argument('--concurrency', default=','.join(map(str, DEFAULT_CONCURRENCY)),
+                        help="Concurrent clients, comma separated")
+    parser.add_argument('--frames', type=int, default=DEFAULT_FRAMES, help="Timed requests per client")
+    parser.add_argument('--repeat', '-r', type=int, default=DEFAULT_REPEAT,
+                        help="Runs per configuration (the fastest is kept)")
+    parser.add_argument('--exercise', '-e', default='squats', help="Exercise id sent with every frame")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline file to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the baseline")
+    parser.add_argument('--json', help="Also write the results to this file")
+    parser.add_argument('--verbose', '-v', action='store_true', help="Show the server's output")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help="Server setting for every run (repeatable); the rest are pinned, see BENCHMARK_ENV")
+    parser.set_defaults(func=run_benchmark)
+
+    p = sub.add_parser('run-one', help=argparse.SUPPRESS)  # One configuration, in a fresh process
+    p.add_argument('--size', required=True)
+    p.add_argument('--concurrency', type=lambda s: [int(c) for c in s.split(',')], required=True)
+    p.add_argument('--frames', type=int, required=True)
+    p.add_argument('--repeat', type=int, required=True)
+    p.add_argument('--exercise', required=True)
+    p.add_argument('--corpus')
+    p.add_argument('--out', required=True)
+    p.set_defaults(func=run_configuration)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -501,3 +501,241 @@ EXERCISE_CONFIGS = {
 }
 
 # Add more exercises as needed, following the pattern in exercises.ts
+
+# Form Rules
+# Data for form_validator.py. Each exercise maps to an ordered list of
+# (conditions, message) rules: the message is reported when every condition
+# holds. A condition is (term, op, bound) with op '<', '>', 'between' or
+# 'outside' (both exclusive; bound is then a (low, high) pair). Terms:
+#   ('angle', name, default)        angles.get(name, default)
+#   ('x' | 'y' | 'vis', index)      a landmark coordinate / visibility
+#   ('mean' | 'min' | 'absdiff' | 'diff', term, term)
+#   ('add' | 'mul', term, number)
+# A bound is a number or another term.
+
+def _angle(name, default):
+    return ('angle', name, default)
+
+def _x(index):
+    return ('x', index)
+
+def _y(index):
+    return ('y', index)
+
+def _visible(*indices, threshold=0.6):
+    return [(('vis', i), '>', threshold) for i in indices]
+
+def _absdiff(a, b):
+    return ('absdiff', a, b)
+
+def _mean(a, b):
+    return ('mean', a, b)
+
+TORSO = _angle('torso_inclination', 0)
+LEFT_ELBOW = _angle('left_elbow', 180)
+LEFT_KNEE = _angle('left_knee', 180)
+RIGHT_KNEE = _angle('right_knee', 180)
+LEFT_HIP = _angle('left_hip', 180)
+UPRIGHT_RECOVERY = ([(TORSO, '>', 60)], "Maintain upright posture")
+
+FORM_RULES = {
+    'bicep-curls': [
+        (_visible(13, 11, threshold=0.5) + [(_absdiff(_x(13), _x(11)), '>', 0.28)], "Keep elbows at your sides - don't swing"),
+        ([(LEFT_ELBOW, 'between', (100, 130))], "Curl higher - bring weight to shoulder"),
+    ],
+    'push-ups': [
+        # Hip distance from the shoulder-ankle line, signed (+ = sagging)
+        (_visible(11, 23, 27) + [(('diff', _y(23), _mean(_y(11), _y(27))), '>', 0.18)], "Tighten your core - hips are too low"),
+        (_visible(11, 23, 27) + [(('diff', _y(23), _mean(_y(11), _y(27))), '<', -0.18)], "Lower your hips - maintain straight line"),
+        ([(LEFT_ELBOW, 'between', (115, 135))], "Go lower - bend elbows to 90 degrees"),
+    ],
+    'squats': [
+        ([(_mean(LEFT_KNEE, RIGHT_KNEE), 'between', (100, 135))], "Squat deeper - thighs parallel to ground"),
+        (_visible(25, 26, 23, 24) + [(_absdiff(_x(25), _x(26)), '<', ('mul', _absdiff(_x(23), _x(24)), 0.65))], "Push knees out - track over toes"),
+        ([(TORSO, '>', 50)], "Keep chest up - don't lean forward"),
+    ],
+    'plank': [
+        (_visible(11, 23, 27) + [(('diff', _y(23), _mean(_y(11), _y(27))), '>', 0.12)], "Lift your hips - engage your core"),
+        (_visible(11, 23, 27) + [(('diff', _y(23), _mean(_y(11), _y(27))), '<', -0.12)], "Lower your hips slightly"),
+    ],
+    'shoulder-press': [
+        ([(TORSO, '>', 25)], "Keep torso upright - don't arch your back"),
+    ],
+    'lunges': [
+        ([(TORSO, '>', 35)], "Keep chest up - don't lean forward"),
+    ],
+    'jumping-jacks': [
+        ([(_absdiff(_angle('left_shoulder', 0), _angle('right_shoulder', 0)), '>', 40)], "Move arms symmetrically"),
+    ],
+    'dumbbell-rows': [
+        ([(TORSO, '<', 35)], "Bend over more - keep back flat"),
+    ],
+    'mountain-climbers': [
+        ([(_angle('torso_inclination', 90), '<', 50)], "Keep hips down - maintain plank"),
+    ],
+    'burpees': [
+        ([(_angle('left_elbow', 0), '>', 160), (TORSO, 'between', (40, 70))], "Engage core during plank phase"),
+    ],
+    'glute-bridges': [
+        ([(_angle('left_hip', 0), '>', 160)] + _visible(11, 23) + [(_y(23), '>', ('add', _y(11), 0.05))], "Squeeze glutes - lift hips higher"),
+    ],
+    'side-plank': [
+        (_visible(23, 27) + [(_absdiff(_y(23), _y(27)), '<', 0.2)], "Lift hips higher - form straight line"),
+    ],
+    'wall-sit': [
+        ([(LEFT_KNEE, 'outside', (70, 110))], "Adjust - thighs should be parallel"),
+    ],
+    'tricep-dips': [
+        # A hidden right elbow counts as width 0, which never flares
+        ([(LEFT_ELBOW, '<', 75)] + _visible(13, 14) + [(_absdiff(_x(13), _x(14)), '>', ('mul', _absdiff(_x(11), _x(12)), 1.3))], "Keep elbows back - don't flare"),
+    ],
+    'bird-dog': [
+        (_visible(23, 24) + [(_absdiff(_y(23), _y(24)), '>', 0.1)], "Keep hips level - don't rotate"),
+    ],
+    'reverse-lunges': [
+        ([(TORSO, '>', 30)], "Keep torso upright"),
+    ],
+    'pike-pushups': [
+        ([(TORSO, '<', 40)], "Keep hips high - maintain pike"),
+    ],
+    'jump-squats': [
+        ([(LEFT_KNEE, 'between', (100, 160))], "Land softly - bend knees"),
+    ],
+    'box-jumps': [
+        ([(LEFT_KNEE, '>', 150)], "Land with bent knees - absorb impact"),
+    ],
+    'high-knees': [
+        ([(('min', LEFT_KNEE, RIGHT_KNEE), 'between', (100, 160))], "Drive knees higher - to hip level"),
+    ],
+    'bicycle-crunches': [
+        (_visible(11, 12) + [(_absdiff(_x(11), _x(12)), '<', 0.15)], "Twist more - elbow to opposite knee"),
+    ],
+    'superman': [
+        (_visible(11, 23) + [(_absdiff(_y(11), _y(23)), '<', 0.1)], "Lift chest and legs higher"),
+    ],
+    'forward-fold': [
+        ([(TORSO, '<', 70)], "Fold deeper - chest toward thighs"),
+    ],
+    'downward-dog': [
+        ([(LEFT_HIP, 'outside', (60, 110))], "Adjust hips - form inverted V"),
+    ],
+    'quad-stretch': [
+        ([(LEFT_KNEE, '>', 80)], "Pull heel closer to glutes"),
+    ],
+    'kb_swing': [
+        ([(LEFT_HIP, '>', 120), (TORSO, '<', 25)], "Hinge at hips - explosive drive"),
+    ],
+    'pb_pullup_standard': [
+        ([(LEFT_ELBOW, 'between', (50, 90))], "Pull higher - chin over bar"),
+    ],
+    'bb_squat': [
+        ([(LEFT_KNEE, 'between', (110, 140))], "Squat to parallel or below"),
+        ([(TORSO, '>', 45)], "Keep chest up - upright torso"),
+    ],
+    'bench_bulgarian_split_squat': [
+        ([(LEFT_KNEE, '<', 70)], "Don't let knee go too far forward"),
+        ([(TORSO, '>', 35)], "Keep torso upright"),
+    ],
+    'rb_row': [
+        ([(LEFT_ELBOW, '>', 110)], "Pull back further - squeeze shoulder blades"),
+    ],
+    'rb_chest_press': [
+        ([(TORSO, '>', 20)], "Keep chest up and core engaged"),
+    ],
+    'calf-raises': [
+        (_visible(27, 23) + [(_absdiff(_y(27), _y(25)), '<', 0.05)], "Rise higher on toes"),
+    ],
+    'tuck-jumps': [
+        ([(LEFT_KNEE, 'between', (80, 140))], "Tuck knees higher to chest"),
+    ],
+    'plyo-pushups': [
+        (_visible(15, 16) + [(_absdiff(_mean(_y(15), _y(16)), _mean(_y(11), _y(12))), '<', 0.05)], "Explode higher - hands off ground"),
+    ],
+    'cat-cow': [
+        ([(_angle('torso_inclination', 90), 'outside', (70, 130))], "Move through full range - arch and round"),
+    ],
+    'lateral-bounds': [
+        ([(_absdiff(LEFT_KNEE, RIGHT_KNEE), '<', 30)], "Push off harder - land on one leg"),
+    ],
+    'bb_bench_press': [
+        ([(LEFT_ELBOW, 'between', (100, 140))], "Lower bar to chest"),
+        (_visible(11, 12) + [(_absdiff(_y(11), _y(12)), '>', 0.08)], "Keep shoulders level"),
+    ],
+    'cable_lat_pulldown': [
+        ([(LEFT_ELBOW, '>', 110)], "Pull down to upper chest"),
+        ([(TORSO, '>', 25)], "Keep torso upright"),
+    ],
+    'cable_tricep_pushdown': [
+        (_visible(13, 11) + [(_absdiff(_x(13), _x(11)), '>', 0.2)], "Keep elbows at sides"),
+    ],
+    'machine_leg_press': [
+        ([(LEFT_KNEE, '<', 60)], "Don't go too deep - protect back"),
+        ([(LEFT_KNEE, 'between', (110, 150))], "Lower weight further"),
+    ],
+    'smith_squat': [
+        ([(LEFT_KNEE, 'between', (110, 140))], "Squat deeper - thighs parallel"),
+        ([(TORSO, '>', 40)], "Keep chest up"),
+    ],
+    'kb_snatch': [
+        ([(LEFT_ELBOW, '<', 160), (_angle('left_shoulder', 0), '>', 140)], "Lock out elbow overhead"),
+        ([(LEFT_HIP, 'between', (100, 140))], "Full hip extension"),
+    ],
+    'jump-rope': [
+        ([(LEFT_KNEE, '<', 110)], "Jump higher - use ankles"),
+        (_visible(15, 16) + [(_absdiff(_y(15), _y(16)), '>', 0.15)], "Keep wrists closer together"),
+    ],
+    'running-in-place': [
+        ([(('min', LEFT_KNEE, RIGHT_KNEE), '>', 130)], "Lift knees higher"),
+        ([(TORSO, '>', 30)], "Keep torso upright"),
+    ],
+    'childs-pose': [
+        ([(LEFT_HIP, '>', 80)], "Sit back onto heels"),
+        (_visible(11, 15) + [(_absdiff(_y(11), _y(15)), '<', 0.1)], "Extend arms forward more"),
+    ],
+    'shoulder-stretch': [
+        ([(_absdiff(_angle('left_shoulder', 0), _angle('right_shoulder', 0)), '<', 60)], "Pull arm across chest"),
+        ([(TORSO, '>', 25)], "Stand upright"),
+    ],
+    # Recovery / time-based: basic posture plus activity-specific checks
+    'walking': [
+        UPRIGHT_RECOVERY,
+        (_visible(11, 23) + [(_absdiff(_y(11), _y(23)), '<', 0.2)], "Stand tall - extend spine"),
+    ],
+    'foam-rolling': [UPRIGHT_RECOVERY],
+    'deep-breathing': [UPRIGHT_RECOVERY],
+    'gentle-yoga-flow': [
+        UPRIGHT_RECOVERY,
+        ([(LEFT_HIP, '<', 40)], "Gentler movement - protect joints"),
+    ],
+    'light-stretching-circuit': [UPRIGHT_RECOVERY],
+    'easy-cycling': [
+        UPRIGHT_RECOVERY,
+        ([(LEFT_KNEE, 'outside', (50, 170))], "Adjust seat height"),
+    ],
+}
+FORM_RULES['db_shoulder_press'] = FORM_RULES['shoulder-press']
+
+# Minimum Inference Rates
+# Frames per second that must get full pose inference for each exercise while
+# the server is loaded (frame_scheduler.py extrapolates the frames in between).
+# Every rep stage has to be seen a few times for RepCounter to confirm it:
+# holds barely move, a squat stage lasts ~0.5s, a jumping-jack stage ~0.3s.
+HOLD_INFERENCE_FPS = 2
+DEFAULT_INFERENCE_FPS = 6
+FAST_INFERENCE_FPS = 12
+FAST_EXERCISES = (
+    'jumping-jacks', 'mountain-climbers', 'burpees', 'high-knees', 'jump-rope', 'running-in-place',
+    'jump-squats', 'box-jumps', 'plyo-pushups', 'tuck-jumps', 'lateral-bounds', 'bicycle-crunches',
+    'kb_swing', 'kb_snatch',
+)
+
+
+def _min_inference_fps(exercise_id, config):
+    if exercise_id in FAST_EXERCISES:
+        return FAST_INFERENCE_FPS
+    if len(config['stages']) < 2:
+        return HOLD_INFERENCE_FPS  # Holds, flows and untracked activities
+    return DEFAULT_INFERENCE_FPS
+
+
+MIN_INFERENCE_FPS = {ex: _min_inference_fps(ex, cfg) for ex, cfg in EXERCISE_CONFIGS.items()}
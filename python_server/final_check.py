@@ -1,10 +1,18 @@
 # Final Verification Script
 
 import sys
+import time
 sys.path.insert(0, '.')
 
+import cv2
+import numpy as np
+
 from exercise_configs import EXERCISE_CONFIGS
-from rep_counter import rep_counter
+from rep_counter import MIN_STAGE_HOLD_TIME, MIN_FORM_SCORE
+from angle_calculator import get_exercise_angles
+from form_validator import validate_form
+from latency_stats import LatencyStats
+from pose_pipeline import POSE_OPTIONS
 import main
 
 print("=" * 70)
@@ -32,18 +40,18 @@ else:
 # Test 2: MediaPipe Settings
 print("\n⚡ Test 2: MediaPipe Optimization")
 print("-" * 70)
-print(f"Model Complexity: {main.pose.model_complexity}")
-print(f"Min Detection Confidence: {main.pose.min_detection_confidence}")
-print(f"Min Tracking Confidence: {main.pose.min_tracking_confidence}")
+print(f"Model Complexity: {POSE_OPTIONS['model_complexity']}")
+print(f"Min Detection Confidence: {POSE_OPTIONS['min_detection_confidence']}")
+print(f"Min Tracking Confidence: {POSE_OPTIONS['min_tracking_confidence']}")
 
-if main.pose.model_complexity == 0:
+if POSE_OPTIONS['model_complexity'] == 0:
     print("✅ PASS: Using fastest model (40% speed boost)")
 else:
     print("⚠️  WARNING: Not using fastest model")
 
-if 0.3 <= main.pose.min_detection_confidence <= 0.4:
+if 0.3 <= POSE_OPTIONS['min_detection_confidence'] <= 0.4:
     print("✅ PASS: Good balance for all distances")
-elif main.pose.min_detection_confidence > 0.5:
+elif POSE_OPTIONS['min_detection_confidence'] > 0.5:
     print("⚠️  WARNING: May struggle at long distances")
 else:
     print("✅ PASS: Very lenient for long distances")
@@ -51,8 +59,8 @@ else:
 # Test 3: Rep Counter Settings
 print("\n🎯 Test 3: Rep Counter Configuration")
 print("-" * 70)
-print("✅ Debouncing: 100ms (2x faster)")
-print("✅ Form Score: 20% threshold (lenient)")
+print(f"✅ Debouncing: {MIN_STAGE_HOLD_TIME * 1000:.0f}ms stage hold")
+print(f"✅ Form Score: {MIN_FORM_SCORE}% threshold (lenient)")
 print("✅ Stage Detection: 10% threshold (sensitive)")
 
 # Test 4: Critical Exercises
@@ -66,20 +74,10 @@ for ex in critical:
 # Test 5: Form Validation Coverage
 print("\n📋 Test 5: Form Validation Coverage")
 print("-" * 70)
-import form_validator
-import inspect
-source = inspect.getsource(form_validator.validate_form)
-validated = set()
-for line in source.split('\n'):
-    if "exercise_id ==" in line or "exercise_id in" in line:
-        if "'" in line:
-            parts = line.split("'")
-            for i in range(1, len(parts), 2):
-                ex_id = parts[i]
-                if ex_id in EXERCISE_CONFIGS:
-                    validated.add(ex_id)
-
-coverage = (len(validated) / total_exercises) * 100
+from form_validator import form_coverage
+form_report = form_coverage()
+validated = form_report['validated']
+coverage = form_report['coverage']
 print(f"Validated exercises: {len(validated)}/{total_exercises}")
 print(f"Coverage: {coverage:.1f}%")
 if coverage >= 65:
@@ -87,6 +85,48 @@ if coverage >= 65:
 else:
     print("⚠️  WARNING: Consider adding more validations")
 
+# Test 6: Measured Latency
+print("\n⏱️ Test 6: Measured Latency")
+print("-" * 70)
+LATENCY_FRAMES = 30
+LATENCY_SESSION = 'final-check'
+ready = main.startup_report.wait(120)  # Measure a warm server, as /health would route to
+startup = main.startup_report.summary()
+print(f"Startup: ready {startup['ready']} after {startup['ready_after_s']}s | " +
+      ", ".join(f"{name} {ms:.0f}ms" for name, ms in startup['phases_ms'].items()))
+rng = np.random.default_rng(0)
+frame = cv2.imencode('.jpg', rng.integers(0, 255, (480, 640, 3), dtype=np.uint8))[1].tobytes()
+frame_stats = LatencyStats()
+for _ in range(LATENCY_FRAMES):
+    timings = {}
+    started = time.perf_counter()
+    main.process_frame(frame, 'squats', LATENCY_SESSION, timings)
+    timings["total"] = (time.perf_counter() - started) * 1000
+    frame_stats.record('squats', timings)
+frame_latency = frame_stats.snapshot('squats')['squats']
+
+# No person in a synthetic frame, so the post-inference stages run on a fixed pose
+packed = np.column_stack([rng.uniform(0.3, 0.7, (33, 3)), np.ones(33)])
+stage_stats = LatencyStats()
+for _ in range(LATENCY_FRAMES):
+    started = time.perf_counter()
+    angles = get_exercise_angles(packed, 'squats')
+    feedback = validate_form('squats', packed, angles)
+    main.rep_counters.update('squats', angles, not feedback, LATENCY_SESSION)
+    stage_stats.record('squats', {"post": (time.perf_counter() - started) * 1000})
+main.rep_counters.reset('squats', LATENCY_SESSION)
+post_latency = stage_stats.snapshot('squats')['squats']['post']
+
+for stage, summary in frame_latency.items():
+    print(f"{stage:<12} p50 {summary['p50']:7.2f}ms | p95 {summary['p95']:7.2f}ms | p99 {summary['p99']:7.2f}ms")
+print(f"{'post':<12} p50 {post_latency['p50']:7.2f}ms | p95 {post_latency['p95']:7.2f}ms | "
+      f"p99 {post_latency['p99']:7.2f}ms (angles + form + reps)")
+frame_p95 = frame_latency['total']['p95'] + post_latency['p95']
+if frame_p95 <= 100:
+    print(f"✅ PASS: {frame_p95:.1f}ms per frame at p95 (640x480)")
+else:
+    print(f"⚠️  WARNING: {frame_p95:.1f}ms per frame at p95 (640x480)")
+
 # Final Summary
 print("\n" + "=" * 70)
 print("FINAL DEPLOYMENT CHECKLIST")
@@ -94,9 +134,11 @@ print("=" * 70)
 
 checks = [
     ("All exercises have unique stages", len(broken_stages) == 0),
-    ("MediaPipe optimized for speed", main.pose.model_complexity == 0),
-    ("Confidence set for long distance", 0.3 <= main.pose.min_detection_confidence <= 0.4),
-    ("Rep counter is fast (100ms)", True),
+    ("MediaPipe optimized for speed", POSE_OPTIONS['model_complexity'] == 0),
+    ("Confidence set for long distance", 0.3 <= POSE_OPTIONS['min_detection_confidence'] <= 0.4),
+    (f"Rep counter is fast ({MIN_STAGE_HOLD_TIME * 1000:.0f}ms)", MIN_STAGE_HOLD_TIME <= 0.1),
+    ("Server warmed up and ready", ready),
+    ("Frame latency p95 under 100ms", frame_p95 <= 100),
     ("Form validation coverage > 65%", coverage >= 65),
     ("Critical exercises working", all(ex in EXERCISE_CONFIGS for ex in critical)),
 ]
@@ -117,12 +159,13 @@ print("=" * 70)
 # Performance Summary
 print("\n📊 Performance Metrics:")
 print("-" * 70)
-print("Processing Speed:    40% faster (30-50ms per frame)")
-print("Response Time:       2x faster (100ms debounce)")
+print(f"Processing Speed:    {frame_latency['total']['p50'] + post_latency['p50']:.0f}ms per frame "
+      f"(p50, {frame_p95:.0f}ms p95, 640x480)")
+print(f"Response Time:       {MIN_STAGE_HOLD_TIME * 1000:.0f}ms stage hold")
 print("Detection Range:     2-10 feet")
-print("Rep Accuracy:        95%+")
-print("Form Coverage:       70% (37/53 exercises)")
-print("Lag:                 Eliminated ✅")
+print("Rep Accuracy:        python landmark_trace.py replay <labelled traces>")
+print(f"Form Coverage:       {coverage:.0f}% ({len(validated)}/{total_exercises} exercises)")
+print("Live latency:        GET /metrics/latency (SERVER_TIMING=1 for per-request headers)")
 print("UI:                  Clean (no skeleton) ✅")
 
 print("\n✨ System Ready for Production Deployment! ✨\n")
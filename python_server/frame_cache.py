@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from session_store import SessionStore
+
+# Frame Cache
+# While the trainee is still (rest, holds, setting up) consecutive frames are
+# nearly identical, yet each would be decoded in full and run through
+# MediaPipe. Each frame first gets a cheap perceptual signature: the JPEG is
+# decoded at 1/8 scale in grayscale (about a third of a full decode) and
+# averaged down to a 32x24 thumbnail. If it is within FRAME_CACHE_THRESHOLD of
+# one of the session's recent inferred frames, that frame's pose is reused and
+# only the angles -> form -> reps steps run again, so the rep counter's clock
+# keeps moving. Cached poses expire after FRAME_CACHE_MAX_AGE, so a slow drift
+# never stays on a stale pose for long.
+#
+#   FRAME_CACHE=1                 0 = decode and infer every frame
+#   FRAME_CACHE_THRESHOLD=6       max gray-level change of any thumbnail cell
+#                                 (sensor noise is 1-2; a 4 px move at 480p is ~9)
+#   FRAME_CACHE_SIZE=4            recent inferred frames kept per session
+#   FRAME_CACHE_MAX_AGE=1.0       seconds a cached pose may be reused
+
+FRAME_CACHE = os.environ.get('FRAME_CACHE', '1').lower() in ('1', 'true', 'yes')
+FRAME_CACHE_THRESHOLD = int(os.environ.get('FRAME_CACHE_THRESHOLD', 6))
+FRAME_CACHE_SIZE = int(os.environ.get('FRAME_CACHE_SIZE', 4))
+FRAME_CACHE_MAX_AGE = float(os.environ.get('FRAME_CACHE_MAX_AGE', 1.0))
+SIGNATURE_SIZE = (32, 24)  # Thumbnail width, height
+FRAME_CACHE_IDLE_TIMEOUT = 120  # seconds
+
+
+def frame_signature(buffer):
+    """
+    Mean-centred 32x24 grayscale thumbnail of an encoded frame (int16), or None
+    if it does not decode. Centring makes small exposure shifts free.
+    """
+    try:
+        small = cv2.imdecode(np.frombuffer(buffer, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    except cv2.error:
+        return None
+    if small is None:
+        return None
+    thumb = cv2.resize(small, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+    thumb -= int(thumb.mean())
+    return thumb
+
+
+class CachedPose:
+    __slots__ = ('signature', 'exercise_id', 'packed', 'angles', 'dims', 'inferred_at')
+
+    def __init__(self, signature, exercise_id, packed, angles, dims, inferred_at):
+        self.signature = signature
+        self.exercise_id = exercise_id
+        self.packed = packed  # (33, 4) landmarks, None = no pose in that frame
+        self.angles = angles
+        self.dims = dims
+        self.inferred_at = inferred_at
+
+
+class SessionFrames:
+    """One session's recent inferred frames, newest last."""
+    __slots__ = ('entries', 'lock')
+
+    def __init__(self):
+        self.entries = []
+        self.lock = threading.Lock()
+
+
+class FrameCache:
+    def __init__(self, threshold=FRAME_CACHE_THRESHOLD, size=FRAME_CACHE_SIZE, max_age=FRAME_CACHE_MAX_AGE,
+                 idle_timeout=FRAME_CACHE_IDLE_TIMEOUT, clock=time.monotonic, **store_options):
+        self.threshold = threshold
+        self.size = max(1, size)
+        self.max_age = max_age
+        self.clock = clock
+        self.sessions = SessionStore(lambda session_id: SessionFrames(), idle_timeout=idle_timeout, **store_options)
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+    def match(self, session_id, exercise_id, buffer):
+        """
+        (signature, cached) for an encoded frame. `cached` is the closest recent
+        CachedPose within the threshold, or None: run the pipeline, then
+        store() the result under `signature`.
+        """
+        signature = frame_signature(buffer)
+        best = None
+        if signature is not None:
+            now = self.clock()
+            frames = self.sessions.get(session_id)
+            with frames.lock:
+                best_distance = self.threshold + 1
+                for entry in frames.entries:
+                    if entry.exercise_id != exercise_id or now - entry.inferred_at > self.max_age:
+                        continue
+                    distance = int(np.abs(signature - entry.signature).max())
+                    if distance < best_distance:
+                        best, best_distance = entry, distance
+        with self._lock:
+            self.lookups += 1
+            self.hits += best is not None
+        return signature, best
+
+    def store(self, session_id, signature, exercise_id, result):
+        """Remember an inferred result (before its landmarks are serialized or smoothed further)."""
+        if signature is None:
+            return
+        packed = result["landmarks"]
+        entry = CachedPose(signature, exercise_id, packed.copy() if packed is not None else None,
+                           dict(result["angles"]), result["processed_dims"], self.clock())
+        frames = self.sessions.get(session_id)
+        with frames.lock:
+            frames.entries.append(entry)
+            del frames.entries[:-self.size]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self.sessions),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0,
+                "threshold": self.threshold,
+                "size": self.size,
+                "max_age": self.max_age,
+            }
+
+
+def create_frame_cache():
+    return FrameCache() if FRAME_CACHE else None
@@ -0,0 +1,215 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from session_store import SessionStore
+from server_logging import get_logger
+
+# Frame Preprocessing
+# Phones send full-resolution photos, but the pose models work on 224-256 px
+# inputs. Before inference each frame is cropped to a region of interest around
+# the session's previous landmarks (padded, full frame when tracking is lost)
+# and resized so its longest side is at most PREPROCESS_MAX_SIDE, straight into
+# per-session buffers that are reused frame to frame. Landmarks are mapped back
+# to full-frame normalized coordinates, so nothing downstream changes.
+#
+#   PREPROCESS_MAX_SIDE=480   longest side fed to MediaPipe (0 = no downscaling)
+#   ROI_CROP=1                crop to the tracked person (0 = always full frame)
+#   ROI_PADDING=0.3           padding around the landmark box, fraction of its size
+
+PREPROCESS_MAX_SIDE = int(os.environ.get('PREPROCESS_MAX_SIDE', 480))
+ROI_CROP = os.environ.get('ROI_CROP', '1').lower() in ('1', 'true', 'yes')
+ROI_PADDING = float(os.environ.get('ROI_PADDING', 0.3))
+ROI_MIN_VISIBILITY = 0.5   # Landmarks that shape the ROI
+ROI_MIN_LANDMARKS = 8      # Fewer visible than this = tracking lost, back to full frame
+ROI_MIN_SIZE = 0.25        # Never crop tighter than this fraction of either side
+ROI_REFRESH_AREA = 0.5     # Re-fit the ROI once the padded box is under half of it
+BUFFER_ALIGN = 16          # Output sizes are rounded to this, so buffers get reused
+MAX_BUFFERS = 4            # Per session (orientation changes, ROI sizes)
+PREPROCESS_IDLE_TIMEOUT = 120  # seconds; ROI state is worthless once frames stop
+
+log = get_logger('preprocess')
+
+
+class RoiState:
+    """One session's ROI (normalized x0, y0, x1, y1 or None = full frame) and buffers."""
+    __slots__ = ('roi', 'buffers', 'lock')
+
+    def __init__(self):
+        self.roi = None
+        self.buffers = {}  # (h, w) -> (bgr, rgb)
+        self.lock = threading.Lock()
+
+    def buffer_pair(self, h, w):
+        pair = self.buffers.get((h, w))
+        if pair is None:
+            if len(self.buffers) >= MAX_BUFFERS:
+                self.buffers.clear()
+            pair = (np.empty((h, w, 3), np.uint8), np.empty((h, w, 3), np.uint8))
+            self.buffers[(h, w)] = pair
+        return pair
+
+
+class PreparedFrame:
+    """The model input for one frame plus what is needed to map landmarks back."""
+    __slots__ = ('rgb', 'crop', 'state', 'preprocessor')
+
+    def __init__(self, rgb, crop, state, preprocessor):
+        self.rgb = rgb
+        self.crop = crop  # Normalized (x0, y0, x1, y1) of the full frame, None = full frame
+        self.state = state
+        self.preprocessor = preprocessor
+
+    def restore(self, packed):
+        """Map `packed` (None = no pose found) to full-frame coordinates in place and update the ROI."""
+        if packed is not None and self.crop is not None:
+            uncrop(packed, self.crop)
+        self.preprocessor.track(self.state, packed)
+        return packed
+
+
+def pixel_bounds(crop, w, h):
+    """Pixel slice bounds of a normalized crop, and the crop snapped to them."""
+    x0, y0 = int(crop[0] * w), int(crop[1] * h)
+    x1, y1 = max(x0 + 1, int(np.ceil(crop[2] * w))), max(y0 + 1, int(np.ceil(crop[3] * h)))
+    return (x0, y0, x1, y1), (x0 / w, y0 / h, x1 / w, y1 / h)
+
+
+def uncrop(packed, crop):
+    """Map landmarks normalized to `crop` back to full-frame coordinates, in place."""
+    x0, y0, x1, y1 = crop
+    packed[:, 0] *= x1 - x0
+    packed[:, 0] += x0
+    packed[:, 1] *= y1 - y0
+    packed[:, 1] += y0
+    packed[:, 2] *= x1 - x0  # z is on the same scale as x
+    return packed
+
+
+def padded_box(packed):
+    """(box, padded) normalized bounds of the visible landmarks, (None, None) when too few are visible."""
+    visible = packed[packed[:, 3] >= ROI_MIN_VISIBILITY]
+    if len(visible) < ROI_MIN_LANDMARKS:
+        return None, None
+    x0, y0 = visible[:, 0].min(), visible[:, 1].min()
+    x1, y1 = visible[:, 0].max(), visible[:, 1].max()
+    pad_x = max((x1 - x0) * ROI_PADDING, (ROI_MIN_SIZE - (x1 - x0)) / 2, 0)
+    pad_y = max((y1 - y0) * ROI_PADDING, (ROI_MIN_SIZE - (y1 - y0)) / 2, 0)
+    box = (float(x0), float(y0), float(x1), float(y1))
+    padded = (max(0.0, float(x0 - pad_x)), max(0.0, float(y0 - pad_y)),
+              min(1.0, float(x1 + pad_x)), min(1.0, float(y1 + pad_y)))
+    return box, padded
+
+
+def _area(box):
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+
+def _contains(outer, inner):
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and outer[2] >= inner[2] and outer[3] >= inner[3]
+
+
+def next_roi(roi, box, padded):
+    """The ROI for the next frame given this frame's landmark box (from padded_box)."""
+    if roi is None or not _contains(roi, box) or _area(padded) < _area(roi) * ROI_REFRESH_AREA:
+        return padded
+    return roi  # Moving a still-fitting ROI would only shift the tracker's input
+
+
+class FramePreprocessor:
+    def __init__(self, max_side=PREPROCESS_MAX_SIDE, roi_crop=ROI_CROP, idle_timeout=PREPROCESS_IDLE_TIMEOUT, **store_options):
+        self.max_side = max_side
+        self.roi_crop = roi_crop
+        self.sessions = SessionStore(lambda session_id: RoiState(), idle_timeout=idle_timeout, **store_options)
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.roi_frames = 0
+        self.lost = 0
+        self.pixels_in = 0
+        self.pixels_out = 0
+
+    @contextmanager
+    def frame(self, session_id, img, is_rgb=False):
+        """
+        `with preprocessor.frame(session_id, img) as prepared:` run the model on
+        prepared.rgb, then prepared.restore(packed). The session's buffers stay
+        locked until the block ends. is_rgb=True: `img` is already RGB.
+        """
+        state = self.sessions.get(session_id)
+        with state.lock:
+            yield self._prepare(state, img, is_rgb)
+
+    def _prepare(self, state, img, is_rgb=False):
+        h, w = img.shape[:2]
+        crop = state.roi if self.roi_crop else None
+        if crop is not None:
+            (x0, y0, x1, y1), crop = pixel_bounds(crop, w, h)  # Exact pixel bounds for the mapping
+            source = img[y0:y1, x0:x1]  # View, no copy
+        else:
+            source = img
+
+        src_h, src_w = source.shape[:2]
+        scale = min(1.0, self.max_side / max(src_h, src_w)) if self.max_side else 1.0
+        if scale < 1.0:
+            out_w = max(BUFFER_ALIGN, int(round(src_w * scale / BUFFER_ALIGN)) * BUFFER_ALIGN)
+            out_h = max(BUFFER_ALIGN, int(round(src_h * scale / BUFFER_ALIGN)) * BUFFER_ALIGN)
+            bgr, rgb = state.buffer_pair(out_h, out_w)
+            # Bilinear: 10x cheaper than INTER_AREA at non-integer ratios, and the
+            # model samples its own input bilinearly anyway
+            if is_rgb:
+                cv2.resize(source, (out_w, out_h), dst=rgb, interpolation=cv2.INTER_LINEAR)
+            else:
+                cv2.resize(source, (out_w, out_h), dst=bgr, interpolation=cv2.INTER_LINEAR)
+                cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=rgb)
+        else:
+            out_h, out_w = src_h, src_w
+            _, rgb = state.buffer_pair(out_h, out_w)
+            if is_rgb:
+                np.copyto(rgb, source)
+            else:
+                cv2.cvtColor(source, cv2.COLOR_BGR2RGB, dst=rgb)
+
+        with self._lock:
+            self.frames += 1
+            self.roi_frames += crop is not None
+            self.pixels_in += h * w
+            self.pixels_out += out_h * out_w
+        return PreparedFrame(rgb, crop, state, self)
+
+    def track(self, state, packed):
+        """Update a session's ROI from full-frame landmarks (None = nothing found)."""
+        if not self.roi_crop:
+            return
+        box, padded = padded_box(packed) if packed is not None else (None, None)
+        if box is None:
+            if state.roi is not None:
+                with self._lock:
+                    self.lost += 1
+            state.roi = None  # Tracking lost: next frame searches the full frame
+        else:
+            state.roi = next_roi(state.roi, box, padded)
+
+    def stats(self):
+        with self._lock:
+            pixels_in, pixels_out = self.pixels_in, self.pixels_out
+            return {
+                "sessions": len(self.sessions),
+                "max_side": self.max_side,
+                "roi_crop": self.roi_crop,
+                "frames": self.frames,
+                "roi_frames": self.roi_frames,
+                "roi_lost": self.lost,
+                "megapixels_in": round(pixels_in / 1e6, 1),
+                "megapixels_processed": round(pixels_out / 1e6, 1),
+                "pixels_saved": round(1 - pixels_out / pixels_in, 3) if pixels_in else 0,
+            }
+
+
+def create_preprocessor():
+    """The server's preprocessor, or None when both downscaling and ROI cropping are off."""
+    if not PREPROCESS_MAX_SIDE and not ROI_CROP:
+        return None
+    return FramePreprocessor()
@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from angle_calculator import get_exercise_angles
+from exercise_configs import MIN_INFERENCE_FPS, DEFAULT_INFERENCE_FPS
+from session_store import SessionStore
+
+# Frame Scheduler
+# Under load not every frame needs MediaPipe. Per session, the scheduler
+# decides before decoding whether a frame gets full inference or is answered
+# by extrapolating the last two inferred poses. The inference interval grows
+# with load (nothing is skipped below FRAME_SKIP_LOAD) but never drops below
+# the exercise's MIN_INFERENCE_FPS (exercise_configs.py), nor below what the
+# measured joint speed needs. Rep counting only ever sees inferred frames, so
+# RepCounter.update keeps its accuracy; extrapolated frames report the last
+# rep state with moved landmarks and recomputed angles.
+#
+# With admission control on (the default) load is its queueing pressure:
+# the wait of the frames queued at the gate as a share of the latency budget
+# (admission.py). The gate keeps inferences running at once down to its
+# slots, so counting them would rarely get past the threshold.
+#
+#   FRAME_SKIP=1              0 = infer every frame
+#   FRAME_SKIP_LOAD=0.5       load (0..1) above which frames may be skipped
+#   FRAME_SKIP_CAPACITY=4     in-process inferences running at once = full load
+#                             (without admission control or inference pool)
+
+FRAME_SKIP = os.environ.get('FRAME_SKIP', '1').lower() in ('1', 'true', 'yes')
+FRAME_SKIP_LOAD = float(os.environ.get('FRAME_SKIP_LOAD', 0.5))
+FRAME_SKIP_CAPACITY = int(os.environ.get('FRAME_SKIP_CAPACITY', 4))
+MAX_STEP = 0.05                # Normalized distance a joint may travel between inferences
+MAX_EXTRAPOLATION = 0.2        # seconds; beyond this the pose is held, not projected further
+MOTION_MIN_VISIBILITY = 0.5    # Joints that count towards the speed estimate
+SCHEDULER_IDLE_TIMEOUT = 120   # seconds
+
+
+class PoseHistory:
+    """The last inferred frames of one session."""
+    __slots__ = ('exercise_id', 'inferred_at', 'packed', 'velocity', 'speed', 'summary', 'lock')
+
+    def __init__(self):
+        self.exercise_id = None
+        self.inferred_at = None
+        self.packed = None    # Last inferred landmarks, None = no pose
+        self.velocity = None  # (33, 4) per second (visibility column 0)
+        self.speed = 0.0      # Fastest visible joint, normalized units per second
+        self.summary = None   # Rep state fields of the last inferred result
+        self.lock = threading.Lock()
+
+
+class FrameScheduler:
+    def __init__(self, load_threshold=FRAME_SKIP_LOAD, capacity=FRAME_SKIP_CAPACITY,
+                 idle_timeout=SCHEDULER_IDLE_TIMEOUT, clock=time.monotonic, **store_options):
+        self.load_threshold = load_threshold
+        self.capacity = max(1, capacity)
+        self.clock = clock
+        self.sessions = SessionStore(lambda session_id: PoseHistory(), idle_timeout=idle_timeout, **store_options)
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.inferred = 0
+        self.extrapolated = 0
+
+    def load(self):
+        """In-process load: inferences running now over capacity."""
+        return self.inflight / self.capacity
+
+    @contextmanager
+    def inference(self):
+        """Wrap in-process inference so load() can see it."""
+        with self._lock:
+            self.inflight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.inflight -= 1
+
+    def interval(self, history, exercise_id, load):
+        """Seconds allowed between inferences for this session at this load."""
+        if load <= self.load_threshold:
+            return 0.0
+        required_fps = max(MIN_INFERENCE_FPS.get(exercise_id, DEFAULT_INFERENCE_FPS), history.speed / MAX_STEP)
+        pressure = min(1.0, (load - self.load_threshold) / (1.0 - self.load_threshold))
+        return pressure / required_fps
+
+    def extrapolate(self, session_id, exercise_id, load=None):
+        """
+        A result built from history when this frame can be skipped, else None
+        (run inference, then observe() the result).
+        """
+        load = self.load() if load is None else load
+        if load <= self.load_threshold:
+            return None
+        history = self.sessions.get(session_id)
+        with history.lock:
+            if history.packed is None or history.exercise_id != exercise_id:
+                return None  # Nothing to extrapolate from: no pose, or a new exercise
+            elapsed = self.clock() - history.inferred_at
+            if elapsed >= self.interval(history, exercise_id, load):
+                return None
+            packed = history.packed
+            if history.velocity is not None:
+                packed = packed + history.velocity * min(elapsed, MAX_EXTRAPOLATION)
+            summary = history.summary
+
+        with self._lock:
+            self.extrapolated += 1
+        result = dict(summary, feedback=list(summary["feedback"]))
+        result["landmarks"] = packed
+        result["angles"] = get_exercise_angles(packed, exercise_id)
+        result["extrapolated"] = True
+        return result
+
+    def observe(self, session_id, exercise_id, result):
+        """Remember an inferred result (call before the response is serialized)."""
+        now = self.clock()
+        packed = result.get("landmarks")
+        history = self.sessions.get(session_id)
+        with history.lock:
+            if packed is not None and history.packed is not None and history.exercise_id == exercise_id:
+                dt = now - history.inferred_at
+                if dt > 0:
+                    velocity = (packed - history.packed) / dt
+                    velocity[:, 3] = 0.0
+                    moving = (packed[:, 3] >= MOTION_MIN_VISIBILITY) & (history.packed[:, 3] >= MOTION_MIN_VISIBILITY)
+                    step = np.hypot(velocity[moving, 0], velocity[moving, 1])
+                    history.velocity = velocity
+                    history.speed = float(step.max()) if len(step) else 0.0
+            else:
+                history.velocity = None
+                history.speed = 0.0
+            history.exercise_id = exercise_id
+            history.inferred_at = now
+            history.packed = packed.copy() if packed is not None else None
+            history.summary = {key: value for key, value in result.items()
+                               if key not in ("landmarks", "angles", "timings")}
+        with self._lock:
+            self.inferred += 1
+
+    def forget(self, session_id):
+        """Drop a session's history (its rep state was reset)."""
+        self.sessions.discard(session_id)
+
+    def stats(self):
+        with self._lock:
+            frames = self.inferred + self.extrapolated
+            return {
+                "sessions": len(self.sessions),
+                "load": round(self.load(), 3),
+                "load_threshold": self.load_threshold,
+                "inferred": self.inferred,
+                "extrapolated": self.extrapolated,
+                "skip_rate": round(self.extrapolated / frames, 3) if frames else 0,
+                "min_inference_fps": MIN_INFERENCE_FPS,
+            }
+
+
+def create_scheduler():
+    return FrameScheduler() if FRAME_SKIP else None
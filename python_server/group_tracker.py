@@ -0,0 +1,240 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from angle_calculator import pack_landmarks
+from frame_preprocess import padded_box, pixel_bounds, uncrop, next_roi
+from pose_pipeline import create_pose, evaluate_landmarks, elapsed_ms
+from session_store import SessionStore, normalize_session_id
+from server_logging import get_logger
+
+# Group Mode (multi-person)
+# MediaPipe Pose follows one body, so a class in front of one camera is
+# handled as a set of person tracks per session. The frame is decoded and
+# converted to RGB once. Each known person has their own tracking Pose graph
+# that only sees a crop around where they were in the last frame, which is
+# what keeps their identity from frame to frame. Every PERSON_DETECT_EVERY
+# frames (and whenever nobody is tracked) a static graph searches the frame
+# for new people, masking everyone already found so each pass finds someone
+# else. Each person gets their own angles, form check and rep state: the rep
+# counter session is "<session>/<person id>". Someone who leaves for longer
+# than PERSON_LOST_FRAMES frames comes back as a new person.
+#
+#   MULTI_PERSON=0              1 = accept multiPerson=1 on /detect
+#   MAX_PEOPLE=6                people tracked per session
+#   PERSON_DETECT_EVERY=10      frames between searches for new people
+#   PERSON_LOST_FRAMES=5        missed frames before a person's track ends
+#   GROUP_SESSIONS=4            cameras (sessions) in group mode at once
+
+MULTI_PERSON = os.environ.get('MULTI_PERSON', '0').lower() in ('1', 'true', 'yes')
+MAX_PEOPLE = int(os.environ.get('MAX_PEOPLE', 6))
+PERSON_DETECT_EVERY = int(os.environ.get('PERSON_DETECT_EVERY', 10))
+PERSON_LOST_FRAMES = int(os.environ.get('PERSON_LOST_FRAMES', 5))
+GROUP_SESSIONS = int(os.environ.get('GROUP_SESSIONS', 4))
+GROUP_IDLE_TIMEOUT = 300    # seconds
+DUPLICATE_IOU = 0.5         # Two tracks overlapping this much follow the same person
+MASK_VALUE = 128            # Gray fill over people already found during a search
+
+log = get_logger('group')
+
+
+def _iou(a, b):
+    w = min(a[2], b[2]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter)
+
+
+class PersonTrack:
+    __slots__ = ('id', 'pose', 'roi', 'box', 'packed', 'missed')
+
+    def __init__(self, person_id, pose, box, roi, packed):
+        self.id = person_id
+        self.pose = pose      # Tracking graph that only ever sees this person's crop
+        self.roi = roi        # Normalized crop for the next frame
+        self.box = box        # Landmark bounds in the last frame this person was seen
+        self.packed = packed  # Full-frame landmarks of this frame, None = not seen
+        self.missed = 0
+
+
+class GroupState:
+    """One camera's people."""
+    __slots__ = ('session_id', 'tracks', 'next_id', 'frames', 'detector', 'lock')
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.tracks = []
+        self.next_id = 1
+        self.frames = 0
+        self.detector = None  # Static graph for searches, created on first use
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            for track in self.tracks:
+                track.pose.close()
+            self.tracks = []
+            if self.detector is not None:
+                self.detector.close()
+                self.detector = None
+
+
+def person_session(session_id, person_id):
+    return f"{normalize_session_id(session_id)}/{person_id}"
+
+
+class GroupTracker:
+    def __init__(self, max_people=MAX_PEOPLE, detect_every=PERSON_DETECT_EVERY, lost_frames=PERSON_LOST_FRAMES,
+                 max_sessions=GROUP_SESSIONS, idle_timeout=GROUP_IDLE_TIMEOUT, factory=create_pose):
+        self.max_people = max_people
+        self.detect_every = max(1, detect_every)
+        self.lost_frames = lost_frames
+        self._factory = factory
+        self.sessions = SessionStore(GroupState, max_sessions=max_sessions,
+                                     idle_timeout=idle_timeout, on_evict=lambda session_id, state: state.close())
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.searches = 0
+        self.started = 0
+        self.ended = 0
+
+    def analyze(self, img, exercise_id, session_id, counters, smoother=None):
+        """
+        Run every person in a decoded BGR frame through pose -> angles -> form
+        -> reps. Returns {"people": [per-person results], "processed_dims",
+        "timings"}; people are ordered by id and only those seen in this frame
+        are listed.
+        """
+        started = time.perf_counter()
+        h, w = img.shape[:2]
+        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)  # Shared by every crop and search
+        timings = {"preprocess": elapsed_ms(started), "inference": 0.0}
+
+        state = self.sessions.get(session_id)
+        with state.lock:
+            state.frames += 1
+            mark = time.perf_counter()
+            ended = self._follow(state, rgb, w, h)
+            searched = len(state.tracks) < self.max_people and (
+                not state.tracks or (state.frames - 1) % self.detect_every == 0)
+            if searched:
+                self._search(state, rgb)
+            timings["inference"] = elapsed_ms(mark)
+            seen = [track for track in state.tracks if track.packed is not None]
+            unseen = [track.id for track in state.tracks if track.packed is None] + ended
+
+        people = []
+        for track in seen:
+            sid = person_session(session_id, track.id)
+            if smoother is not None:
+                smoother.smooth(sid, track.packed)
+            person = {
+                "person": track.id,
+                "box": [round(v, 4) for v in track.box],
+                "landmarks": None,
+                "angles": {},
+                "confidence": 0,
+                "stage": None,
+                "rep_count": 0,
+                "feedback": [],
+                "timings": {},
+            }
+            evaluate_landmarks(person, track.packed, None, exercise_id, sid, counters)
+            for stage, ms in person.pop("timings").items():
+                timings[stage] = timings.get(stage, 0.0) + ms
+            people.append(person)
+        if smoother is not None:
+            for person_id in unseen:
+                smoother.smooth(person_session(session_id, person_id), None)
+
+        with self._lock:
+            self.frames += 1
+            self.searches += searched
+            self.ended += len(ended)
+        return {"people": people, "processed_dims": {"w": w, "h": h}, "timings": timings}
+
+    def _follow(self, state, rgb, w, h):
+        """Run each person's graph on their crop; returns the ids of tracks that ended."""
+        for track in state.tracks:
+            (x0, y0, x1, y1), crop = pixel_bounds(track.roi, w, h)
+            results = track.pose.process(np.ascontiguousarray(rgb[y0:y1, x0:x1]))
+            track.packed = None
+            if results.pose_landmarks:
+                packed = uncrop(pack_landmarks(results.pose_landmarks), crop)
+                box, padded = padded_box(packed)
+                if box is not None:
+                    track.packed, track.box, track.roi = packed, box, next_roi(track.roi, box, padded)
+            track.missed = 0 if track.packed is not None else track.missed + 1
+
+        ended = []
+        for track in list(state.tracks):
+            duplicate = track.packed is not None and any(
+                other.id < track.id and other.packed is not None and _iou(other.box, track.box) > DUPLICATE_IOU
+                for other in state.tracks)
+            if duplicate or track.missed > self.lost_frames:
+                state.tracks.remove(track)
+                track.pose.close()
+                ended.append(track.id)
+                log.info("👋 Person %d left the group", track.id, extra={"session": state.session_id})
+        return ended
+
+    def _search(self, state, rgb):
+        """Find people not tracked yet, one static pass each, masking everyone already found."""
+        if state.detector is None:
+            state.detector = self._factory(static_image_mode=True)
+        h, w = rgb.shape[:2]
+        masked = rgb.copy()
+        for track in state.tracks:
+            (x0, y0, x1, y1), _ = pixel_bounds(track.roi, w, h)
+            masked[y0:y1, x0:x1] = MASK_VALUE
+
+        for _ in range(self.max_people - len(state.tracks)):
+            results = state.detector.process(masked)
+            if not results.pose_landmarks:
+                break
+            packed = pack_landmarks(results.pose_landmarks)
+            box, padded = padded_box(packed)
+            if box is None:
+                break  # A partial body at a mask edge; nobody else to find
+            (x0, y0, x1, y1), _ = pixel_bounds(padded, w, h)
+            masked[y0:y1, x0:x1] = MASK_VALUE
+            if any(_iou(track.box, box) > DUPLICATE_IOU for track in state.tracks):
+                continue
+            track = PersonTrack(state.next_id, self._factory(), box, padded, packed)
+            state.next_id += 1
+            state.tracks.append(track)
+            with self._lock:
+                self.started += 1
+            log.info("👤 Person %d joined the group", track.id, extra={"session": state.session_id})
+
+    def reset(self, exercise_id, session_id, counters):
+        """Reset every tracked person's rep count (tracks and ids are kept)."""
+        state = self.sessions.peek(session_id)
+        if state is None:
+            return
+        with state.lock:
+            person_ids = [track.id for track in state.tracks]
+        for person_id in person_ids:
+            counters.reset(exercise_id, person_session(session_id, person_id))
+
+    def stats(self):
+        people = sum(len(state.tracks) for _, state in self.sessions.items())
+        with self._lock:
+            return {
+                **self.sessions.stats(),
+                "people": people,
+                "frames": self.frames,
+                "searches": self.searches,
+                "tracks_started": self.started,
+                "tracks_ended": self.ended,
+                "max_people": self.max_people,
+            }
+
+
+def create_group_tracker():
+    return GroupTracker() if MULTI_PERSON else None
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from latency_stats import Histogram
+from pose_pipeline import evaluate_batch, elapsed_ms
+from server_logging import get_logger
+
+# Micro-batched Inference
+# With many sessions on one server, request threads each ran pose -> angles ->
+# form -> reps on their own, all contending for the CPU at once. With
+# batching on they queue their decoded frames instead and one dispatcher
+# thread takes them in micro-batches: it waits at most
+# INFERENCE_BATCH_WINDOW_MS after the oldest queued frame arrived, or until
+# INFERENCE_BATCH_SIZE frames are queued. MediaPipe Pose has no batched entry
+# point and tracks per session, so each frame still runs on its session's own
+# graph, one after another (the TFLite runtime already spreads a single
+# inference over the cores). Angles and form checks then run once per exercise
+# over the stacked (N, 33, 4) landmarks, reps update in arrival order and each
+# request's Future completes. A bigger window means fuller batches and more
+# added latency; 0 still batches whatever queued while the last batch ran.
+#
+#   INFERENCE_BATCH=0              1 = micro-batch in-process inference
+#   INFERENCE_BATCH_WINDOW_MS=10   max wait for a batch to fill
+#   INFERENCE_BATCH_SIZE=8         max frames per batch
+
+INFERENCE_BATCH = os.environ.get('INFERENCE_BATCH', '0').lower() in ('1', 'true', 'yes')
+INFERENCE_BATCH_WINDOW_MS = float(os.environ.get('INFERENCE_BATCH_WINDOW_MS', 10))
+INFERENCE_BATCH_SIZE = int(os.environ.get('INFERENCE_BATCH_SIZE', 8))
+BATCH_RESULT_TIMEOUT = 10  # seconds
+
+log = get_logger('batching')
+
+
+class PendingFrame:
+    __slots__ = ('future', 'img', 'exercise_id', 'session_id', 'queued_at')
+
+    def __init__(self, img, exercise_id, session_id):
+        self.future = Future()
+        self.img = img
+        self.exercise_id = exercise_id
+        self.session_id = session_id
+        self.queued_at = time.perf_counter()
+
+
+class InferenceBatcher:
+    """
+    `detect(img, exercise_id, session_id)` runs inference on one frame and
+    returns (result, packed landmarks or None), as pose_pipeline.detect_pose;
+    `counters` is the RepCounterStore the batch's reps are counted in.
+    """
+
+    def __init__(self, detect, counters, window_ms=INFERENCE_BATCH_WINDOW_MS, max_size=INFERENCE_BATCH_SIZE):
+        self._detect = detect
+        self._counters = counters
+        self.window = max(0.0, window_ms) / 1000
+        self.max_size = max(1, max_size)
+        self._queue = deque()
+        self._ready = threading.Condition()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.frames = 0
+        self.errors = 0
+        self._sizes = [0] * (self.max_size + 1)  # Batch size -> batches
+        self._wait = Histogram()  # Queued -> batch started, ms
+        threading.Thread(target=self._run, name='inference-batcher', daemon=True).start()
+        log.info("📦 Micro-batching inference: up to %d frames within %.0f ms", self.max_size, window_ms)
+
+    def submit(self, img, exercise_id, session_id):
+        """Queue a decoded BGR frame; the Future resolves to its full result dict."""
+        frame = PendingFrame(img, exercise_id, session_id)
+        with self._ready:
+            self._queue.append(frame)
+            if len(self._queue) == 1 or len(self._queue) >= self.max_size:
+                self._ready.notify()  # Starts the window / closes a full batch
+        return frame.future
+
+    def analyze(self, img, exercise_id, session_id):
+        """Blocking helper: submit and wait for the result."""
+        return self.submit(img, exercise_id, session_id).result(timeout=BATCH_RESULT_TIMEOUT)
+
+    def _next_batch(self):
+        with self._ready:
+            while not self._queue:
+                self._ready.wait()
+            deadline = self._queue[0].queued_at + self.window
+            while len(self._queue) < self.max_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._ready.wait(remaining)
+            return [self._queue.popleft() for _ in range(min(self.max_size, len(self._queue)))]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._process(batch)
+            except Exception as e:
+                log.exception("Error in inference batch: %s", e)
+                for frame in batch:
+                    if not frame.future.done():
+                        frame.future.set_exception(e)
+
+    def _process(self, batch):
+        started = time.perf_counter()
+        detected = []  # (frame, result, packed)
+        errors = 0
+        for frame in batch:
+            try:
+                result, packed = self._detect(frame.img, frame.exercise_id, frame.session_id)
+            except Exception as e:
+                log.exception("Error in inference: %s", e, extra={"session": frame.session_id})
+                frame.future.set_exception(e)
+                errors += 1
+                continue
+            frame.img = None  # The batch can outlive the request's buffers; drop ours early
+            result["timings"]["batch_wait"] = (started - frame.queued_at) * 1000
+            detected.append((frame, result, packed))
+
+        evaluate_batch([(result, packed, frame.exercise_id, frame.session_id)
+                        for frame, result, packed in detected if packed is not None], self._counters)
+        for frame, result, _ in detected:
+            frame.future.set_result(result)
+
+        with self._lock:
+            self.batches += 1
+            self.frames += len(batch)
+            self.errors += errors
+            self._sizes[len(batch)] += 1
+            for frame in batch:
+                self._wait.record((started - frame.queued_at) * 1000)
+        log.debug("📦 Batch of %d frames in %.1f ms", len(batch), elapsed_ms(started))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "frames": self.frames,
+                "errors": self.errors,
+                "mean_batch_size": round(self.frames / self.batches, 2) if self.batches else 0,
+                "batch_sizes": {size: count for size, count in enumerate(self._sizes) if count},
+                "wait_ms": self._wait.summary(),
+                "queue_depth": len(self._queue),
+                "window_ms": self.window * 1000,
+                "max_batch_size": self.max_size,
+            }
+
+
+def create_batcher(detect, counters):
+    return InferenceBatcher(detect, counters) if INFERENCE_BATCH else None
@@ -0,0 +1,263 @@
+import multiprocessing as mp_proc
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future
+
+from server_logging import get_logger
+
+# Inference Pool
+# N worker processes, each owning its own MediaPipe Pose graph and rep
+# counters. Frames are routed by session id, so one trainee always lands on
+# the same worker: Pose tracking mode (static_image_mode=False) needs a sticky
+# stream and the rep state lives next to it.
+
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 0))  # 0 = in-process (no pool)
+MAX_QUEUE_PER_WORKER = int(os.environ.get('MAX_QUEUE_PER_WORKER', 8))
+RESULT_TIMEOUT = 10  # seconds
+UTILIZATION_WINDOW = 10  # seconds
+WORKER_STATS_EVERY = 50  # tasks between tracker-stat reports from a worker
+
+log = get_logger('pool')
+
+
+class PoolSaturated(Exception):
+    """Raised when the worker owning a session already has a full queue."""
+
+
+def _worker_main(index, tasks, results):
+    """Worker process loop: decode + full pipeline for the sessions routed here."""
+    from startup import StartupReport, WARMUP
+    report = StartupReport(started=time.perf_counter())
+    from pose_pipeline import create_pose, analyze_encoded, analyze_frame, warm_pose
+    from rep_counter import RepCounterStore
+    from tracker_pool import TrackerPool, POSE_TRACKERS
+    from landmark_trace import TraceRecorder, TRACE_DIR
+    from frame_preprocess import create_preprocessor
+    from landmark_filter import create_smoother
+    from frame_cache import create_frame_cache
+    from group_tracker import create_group_tracker
+    report.lap('imports')
+
+    trackers = TrackerPool() if POSE_TRACKERS > 0 else None
+    pose = create_pose() if trackers is None else None  # With trackers: built when the pool first fills up
+    counters = RepCounterStore(state_file=f"reps_state.worker{index}.json")
+    recorder = TraceRecorder() if TRACE_DIR else None
+    preprocessor = create_preprocessor()
+    smoother = create_smoother()
+    frame_cache = create_frame_cache()
+    group_tracker = create_group_tracker()
+
+    def analyze(img, exercise_id, session_id):
+        nonlocal pose
+        tracker = trackers.get(session_id) if trackers is not None else None
+        if tracker is None:
+            if pose is None:
+                pose = create_pose()
+            return analyze_frame(pose, img, exercise_id, session_id, counters, recorder=recorder,
+                                 preprocessor=preprocessor, smoother=smoother)
+        result = analyze_frame(tracker.pose, img, exercise_id, session_id, counters, recorder=recorder,
+                               preprocessor=preprocessor, smoother=smoother)
+        trackers.record(tracker, result["landmarks"] is not None)
+        return result
+
+    def analyze_group(img, exercise_id, session_id):
+        return group_tracker.analyze(img, exercise_id, session_id, counters, smoother)
+
+    report.lap('init')
+    if WARMUP:
+        if trackers is None:
+            warm_pose(pose)
+        else:
+            trackers.prefill()
+        report.lap('warm-up')
+    results.put(('ready', index, report.summary()['phases_ms'], 0.0, None))
+
+    handled = 0
+    while True:
+        task = tasks.get()
+        if task is None:
+            counters.persistence.close()  # atexit does not run in multiprocessing children
+            if recorder:
+                recorder.close()
+            break
+        task_id, kind, exercise_id, session_id, payload = task
+        started = time.perf_counter()
+        try:
+            if kind == 'reset':
+                counters.reset(exercise_id, session_id)
+                if group_tracker:
+                    group_tracker.reset(exercise_id, session_id, counters)
+                result = {"status": "reset"}
+            elif kind == 'group':
+                if group_tracker is None:
+                    raise RuntimeError("Multi-person mode is disabled (MULTI_PERSON=0)")
+                result = analyze_encoded(payload, exercise_id, session_id, counters, analyze_group)
+            else:
+                result = analyze_encoded(payload, exercise_id, session_id, counters, analyze, frame_cache)
+                if result is None:
+                    result = {"error": "Invalid image data"}
+        except Exception as e:
+            log.exception("Error in worker %d: %s", index, e)
+            result = {"error": str(e)}
+        handled += 1
+        report = None
+        if handled % WORKER_STATS_EVERY == 0:
+            report = {
+                "trackers": trackers.stats() if trackers else None,
+                "preprocess": preprocessor.stats() if preprocessor else None,
+                "smoothing": smoother.stats() if smoother else None,
+                "frame_cache": frame_cache.stats() if frame_cache else None,
+                "group": group_tracker.stats() if group_tracker else None,
+            }
+        results.put((task_id, index, result, time.perf_counter() - started, report))
+
+
+class InferencePool:
+    def __init__(self, num_workers=INFERENCE_WORKERS, max_queue=MAX_QUEUE_PER_WORKER):
+        self.num_workers = num_workers
+        self.max_queue = max_queue
+        self._ctx = mp_proc.get_context('spawn')  # Never fork a live MediaPipe graph
+        self._results = self._ctx.Queue()
+        self._lock = threading.Lock()
+        self._futures = {}  # task_id -> (worker index, Future, submitted_at)
+        self._next_task_id = 0
+        self._workers = [None] * num_workers
+        self._queues = [None] * num_workers
+        self._pending = [0] * num_workers
+        self._completed = [0] * num_workers
+        self._busy = [deque() for _ in range(num_workers)]  # (finished_at, busy_seconds)
+        self._queue_wait = deque(maxlen=256)
+        self._reports = [{}] * num_workers  # Last tracker/preprocess stats from each worker
+        self._ready = [False] * num_workers
+        self._ready_changed = threading.Condition(self._lock)
+        self.startup = [None] * num_workers  # Each worker's startup phases (ms)
+        self._started_at = time.monotonic()
+
+        for index in range(num_workers):
+            self._spawn(index)
+        threading.Thread(target=self._collect_results, daemon=True).start()
+        log.info("🧵 Inference pool started with %d worker process(es)", num_workers)
+
+    def _spawn(self, index):
+        self._ready[index] = False
+        self._queues[index] = self._ctx.Queue()
+        proc = self._ctx.Process(target=_worker_main, args=(index, self._queues[index], self._results), daemon=True)
+        proc.start()
+        self._workers[index] = proc
+
+    def worker_for(self, session_id):
+        """Stable session -> worker mapping (same on every front-end process)."""
+        key = (session_id or 'default').encode('utf-8')
+        return zlib.crc32(key) % self.num_workers
+
+    def submit(self, encoded_frame, exercise_id, session_id, group=False):
+        return self._submit('group' if group else 'frame', exercise_id, session_id, bytes(encoded_frame))
+
+    def reset(self, exercise_id, session_id):
+        return self._submit('reset', exercise_id, session_id, None, force=True)
+
+    def process(self, encoded_frame, exercise_id, session_id, group=False):
+        """Blocking helper: submit and wait for the result dict (group=True: multi-person mode)."""
+        return self.submit(encoded_frame, exercise_id, session_id, group).result(timeout=RESULT_TIMEOUT)
+
+    def ready(self):
+        """Have all workers finished starting up (and warming up)?"""
+        with self._lock:
+            return all(self._ready)
+
+    def wait_ready(self, timeout=None):
+        with self._lock:
+            return self._ready_changed.wait_for(lambda: all(self._ready), timeout)
+
+    def load(self, session_id):
+        """Queue fill (0..1) of the worker that owns this session."""
+        return self._pending[self.worker_for(session_id)] / self.max_queue
+
+    def _submit(self, kind, exercise_id, session_id, payload, force=False):
+        index = self.worker_for(session_id)
+        future = Future()
+        with self._lock:
+            if not self._workers[index].is_alive():
+                log.warning("⚠️ Inference worker %d died - restarting", index)
+                self._fail_pending(index)
+                self._spawn(index)
+            if not force and self._pending[index] >= self.max_queue:
+                raise PoolSaturated(f"Worker {index} queue full")
+            task_id = self._next_task_id
+            self._next_task_id += 1
+            self._futures[task_id] = (index, future, time.monotonic())
+            self._pending[index] += 1
+        self._queues[index].put((task_id, kind, exercise_id, session_id, payload))
+        return future
+
+    def _fail_pending(self, index):
+        for task_id, (worker, future, _) in list(self._futures.items()):
+            if worker == index:
+                del self._futures[task_id]
+                future.set_exception(RuntimeError(f"Inference worker {index} died"))
+        self._pending[index] = 0
+
+    def _collect_results(self):
+        while True:
+            task_id, index, result, busy, report = self._results.get()
+            if task_id == 'ready':
+                with self._lock:
+                    self._ready[index] = True
+                    self.startup[index] = result
+                    self._ready_changed.notify_all()
+                log.info("✅ Inference worker %d ready in %.2fs", index, sum(result.values()) / 1000)
+                continue
+            now = time.monotonic()
+            with self._lock:
+                entry = self._futures.pop(task_id, None)
+                self._pending[index] = max(0, self._pending[index] - 1)
+                self._completed[index] += 1
+                self._busy[index].append((now, busy))
+                if report:
+                    self._reports[index] = report
+                if entry:
+                    wait = now - entry[2] - busy
+                    self._queue_wait.append(wait)
+            if entry:
+                if "timings" in result:
+                    result["timings"]["queue"] = wait * 1000  # Queue + IPC, outside the worker
+                entry[1].set_result(result)
+
+    def stats(self):
+        now = time.monotonic()
+        window = min(UTILIZATION_WINDOW, max(now - self._started_at, 1e-6))
+        with self._lock:
+            workers = []
+            for index in range(self.num_workers):
+                busy = self._busy[index]
+                while busy and now - busy[0][0] > UTILIZATION_WINDOW:
+                    busy.popleft()
+                workers.append({
+                    "worker": index,
+                    "alive": self._workers[index].is_alive(),
+                    "ready": self._ready[index],
+                    "queue_depth": self._pending[index],
+                    "completed": self._completed[index],
+                    "utilization": round(min(1.0, sum(b for _, b in busy) / window), 3),
+                    "trackers": self._reports[index].get("trackers"),
+                    "preprocess": self._reports[index].get("preprocess"),
+                    "smoothing": self._reports[index].get("smoothing"),
+                    "frame_cache": self._reports[index].get("frame_cache"),
+                    "group": self._reports[index].get("group"),
+                })
+            waits = sorted(self._queue_wait)
+        return {
+            "workers": workers,
+            "queue_depth": sum(w["queue_depth"] for w in workers),
+            "max_queue_per_worker": self.max_queue,
+            "avg_queue_wait_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else 0,
+        }
+
+    def shutdown(self):
+        for q in self._queues:
+            q.put(None)
+        for proc in self._workers:
+            proc.join(timeout=5)
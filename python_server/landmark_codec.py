@@ -0,0 +1,147 @@
+import base64
+import json
+from functools import lru_cache
+
+import numpy as np
+
+try:
+    import msgpack  # Optional: binary responses for clients that ask for them
+except ImportError:
+    msgpack = None
+
+# Landmark Serialization
+# The pipeline hands over the packed (33, 4) landmark array; the response
+# format is chosen per request, so the server never builds 33 dicts for a
+# client that does not read them.
+#
+#   landmarks=full      legacy list of {"x", "y", "z", "score", "name"} (default)
+#   landmarks=compact   "lm": {"dtype", "scale", "joints", "data"}, data is the
+#                       joints x (x, y, z, score) array, row-major little-endian,
+#                       base64 in JSON (raw bytes in MessagePack)
+#   landmarks=none      no landmarks at all (counting-only clients)
+#   lmFormat=i16|f32    compact dtype: int16 = round(value * 10000), or float32
+#   joints=11,12,left_knee,...   subset, by MediaPipe index or name
+#
+# Options come from the query string, the JSON body or the /stream config
+# message. Send `Accept: application/x-msgpack` for a MessagePack body (only
+# when msgpack is installed; otherwise the response stays JSON).
+
+NUM_LANDMARKS = 33
+I16_SCALE = 10000  # 1e-4 resolution, +-3.27 range (normalized coords stay well inside)
+MSGPACK_TYPES = ('application/x-msgpack', 'application/msgpack')
+
+# MediaPipe Pose landmark order (accepted in `joints=`)
+POSE_LANDMARKS = (
+    'nose', 'left_eye_inner', 'left_eye', 'left_eye_outer', 'right_eye_inner', 'right_eye',
+    'right_eye_outer', 'left_ear', 'right_ear', 'mouth_left', 'mouth_right',
+    'left_shoulder', 'right_shoulder', 'left_elbow', 'right_elbow', 'left_wrist', 'right_wrist',
+    'left_pinky', 'right_pinky', 'left_index', 'right_index', 'left_thumb', 'right_thumb',
+    'left_hip', 'right_hip', 'left_knee', 'right_knee', 'left_ankle', 'right_ankle',
+    'left_heel', 'right_heel', 'left_foot_index', 'right_foot_index',
+)
+JOINT_INDEX = {name: index for index, name in enumerate(POSE_LANDMARKS)}
+
+# Names the legacy response has always used
+LANDMARK_NAMES = {
+    0: "nose", 18: "right_pinky", 19: "left_index", 20: "right_index",
+    15: "left_wrist", 16: "right_wrist", 11: "left_shoulder", 12: "right_shoulder",
+    23: "left_hip", 24: "right_hip", 25: "left_knee", 26: "right_knee",
+    27: "left_ankle", 28: "right_ankle"
+    # Simplified list as reference doesn't define all
+}
+LEGACY_NAMES = tuple(LANDMARK_NAMES.get(idx, f"point_{idx}") for idx in range(NUM_LANDMARKS))
+
+MODES = ('full', 'compact', 'none')
+VIEW_OPTIONS = ('landmarks', 'lmFormat', 'joints')  # Request keys
+DTYPES = {'i16': '<i2', 'f32': '<f4'}
+
+
+class LandmarkView:
+    """How one client wants landmarks serialized (parsed once per distinct option set)."""
+    __slots__ = ('mode', 'dtype', 'joints', 'names', 'rows')
+
+    def __init__(self, mode='full', dtype='i16', joints=None):
+        self.mode = mode
+        self.dtype = dtype
+        self.joints = joints  # Tuple of landmark indices, None = all 33
+        self.names = LEGACY_NAMES if joints is None else tuple(LEGACY_NAMES[j] for j in joints)
+        self.rows = None if joints is None else np.array(joints, dtype=np.intp)
+
+    def landmark_dicts(self, packed):
+        rows = packed.tolist() if self.rows is None else packed[self.rows].tolist()
+        return [{"x": x, "y": y, "z": z, "score": score, "name": name}
+                for (x, y, z, score), name in zip(rows, self.names)]
+
+    def compact(self, packed, binary=False):
+        values = packed if self.rows is None else packed[self.rows]
+        if self.dtype == 'i16':
+            values = np.clip(np.rint(values * I16_SCALE), -32768, 32767)
+        data = values.astype(DTYPES[self.dtype]).tobytes()
+        return {
+            "dtype": self.dtype,
+            "scale": I16_SCALE if self.dtype == 'i16' else 1,
+            "joints": list(self.joints) if self.joints is not None else None,
+            "data": data if binary else base64.b64encode(data).decode('ascii'),
+        }
+
+    def apply(self, result, binary=False):
+        """Replace the pipeline's packed array in `result` with this view's representation."""
+        if "people" in result:  # Group mode: one set of landmarks per person
+            for person in result["people"]:
+                self.apply(person, binary)
+            return result
+        packed = result.pop("landmarks", None)
+        if self.mode == 'full':
+            result["landmarks"] = self.landmark_dicts(packed) if packed is not None else []
+        elif self.mode == 'compact' and packed is not None:
+            result["lm"] = self.compact(packed, binary)
+        return result
+
+
+def _parse_joints(spec):
+    joints = []
+    for token in spec.split(','):
+        token = token.strip().lower()
+        if not token:
+            continue
+        index = int(token) if token.isdigit() else JOINT_INDEX.get(token)
+        if index is None or not 0 <= index < NUM_LANDMARKS:
+            raise ValueError(f"Unknown joint: {token!r}")
+        if index not in joints:
+            joints.append(index)
+    return tuple(joints) or None
+
+
+@lru_cache(maxsize=256)
+def landmark_view(mode=None, dtype=None, joints=None):
+    """Parse landmark options (strings as sent by the client). Raises ValueError on bad input."""
+    mode = (mode or 'full').lower()
+    dtype = (dtype or 'i16').lower()
+    if mode not in MODES:
+        raise ValueError(f"Unknown landmarks mode: {mode!r} (expected {', '.join(MODES)})")
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown lmFormat: {dtype!r} (expected {', '.join(DTYPES)})")
+    return LandmarkView(mode, dtype, _parse_joints(joints) if joints else None)
+
+
+DEFAULT_VIEW = landmark_view()
+
+
+def view_from_options(options):
+    """Build a view from a mapping with landmarks / lmFormat / joints keys (query args, JSON body)."""
+    mode, dtype, joints = (options.get(key) for key in VIEW_OPTIONS)
+    if isinstance(joints, (list, tuple)):
+        joints = ','.join(str(j) for j in joints)
+    return landmark_view(*(str(value) if value is not None else None for value in (mode, dtype, joints)))
+
+
+def wants_msgpack(accept):
+    return msgpack is not None and any(t in (accept or '') for t in MSGPACK_TYPES)
+
+
+def encode_json(result):
+    return json.dumps(result, separators=(',', ':'))
+
+
+def encode_msgpack(result):
+    return msgpack.packb(result, use_bin_type=True)
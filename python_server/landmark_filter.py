@@ -0,0 +1,125 @@
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from session_store import SessionStore
+
+# Landmark Smoothing
+# A One-Euro filter per session over the packed landmark array: heavy
+# smoothing while a joint is still (kills jitter that makes stages flicker),
+# little lag while it moves fast. State is one previous value and one
+# derivative per coordinate, updated for all 33 landmarks in a few array ops.
+# It runs on real frame timestamps; MediaPipe's own smoother assumes a fixed
+# 30 fps, which phone uploads never deliver, so it is turned off while this
+# one is on (see pose_pipeline.POSE_OPTIONS).
+#
+#   LANDMARK_SMOOTHING=1        0 = raw landmarks
+#   SMOOTHING_MIN_CUTOFF=1.0    Hz at rest (lower = smoother, more lag)
+#   SMOOTHING_BETA=4            cutoff gained per normalized unit/s of speed
+
+LANDMARK_SMOOTHING = os.environ.get('LANDMARK_SMOOTHING', '1').lower() in ('1', 'true', 'yes')
+SMOOTHING_MIN_CUTOFF = float(os.environ.get('SMOOTHING_MIN_CUTOFF', 1.0))
+SMOOTHING_BETA = float(os.environ.get('SMOOTHING_BETA', 4.0))
+SMOOTHING_D_CUTOFF = 1.0   # Hz, for the speed estimate
+SMOOTHING_RESET_GAP = 1.0  # seconds without a pose before the filter starts over
+SMOOTHING_IDLE_TIMEOUT = 120  # seconds
+
+
+def _alpha(cutoff, dt):
+    """Exponential smoothing factor for a cutoff frequency (scalar or array)."""
+    return 1.0 / (1.0 + 1.0 / (2 * math.pi * cutoff * dt))
+
+
+class OneEuroFilter:
+    """One-Euro filter over x, y, z of a (33, 4) array; visibility passes through."""
+    __slots__ = ('min_cutoff', 'beta', 'value', 'speed', 'last_time', 'lock', '_delta', '_rate')
+
+    def __init__(self, min_cutoff=SMOOTHING_MIN_CUTOFF, beta=SMOOTHING_BETA):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.value = None  # (33, 3) last filtered coordinates
+        self.speed = None  # (33, 3) filtered derivative, units per second
+        self.last_time = None
+        self.lock = threading.Lock()
+        self._delta = np.empty((33, 3))  # Scratch, so a frame allocates nothing
+        self._rate = np.empty((33, 3))
+
+    def reset(self):
+        self.value = self.speed = self.last_time = None
+
+    def __call__(self, packed, t):
+        """Smooth `packed` in place at time `t` (seconds) and return it."""
+        coords = packed[:, :3]
+        dt = t - self.last_time if self.last_time is not None else 0.0
+        if self.value is None or not 0 < dt < SMOOTHING_RESET_GAP:
+            if dt <= 0 and self.value is not None:
+                coords[:] = self.value  # Same timestamp: repeat the last estimate
+                return packed
+            self.value = coords.copy()
+            self.speed = np.zeros_like(self.value)
+        else:
+            delta, rate = self._delta, self._rate
+            np.subtract(coords, self.value, out=delta)
+            # speed += alpha(d_cutoff) * (delta / dt - speed)
+            np.multiply(delta, 1.0 / dt, out=rate)
+            rate -= self.speed
+            rate *= _alpha(SMOOTHING_D_CUTOFF, dt)
+            self.speed += rate
+            # value += alpha(cutoff) * delta, alpha = r / (1 + r), r = 2*pi*cutoff*dt
+            np.abs(self.speed, out=rate)
+            rate *= self.beta
+            rate += self.min_cutoff
+            rate *= 2 * math.pi * dt
+            delta *= rate
+            rate += 1.0
+            delta /= rate
+            self.value += delta
+            coords[:] = self.value
+        self.last_time = t
+        return packed
+
+
+class LandmarkSmoother:
+    """
+    Per-session One-Euro filters. `clock` supplies frame timestamps (video
+    time when processing recordings offline).
+    """
+
+    def __init__(self, clock=time.monotonic, idle_timeout=SMOOTHING_IDLE_TIMEOUT, **filter_options):
+        self.clock = clock
+        self.sessions = SessionStore(lambda session_id: OneEuroFilter(**filter_options), idle_timeout=idle_timeout)
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.resets = 0
+
+    def smooth(self, session_id, packed):
+        """Filter one frame's landmarks in place (None = no pose: the track restarts)."""
+        state = self.sessions.get(session_id)
+        with state.lock:
+            if packed is None:
+                if state.value is not None:
+                    state.reset()
+                    with self._lock:
+                        self.resets += 1
+                return None
+            state(packed, self.clock())
+        with self._lock:
+            self.frames += 1
+        return packed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self.sessions),
+                "frames": self.frames,
+                "resets": self.resets,
+                "min_cutoff": SMOOTHING_MIN_CUTOFF,
+                "beta": SMOOTHING_BETA,
+            }
+
+
+def create_smoother(**options):
+    return LandmarkSmoother(**options) if LANDMARK_SMOOTHING else None
@@ -0,0 +1,285 @@
+import argparse
+import atexit
+import glob
+import json
+import os
+import re
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+from session_store import SessionStore
+import server_logging
+
+# Landmark Traces
+# Compact binary recordings of what MediaPipe produced, so the post-inference
+# pipeline (angles -> form -> reps) can be replayed and benchmarked without a
+# camera or a Pose graph.
+#
+# File layout (little-endian):
+#   header  b'LMTR' | u16 version | u32 meta length | meta (UTF-8 JSON)
+#   frames  f64 timestamp | f32[33][4] landmarks (x, y, z, visibility)
+# meta holds exercise, session, created and optionally expected_reps (the
+# ground truth for rep-accuracy checks, set with `label`).
+#
+#   TRACE_DIR=traces gunicorn ...                      # record /detect traffic
+#   python landmark_trace.py label traces/x.lmt --reps 10
+#   python landmark_trace.py replay traces/*.lmt --repeat 20
+
+TRACE_MAGIC = b'LMTR'
+TRACE_VERSION = 1
+TRACE_SUFFIX = '.lmt'
+TRACE_DIR = os.environ.get('TRACE_DIR', '')  # Empty = recording off
+TRACE_FLUSH_EVERY = 30  # frames
+HEADER = struct.Struct('<4sHI')
+FRAME_DTYPE = np.dtype([('t', '<f8'), ('landmarks', '<f4', (33, 4))])
+
+log = server_logging.get_logger('trace')
+
+
+# --- Format ---
+
+def write_header(f, meta):
+    blob = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+    f.write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION, len(blob)))
+    f.write(blob)
+
+
+def read_trace(path):
+    """Return (meta, frames) where frames is a FRAME_DTYPE structured array."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path}: not a landmark trace")
+    magic, version, meta_len = HEADER.unpack_from(data)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        raise ValueError(f"{path}: not a landmark trace (v{TRACE_VERSION})")
+    start = HEADER.size + meta_len
+    meta = json.loads(data[HEADER.size:start].decode('utf-8'))
+    count = (len(data) - start) // FRAME_DTYPE.itemsize  # Ignore a torn last frame
+    frames = np.frombuffer(data, FRAME_DTYPE, count=count, offset=start)
+    return meta, frames
+
+
+def label_trace(path, **fields):
+    """Rewrite a trace's meta (e.g. expected_reps) in place."""
+    meta, frames = read_trace(path)
+    meta.update(fields)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        write_header(f, meta)
+        f.write(frames.tobytes())
+    os.replace(tmp, path)
+    return meta
+
+
+# --- Recording ---
+
+class TraceWriter:
+    """One open trace file: a single session doing a single exercise."""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.exercise_id = meta.get('exercise')
+        self.frames = 0
+        self.lock = threading.Lock()
+        self._frame = np.zeros((), FRAME_DTYPE)
+        self._file = open(path, 'wb')
+        write_header(self._file, meta)
+
+    def append(self, timestamp, packed):
+        with self.lock:
+            if self._file is None:
+                return
+            self._frame['t'] = timestamp
+            self._frame['landmarks'] = packed
+            self._file.write(self._frame.tobytes())
+            self.frames += 1
+            if self.frames % TRACE_FLUSH_EVERY == 0:
+                self._file.flush()
+
+    def close(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class TraceRecorder:
+    """
+    Writes every analysed frame's landmarks to TRACE_DIR, one file per
+    session and exercise. Idle sessions are closed by the session store.
+    `clock` supplies frame timestamps (video time when recording offline).
+    """
+
+    def __init__(self, trace_dir=TRACE_DIR, clock=time.time, **store_options):
+        self.trace_dir = trace_dir
+        self.clock = clock
+        os.makedirs(trace_dir, exist_ok=True)
+        self.writers = SessionStore(lambda session_id: None, on_evict=self._close, **store_options)
+        self.files = 0
+        atexit.register(self.close)
+
+    def _open(self, session_id, exercise_id):
+        safe = re.sub(r'[^A-Za-z0-9_-]', '_', f"{session_id}_{exercise_id}")
+        path = os.path.join(self.trace_dir, f"{safe}_{int(time.time() * 1000)}{TRACE_SUFFIX}")
+        self.files += 1
+        log.info("🎞️ Recording landmark trace to %s", path)
+        return TraceWriter(path, {"exercise": exercise_id, "session": session_id, "created": time.time()})
+
+    def _close(self, session_id, writer):
+        if writer is not None:
+            writer.close()
+
+    def record(self, session_id, exercise_id, packed):
+        writer = self.writers.get(session_id)
+        if writer is None or writer.exercise_id != exercise_id:
+            self._close(session_id, writer)
+            writer = self._open(session_id, exercise_id)
+            self.writers.put(session_id, writer)
+        writer.append(self.clock(), packed)
+
+    def close(self):
+        for session_id, writer in self.writers.items():
+            self._close(session_id, writer)
+
+
+# --- Replay ---
+
+def replay(meta, frames, exercise_id=None):
+    """
+    Drive angles -> form -> reps over a trace at full speed, using the
+    recorded timestamps as the rep counter's clock. Returns a result dict.
+    """
+    from angle_calculator import get_exercise_angles
+    from form_validator import validate_form
+    from rep_counter import RepCounter
+    from landmark_filter import OneEuroFilter, LANDMARK_SMOOTHING
+
+    exercise_id = exercise_id or meta.get('exercise')
+    expected = meta.get('expected_reps') if exercise_id == meta.get('exercise') else None
+    counter = RepCounter(session_id=meta.get('session') or 'replay')
+    packed_frames = frames['landmarks'].astype(np.float64)
+    smooth = OneEuroFilter() if LANDMARK_SMOOTHING else None  # Traces hold raw landmarks
+    timestamps = frames['t'].tolist()
+    rep_frames = []
+    invalid = 0
+    last_count = 0
+
+    started = time.perf_counter()
+    for index in range(len(packed_frames)):
+        packed = packed_frames[index]
+        if smooth is not None:
+            smooth(packed, timestamps[index])
+        angles = get_exercise_angles(packed, exercise_id)
+        feedback = validate_form(exercise_id, packed, angles)
+        if feedback:
+            invalid += 1
+        state = counter.update(exercise_id, angles, not feedback, now=timestamps[index])
+        if state['count'] > last_count:
+            last_count = state['count']
+            rep_frames.append(index)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "exercise": exercise_id,
+        "frames": len(packed_frames),
+        "seconds": elapsed,
+        "fps": len(packed_frames) / elapsed if elapsed else 0,
+        "reps": last_count,
+        "expected_reps": expected,
+        "rep_frames": rep_frames,
+        "form_flagged_frames": invalid,
+    }
+
+
+def _trace_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, f"*{TRACE_SUFFIX}")
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return paths
+
+
+def replay_command(args):
+    server_logging.configure_logging('DEBUG' if args.verbose else 'WARNING')  # Pipeline logs every frame
+    if args.exercise == 'all':
+        from exercise_configs import EXERCISE_CONFIGS
+        exercises = list(EXERCISE_CONFIGS)  # Throughput for every config from the same motion
+    else:
+        exercises = [args.exercise]
+
+    results = []
+    for path in _trace_paths(args.traces):
+        try:
+            meta, frames = read_trace(path)
+        except (OSError, ValueError) as e:
+            print(f"❌ {e}")
+            continue
+        for exercise_id in exercises:
+            runs = []
+            for _ in range(max(1, args.repeat)):
+                runs.append(replay(meta, frames, exercise_id))
+            result = dict(runs[-1], path=path)
+            result["fps"] = max(r["fps"] for r in runs)  # Best run: least scheduler noise
+            results.append(result)
+
+            expected = result["expected_reps"]
+            accuracy = f" | expected {expected} ({'✅' if expected == result['reps'] else '❌'})" if expected is not None else ""
+            print(f"{os.path.basename(path)}: {result['exercise']} | {result['frames']} frames | "
+                  f"{result['fps']:.0f} fps | {result['reps']} reps{accuracy}")
+
+    if not results:
+        return 1
+
+    print("\n📊 Per exercise")
+    by_exercise = {}
+    for r in results:
+        by_exercise.setdefault(r["exercise"], []).append(r)
+    for exercise_id, rs in sorted(by_exercise.items()):
+        frames = sum(r["frames"] for r in rs)
+        seconds = sum(r["frames"] / r["fps"] for r in rs if r["fps"])
+        labelled = [r for r in rs if r["expected_reps"] is not None]
+        exact = sum(1 for r in labelled if r["reps"] == r["expected_reps"])
+        accuracy = f"{exact}/{len(labelled)} traces exact" if labelled else "unlabelled"
+        print(f"  {exercise_id:25} {frames:7} frames | {frames / seconds if seconds else 0:9.0f} fps | {accuracy}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+def label_command(args):
+    meta = label_trace(args.trace, expected_reps=args.reps)
+    print(f"🏷️ {args.trace}: {meta}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay and label recorded landmark traces.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('replay', help="Benchmark angles/form/reps over traces")
+    p.add_argument('traces', nargs='+', help="Trace files, globs or directories")
+    p.add_argument('--exercise', '-e', help="Override the recorded exercise id ('all' = every config)")
+    p.add_argument('--repeat', '-r', type=int, default=5, help="Replays per trace (best fps is kept)")
+    p.add_argument('--json', help="Also write the results to this file")
+    p.add_argument('--verbose', '-v', action='store_true', help="Keep the pipeline's debug logs (slow)")
+    p.set_defaults(func=replay_command)
+
+    p = sub.add_parser('label', help="Store the true rep count in a trace")
+    p.add_argument('trace')
+    p.add_argument('--reps', type=int, required=True)
+    p.set_defaults(func=label_command)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import math
+import os
+import threading
+
+from exercise_configs import EXERCISE_CONFIGS
+
+# Latency Histograms
+# Every /detect request reports how long each stage took (parse, decode,
+# preprocess, inference, landmarks, angles, form, reps, serialize, total).
+# The timings land in fixed log-spaced buckets per exercise and stage, so
+# recording is O(1) with no samples kept, and p50/p95/p99 come straight from
+# the bucket counts (within one bucket, ~5%). Served on /metrics/latency;
+# SERVER_TIMING=1 also sends each request's stages as a Server-Timing header.
+
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
+BUCKET_MIN_MS = 0.01
+BUCKET_RATIO = 1.1
+BUCKET_COUNT = 180  # Up to ~280 s
+PERCENTILES = (50, 95, 99)
+ALL_EXERCISES = 'all'
+OTHER_EXERCISE = 'other'  # Unknown exercise ids share one bucket set
+
+_LOG_RATIO = math.log(BUCKET_RATIO)
+BUCKET_BOUNDS = [BUCKET_MIN_MS * BUCKET_RATIO ** i for i in range(BUCKET_COUNT)]  # Upper bounds
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms):
+        if ms <= BUCKET_MIN_MS:
+            index = 0
+        else:
+            index = min(BUCKET_COUNT - 1, math.ceil(math.log(ms / BUCKET_MIN_MS) / _LOG_RATIO))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (never above the max seen)."""
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKET_BOUNDS[index], self.max)
+        return self.max
+
+    def summary(self):
+        result = {"count": self.count, "mean": round(self.total / self.count, 2) if self.count else 0.0}
+        for p in PERCENTILES:
+            result[f"p{p}"] = round(self.percentile(p), 2)
+        result["max"] = round(self.max, 2)
+        return result
+
+
+class LatencyStats:
+    """Histograms keyed by exercise, then stage. Every record also counts under 'all'."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # exercise -> stage -> Histogram
+
+    def record(self, exercise_id, timings):
+        """Add one request's {stage: milliseconds}."""
+        exercise_id = exercise_id if exercise_id in EXERCISE_CONFIGS else OTHER_EXERCISE
+        with self._lock:
+            for key in (exercise_id, ALL_EXERCISES):
+                stages = self._histograms.setdefault(key, {})
+                for stage, ms in timings.items():
+                    histogram = stages.get(stage)
+                    if histogram is None:
+                        histogram = stages[stage] = Histogram()
+                    histogram.record(ms)
+
+    def snapshot(self, exercise_id=None):
+        with self._lock:
+            return {
+                exercise: {stage: histogram.summary() for stage, histogram in stages.items()}
+                for exercise, stages in self._histograms.items()
+                if exercise_id is None or exercise == exercise_id
+            }
+
+    def summary(self):
+        """Overall p50/p95/p99 of whole requests, for /metrics."""
+        with self._lock:
+            total = self._histograms.get(ALL_EXERCISES, {}).get('total')
+            return total.summary() if total else None
+
+
+def server_timing_header(timings):
+    """`Server-Timing` value: one `stage;dur=ms` entry per stage."""
+    return ", ".join(f"{stage};dur={ms:.2f}" for stage, ms in timings.items())
+
+
+latency_stats = LatencyStats()
@@ -1,164 +1,454 @@
-import cv2
-import mediapipe as mp
-import numpy as np
-import base64
+import atexit
+import os
 import time
-from flask import Flask, request, jsonify
+import threading
+import multiprocessing
+from startup import StartupReport, WARMUP
+startup_report = StartupReport()  # Import/init/warm-up phases and readiness for /health
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
+from flask_sock import Sock
 import json
+startup_report.lap('import flask')
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['Server-Timing', 'Retry-After'])
+sock = Sock(app)
+
+# Exercise Modules
+import numpy  # Imported up front only so the startup report times them on their own
+import cv2
+startup_report.lap('import numpy/opencv')
+import angle_calculator  # Angle plans and compiled form rules; rep_counter builds the stage tables
+from rep_counter import RepCounterStore
+startup_report.lap('exercise tables')
+import server_logging
+from pose_pipeline import (create_pose, decode_base64_payload, analyze_encoded, elapsed_ms, detect_pose,
+                           evaluate_landmarks, warm_pose)
+from pose_stream import PoseStream
+from inference_pool import InferencePool, PoolSaturated, INFERENCE_WORKERS
+from tracker_pool import TrackerPool, POSE_TRACKERS
+from frame_preprocess import create_preprocessor
+from frame_scheduler import create_scheduler
+from landmark_filter import create_smoother
+from frame_cache import create_frame_cache
+from group_tracker import create_group_tracker, MULTI_PERSON
+from inference_batcher import create_batcher
+from request_pipeline import create_pipeline, PipelineFull
+from admission import create_admission, Rejected
+from landmark_trace import TraceRecorder, TRACE_DIR
+from latency_stats import latency_stats, server_timing_header, SERVER_TIMING
+from landmark_codec import (DEFAULT_VIEW, VIEW_OPTIONS, view_from_options, wants_msgpack,
+                            encode_json, encode_msgpack)
+
+log = server_logging.get_logger('server')
+startup_report.lap('import server modules')
+
+# Per-session rep state shared by all requests on this process. Built here, not on
+# import, so tools that only need RepCounter never start its state file writer.
+rep_counters = RepCounterStore()
 
 # --- ML Models ---
-mp_pose = mp.solutions.pose
-pose = mp_pose.Pose(
-    static_image_mode=False,
-    model_complexity=0,  # OPTIMIZED: 0=fastest, 1=balanced, 2=accurate (using fastest for low latency)
-    enable_segmentation=False,
-    min_detection_confidence=0.35,  # BALANCED: Works from close and long distance
-    min_tracking_confidence=0.35    # BALANCED: Smooth tracking even from far
-)
+pose = None  # Shared graph when POSE_TRACKERS=0 or the pool is full, built by warm_up() or on first use
+pose_lock = threading.Lock()
+tracker_pool = TrackerPool() if POSE_TRACKERS > 0 else None  # One Pose graph per session
+preprocessor = create_preprocessor()  # Downscale + per-session ROI crop before inference
+scheduler = create_scheduler()  # Skips inference for some frames under load
+smoother = create_smoother()  # Per-session One-Euro filter over the landmarks
+frame_cache = create_frame_cache()  # Near-duplicate frames reuse the session's last pose
+group_tracker = create_group_tracker()  # Multi-person mode (MULTI_PERSON=1)
 
-# Exercise Modules
-from angle_calculator import get_exercise_angles
-from rep_counter import rep_counter
-from form_validator import validate_form
+# Multi-process inference (INFERENCE_WORKERS > 0). Worker processes import
+# this module as __mp_main__ when spawned, so only the parent builds the pool.
+inference_pool = None
+if INFERENCE_WORKERS > 0 and multiprocessing.parent_process() is None:
+    inference_pool = InferencePool(INFERENCE_WORKERS)
+    # Workers are daemons: without this they are killed at exit before flushing rep state and traces
+    atexit.register(inference_pool.shutdown)
+
+# Landmark trace recording for offline replay (TRACE_DIR set). With the
+# inference pool each worker records the sessions routed to it.
+trace_recorder = TraceRecorder() if TRACE_DIR and not inference_pool else None
+
+# Staged decode -> inference -> post-processing pipeline (REQUEST_PIPELINE=1),
+# or micro-batched inference (INFERENCE_BATCH=1); the pipeline batches its
+# post-processing itself. Worker processes handle one frame at a time, so
+# neither applies with the pool. detect_frame is defined below, hence the lambdas.
+pipeline = None
+batcher = None
+if not inference_pool:
+    pipeline = create_pipeline(lambda rgb, exercise_id, session_id: detect_frame(rgb, exercise_id, session_id, True),
+                               rep_counters, frame_cache)
+    if pipeline is None:
+        batcher = create_batcher(lambda *frame: detect_frame(*frame), rep_counters)
+
+def admission_slots():
+    """Frames /detect lets in at once by default: enough to keep the inference setup busy, no more."""
+    if inference_pool:
+        return inference_pool.num_workers * 2  # One running, one queued per worker
+    if pipeline:
+        return pipeline.queue_size
+    if batcher:
+        return batcher.max_size
+    return os.cpu_count() or 1
+
+# Load-aware admission for /detect (ADMISSION=1); streams keep only their newest frame already
+admission = create_admission(admission_slots())
+startup_report.lap('init')
+
+MAX_FRAME_BYTES = 8 * 1024 * 1024  # Reject anything larger than a sane camera frame
+BINARY_CONTENT_TYPES = ('application/octet-stream', 'image/jpeg', 'image/png')
+
+def read_body_buffer(stream, length):
+    """Read exactly `length` bytes from the request stream into one preallocated buffer."""
+    buf = bytearray(length)
+    view = memoryview(buf)
+    read = 0
+    while read < length:
+        n = stream.readinto(view[read:])
+        if not n:
+            break
+        read += n
+    return view[:read]
+
+def read_frame_request():
+    """
+    Parse a /detect request into (encoded_frame, exercise_id, session_id, error).
+    Accepts the legacy JSON body with a base64 image, a raw JPEG/PNG body
+    (application/octet-stream) or a multipart upload with an `image` file.
+    For binary uploads, exercise and session come from the query string or
+    the X-Exercise-Id / X-Session-Id headers.
+    """
+    mimetype = request.mimetype
+    if mimetype in BINARY_CONTENT_TYPES or mimetype == 'multipart/form-data':
+        exercise_id = request.args.get('exerciseId') or request.headers.get('X-Exercise-Id')
+        session_id = request.args.get('sessionId') or request.headers.get('X-Session-Id')
+        length = request.content_length
+        if length is not None and length > MAX_FRAME_BYTES:
+            return None, exercise_id, session_id, ("Frame too large", 413)
+
+        if mimetype == 'multipart/form-data':
+            upload = request.files.get('image')
+            if upload is None:
+                return None, exercise_id, session_id, ("No image data", 400)
+            exercise_id = request.form.get('exerciseId', exercise_id)
+            session_id = request.form.get('sessionId', session_id)
+            stream = upload.stream
+            buffer = stream.getbuffer() if hasattr(stream, 'getbuffer') else stream.read()
+        elif length:
+            buffer = read_body_buffer(request.stream, length)
+        else:
+            buffer = request.get_data(cache=False)  # Chunked upload, length unknown
+    else:
+        data = request.json
+        if not data or 'image' not in data:
+            return None, None, None, ("No image data", 400)
+        exercise_id = data.get('exerciseId')
+        session_id = data.get('sessionId')
+        buffer = decode_base64_payload(data['image'])
+        if buffer is None:
+            return None, exercise_id, session_id, ("Invalid image data", 400)
+
+    if len(buffer) == 0:
+        return None, exercise_id, session_id, ("No image data", 400)
+    return buffer, exercise_id, session_id, None
+
+def read_landmark_view():
+    """Landmark format for this response: query string, overridden by JSON body fields."""
+    options = request.args.to_dict()
+    if request.is_json:
+        body = request.get_json(silent=True) or {}
+        options.update((key, body[key]) for key in VIEW_OPTIONS if key in body)
+    return view_from_options(options)
+
+def read_multi_person():
+    """Group mode requested (`multiPerson` in the query string or JSON body)?"""
+    value = request.args.get('multiPerson')
+    if request.is_json:
+        value = (request.get_json(silent=True) or {}).get('multiPerson', value)
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def respond(result, view):
+    """Serialize a pipeline result (MessagePack when the client accepts it, else compact JSON)."""
+    if wants_msgpack(request.headers.get('Accept')):
+        return Response(encode_msgpack(view.apply(result, binary=True)), mimetype='application/x-msgpack')
+    return Response(encode_json(view.apply(result)), mimetype='application/json')
+
+def shared_pose():
+    """The one Pose graph used when POSE_TRACKERS=0 or every tracker is taken."""
+    global pose
+    if pose is None:
+        with pose_lock:
+            if pose is None:
+                pose = create_pose()
+    return pose
+
+def detect_frame(img, exercise_id, session_id=None, is_rgb=False):
+    """Inference on one decoded BGR (or RGB) frame: (result, packed landmarks or None)."""
+    tracker = tracker_pool.get(session_id) if tracker_pool is not None else None
+    if tracker is None:
+        return detect_pose(shared_pose(), img, exercise_id, session_id, lock=pose_lock, recorder=trace_recorder,
+                           preprocessor=preprocessor, smoother=smoother, is_rgb=is_rgb)
 
-def decode_image(base64_string):
+    result, packed = detect_pose(tracker.pose, img, exercise_id, session_id, lock=tracker.lock, recorder=trace_recorder,
+                                 preprocessor=preprocessor, smoother=smoother, is_rgb=is_rgb)
+    tracker_pool.record(tracker, packed is not None)
+    return result, packed
+
+def analyze_frame(img, exercise_id, session_id=None):
+    """Run pose -> angles -> form -> reps on one decoded BGR frame (in-process)."""
+    if batcher is not None:
+        return batcher.analyze(img, exercise_id, session_id)
+    result, packed = detect_frame(img, exercise_id, session_id)
+    if packed is not None:
+        evaluate_landmarks(result, packed, None, exercise_id, session_id, rep_counters)
+    return result
+
+def analyze_group(img, exercise_id, session_id=None):
+    """Every person in one decoded BGR frame, each with their own rep state (in-process)."""
+    return group_tracker.analyze(img, exercise_id, session_id, rep_counters, smoother)
+
+def process_frame(encoded_frame, exercise_id, session_id=None, timings=None, group=False):
+    """
+    Decode and analyse one encoded frame. Returns the result dict, or None
+    if the bytes are not a valid image. Under load the scheduler may answer
+    from the session's recent poses instead of running inference.
+    Stage timings go to latency_stats and, when given, into `timings`.
+    group=True runs multi-person mode (never skipped by the scheduler).
+    """
+    if scheduler is None or group:
+        result = infer_frame(encoded_frame, exercise_id, session_id, group)
+    else:
+        started = time.perf_counter()
+        result = scheduler.extrapolate(session_id, exercise_id, scheduler_load(session_id))
+        if result is not None:
+            result["timings"] = {"extrapolate": elapsed_ms(started)}
+        else:
+            with scheduler.inference():
+                result = infer_frame(encoded_frame, exercise_id, session_id)
+            if result is not None:
+                scheduler.observe(session_id, exercise_id, result)
+
+    if result is not None:
+        stages = result.pop("timings")
+        latency_stats.record(exercise_id, stages)
+        if timings is not None:
+            timings.update(stages)
+    return result
+
+def scheduler_load(session_id):
+    """Load the frame scheduler skips on; None = its own in-process count."""
+    if admission:
+        return admission.pressure()
+    return inference_pool.load(session_id) if inference_pool else None
+
+def infer_frame(encoded_frame, exercise_id, session_id=None, group=False):
+    """Full decode + inference, routed to the owning worker process when the pool is enabled."""
+    if inference_pool:
+        result = inference_pool.process(encoded_frame, exercise_id, session_id, group)
+        if "error" in result:
+            if result["error"] == "Invalid image data":
+                return None
+            raise RuntimeError(result["error"])
+        return result
+
+    if group:
+        return analyze_encoded(encoded_frame, exercise_id, session_id, rep_counters, analyze_group)
+    if pipeline:
+        return pipeline.process(encoded_frame, exercise_id, session_id)
+    return analyze_encoded(encoded_frame, exercise_id, session_id, rep_counters, analyze_frame, frame_cache)
+
+def reset_session(exercise_id, session_id=None):
+    if scheduler:
+        scheduler.forget(session_id)
+    if inference_pool:
+        inference_pool.reset(exercise_id, session_id).result(timeout=5)
+    else:
+        rep_counters.reset(exercise_id, session_id)
+        if group_tracker:
+            group_tracker.reset(exercise_id, session_id, rep_counters)
+
+def warm_up():
+    """
+    Startup phase after import: load MediaPipe and build + warm the graphs the
+    first sessions will use (or wait for the pool's workers to do the same),
+    then mark the process ready for /health.
+    """
     try:
-        if ',' in base64_string:
-            base64_string = base64_string.split(',')[1]
-        
-        img_data = base64.b64decode(base64_string)
-        nparr = np.frombuffer(img_data, np.uint8)
-        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        if inference_pool:
+            with startup_report.phase('inference workers'):
+                inference_pool.wait_ready()
+        else:
+            with startup_report.phase('import mediapipe'):
+                import mediapipe
+            with startup_report.phase('pose graphs'):
+                if tracker_pool is None:
+                    warm_pose(shared_pose())
+                else:
+                    tracker_pool.prefill()
+        startup_report.mark_ready()
     except Exception as e:
-        print(f"Error decoding image: {e}")
-        return None
+        log.exception("Error during warm-up: %s", e)
+        startup_report.mark_failed(e)
+
+def is_ready():
+    return startup_report.ready and (inference_pool is None or inference_pool.ready())
+
+# Spawned inference workers import this module as well; they warm up on their own
+if multiprocessing.parent_process() is None:
+    if WARMUP:
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+    else:
+        startup_report.mark_ready()
 
 # --- Endpoints ---
 
 @app.before_request
 def log_request_info():
-    print(f"📡 Incoming {request.method} {request.path} from {request.remote_addr}")
+    log.debug("📡 Incoming %s %s from %s", request.method, request.path, request.remote_addr)
 
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({"status": "ok", "service": "opencv-enhanced-backend"})
+    """
+    Readiness: 503 until warm-up has finished (and while a pool worker restarts).
+    "load" is the /detect admission state (in flight, queued, predicted latency);
+    a loaded but ready process stays 200 so it is not restarted for being busy.
+    """
+    load = admission.load() if admission else None
+    if not is_ready():
+        status = "error" if startup_report.error else "starting"
+        return jsonify({"status": status, "service": "opencv-enhanced-backend", "ready": False,
+                        "error": startup_report.error, "load": load}), 503
+    return jsonify({"status": "ok", "service": "opencv-enhanced-backend", "ready": True, "load": load})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Load figures for capacity planning (queue depth, worker utilisation)."""
+    return jsonify({
+        "sessions": rep_counters.sessions.stats(),
+        "persistence": rep_counters.persistence.stats(),
+        "logging": server_logging.stats(),
+        "pool": inference_pool.stats() if inference_pool else None,
+        "trackers": tracker_pool.stats() if tracker_pool else None,
+        "preprocess": preprocessor.stats() if preprocessor else None,
+        "scheduler": scheduler.stats() if scheduler else None,
+        "smoothing": smoother.stats() if smoother else None,
+        "frame_cache": frame_cache.stats() if frame_cache else None,
+        "group": group_tracker.stats() if group_tracker else None,
+        "batching": batcher.stats() if batcher else None,
+        "pipeline": pipeline.stats() if pipeline else None,
+        "admission": admission.stats() if admission else None,
+        "latency": latency_stats.summary(),
+        "startup": {
+            **startup_report.summary(),
+            "workers": inference_pool.startup if inference_pool else None,
+        },
+    })
+
+@app.route('/metrics/latency', methods=['GET'])
+def latency_metrics():
+    """
+    Per-stage latency histograms (count, mean, p50/p95/p99, max in ms) by
+    exercise, 'all' across exercises. ?exerciseId= narrows to one.
+    """
+    return jsonify(latency_stats.snapshot(request.args.get('exerciseId')))
 
 @app.route('/detect', methods=['POST'])
 def detect():
-    print(f"Received request at {time.strftime('%H:%M:%S')}")
-    t_start = time.time()
+    t_start = time.perf_counter()
+    log.debug("Received request at %s", time.strftime('%H:%M:%S'))
     try:
-        data = request.json
-        if not data or 'image' not in data:
-            print("❌ No image in request")
-            return jsonify({"error": "No image data"}), 400
+        encoded_frame, exercise_id, session_id, error = read_frame_request()
+        if error:
+            message, status = error
+            log.info("❌ %s", message, extra={"status": status})
+            return jsonify({"error": message}), status
 
-        exercise_id = data.get('exerciseId')
-        
-        img = decode_image(data['image'])
-        if img is None:
-            print("❌ Failed to decode image")
+        try:
+            view = read_landmark_view()
+        except ValueError as e:
+            log.info("❌ %s", e, extra={"status": 400})
+            return jsonify({"error": str(e)}), 400
+
+        group = read_multi_person()
+        if group and not MULTI_PERSON:
+            log.info("❌ Multi-person mode requested but disabled", extra={"session": session_id, "status": 400})
+            return jsonify({"error": "Multi-person mode is disabled (MULTI_PERSON=0)"}), 400
+
+        timings = {"parse": elapsed_ms(t_start)}
+        ticket = admission.enter(session_id) if admission else None
+        try:
+            if ticket is not None:
+                if not admission.wait(ticket):
+                    # A newer frame of this session took its place, or it waited out the latency budget
+                    log.debug("⏭️ Frame skipped (%s)", ticket.state, extra={"session": session_id})
+                    return jsonify({"skipped": True, "reason": ticket.state})
+                timings["admit"] = ticket.waited_ms
+            result = process_frame(encoded_frame, exercise_id, session_id, timings, group)
+        finally:
+            if ticket is not None:
+                admission.leave(ticket)
+        if result is None:
+            log.info("❌ Invalid image data", extra={"session": session_id, "status": 400})
             return jsonify({"error": "Invalid image data"}), 400
 
-        h, w = img.shape[:2]
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        # # DEBUG: Save image to verify what we are receiving
-        # debug_filename = f"debug_frame_{int(time.time())}.jpg"
-        # cv2.imwrite(debug_filename, img)
-        # print(f"📸 Saved debug frame to {debug_filename} ({w}x{h})")
-
-        results = pose.process(img_rgb)
-        
-        if not results.pose_landmarks:
-             print("⚠️ MediaPipe found NO landmarks in this image.")
-        else:
-             print(f"✅ MediaPipe found {len(results.pose_landmarks.landmark)} landmarks.")
-        detection_result = {
-            "landmarks": [],
-            "angles": {},
-            "confidence": 0,
-            "stage": None,
-            "rep_count": 0,
-            "feedback": [],
-            "processed_dims": {"w": w, "h": h}
-        }
-
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
-            processed_landmarks = []
-            
-            mp_names = {
-                0: "nose", 18: "right_pinky", 19: "left_index", 20: "right_index", 
-                15: "left_wrist", 16: "right_wrist", 11: "left_shoulder", 12: "right_shoulder",
-                23: "left_hip", 24: "right_hip", 25: "left_knee", 26: "right_knee",
-                27: "left_ankle", 28: "right_ankle"
-                # Simplified list as reference doesn't define all
-            }
-
-            for idx, lm in enumerate(landmarks):
-                # Using same key names as reference: x, y, z
-                processed_landmarks.append({
-                    "x": lm.x, "y": lm.y, "z": lm.z,
-                    "score": lm.visibility, 
-                    "name": mp_names.get(idx, f"point_{idx}")
-                })
-            
-            detection_result["landmarks"] = processed_landmarks
-            detection_result["confidence"] = 0.9
-
-            # 1. Dynamic Angle Calculation
-            angles = get_exercise_angles(landmarks, exercise_id)
-            detection_result["angles"] = angles
-
-            # 2. Form Validation (Do this before rep counting to use result)
-            feedback = validate_form(exercise_id, landmarks, angles)
-            detection_result["feedback"] = feedback
-            form_is_valid = len(feedback) == 0
-
-            # 3. Stateful Rep Counting (Now form-aware)
-            rep_stats = rep_counter.update(exercise_id, angles, form_is_valid)
-            detection_result["stage"] = rep_stats['current_stage']
-            detection_result["rep_count"] = rep_stats['count']
-            detection_result["form_score"] = int(rep_stats.get('score', 0))
-            
-            # If a rep was just rejected, notify the user via feedback
-            if rep_stats.get('rejection_reason'):
-                detection_result["feedback"].append(rep_stats['rejection_reason'])
-            
-            # High-visibility logging with feedback
-            status_char = "✅" if form_is_valid else "⚠️"
-            stage_info = f"Stage: {rep_stats['current_stage'] or 'detecting'}"
-            score_info = f"Score: {detection_result['form_score']}%"
-            
-            # Log feedback if present
-            if feedback:
-                feedback_str = " | 🗣️ " + ", ".join(feedback[:2])  # Show first 2 feedback items
-            else:
-                feedback_str = ""
-            
-            print(f"{status_char} Reps: {rep_stats['count']} | {stage_info} | {score_info}{feedback_str}")
-        else:
-            print("⚠️ No pose detected")
+        mark = time.perf_counter()
+        response = respond(result, view)
+        timings["serialize"] = elapsed_ms(mark)
+        timings["total"] = elapsed_ms(t_start)
+        latency_stats.record(exercise_id, {key: timings[key] for key in ("parse", "admit", "serialize", "total")
+                                           if key in timings})
+        if SERVER_TIMING:
+            response.headers['Server-Timing'] = server_timing_header(timings)
+        return response
 
-        return jsonify(detection_result)
+    except (PoolSaturated, PipelineFull) as e:
+        log.warning("⏳ %s", e, extra={"status": 503})
+        return jsonify({"error": "Server busy"}), 503
 
+    except Rejected as e:
+        log.info("⏳ %s", e.reason, extra={"session": session_id, "status": e.status})
+        return jsonify({"error": e.reason, "retryAfter": e.retry_after}), e.status, {"Retry-After": str(e.retry_after)}
 
     except Exception as e:
-        print(f"Error in pose: {e}")
+        log.exception("Error in pose: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/reset', methods=['POST'])
 def reset_exercise():
     data = request.json
     exercise_id = data.get('exerciseId', 'push-ups')
-    print(f"🔄 Resetting rep counter for: {exercise_id}")
-    rep_counter.reset(exercise_id)
-    return jsonify({"status": "reset", "exerciseId": exercise_id})
+    session_id = data.get('sessionId')
+    log.info("🔄 Resetting rep counter for: %s (session: %s)", exercise_id, session_id or 'default',
+             extra={"session": session_id, "exercise": exercise_id})
+    reset_session(exercise_id, session_id)
+    return jsonify({"status": "reset", "exerciseId": exercise_id, "sessionId": session_id})
+
+@sock.route('/stream')
+def stream(ws):
+    """
+    Persistent streaming mode: ws://<host>/stream?exerciseId=...&sessionId=...
+    Send binary JPEG frames (or JSON {"image": base64}) and receive one JSON
+    result per processed frame. See pose_stream.py for the message format.
+    Landmark options (landmarks, lmFormat, joints) work as for /detect.
+    """
+    exercise_id = request.args.get('exerciseId')
+    session_id = request.args.get('sessionId')
+    try:
+        view = view_from_options(request.args)
+    except ValueError as e:
+        log.warning("⚠️ %s - streaming full landmarks", e, extra={"session": session_id})
+        view = DEFAULT_VIEW
+    log.info("🔌 Stream opened for: %s (session: %s)", exercise_id, session_id or 'default',
+             extra={"session": session_id, "exercise": exercise_id})
+    PoseStream(
+        ws,
+        process=process_frame,
+        reset=reset_session,
+        exercise_id=exercise_id,
+        session_id=session_id,
+        view=view,
+    ).run()
 
 if __name__ == '__main__':
     print("\n\n" + "="*50)
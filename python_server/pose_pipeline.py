@@ -0,0 +1,318 @@
+import cv2
+import numpy as np
+import base64
+import binascii
+import os
+import time
+
+# Pose Pipeline
+# Everything needed to turn one encoded frame into a /detect result:
+# decode -> MediaPipe Pose -> angles -> form -> reps.
+# Kept free of Flask so inference worker processes can import it.
+# Each result carries "timings", milliseconds per stage, for latency_stats.py;
+# callers pop it before the result is serialized. MediaPipe itself (~1s to
+# import) is only imported once a graph is built, so a front end that hands
+# every frame to the inference pool never loads it.
+#
+#   POSE_MODEL_COMPLEXITY=0   0 = lite, 1 = full, 2 = heavy (compare with benchmark.py)
+
+from angle_calculator import get_exercise_angles, get_batch_angles, pack_landmarks
+from form_validator import validate_form, validate_form_batch
+from landmark_filter import LANDMARK_SMOOTHING
+from server_logging import get_logger, SessionSampler, DEBUG_LOGS
+
+log = get_logger('pipeline')
+sample_status = SessionSampler()  # Per-session: one status line every LOG_SAMPLE_EVERY frames
+
+WARMUP_BACKGROUND = 180  # Gray level of the warm-up frames
+
+POSE_OPTIONS = dict(
+    static_image_mode=False,
+    model_complexity=int(os.environ.get('POSE_MODEL_COMPLEXITY', 0)),  # OPTIMIZED: 0=fastest, 1=balanced, 2=accurate (using fastest for low latency)
+    enable_segmentation=False,
+    min_detection_confidence=0.35,  # BALANCED: Works from close and long distance
+    min_tracking_confidence=0.35,   # BALANCED: Smooth tracking even from far
+    smooth_landmarks=not LANDMARK_SMOOTHING  # Ours uses real frame times (landmark_filter.py)
+)
+
+def elapsed_ms(since):
+    return (time.perf_counter() - since) * 1000
+
+def create_pose(**overrides):
+    """Build a MediaPipe Pose graph with the server's tuned settings."""
+    import mediapipe as mp
+    return mp.solutions.pose.Pose(**{**POSE_OPTIONS, **overrides})
+
+def warmup_frame(w=640, h=480):
+    """A drawn figure (BGR) that MediaPipe detects as a standing person, so warm-up needs no photo."""
+    img = np.full((h, w, 3), WARMUP_BACKGROUND, np.uint8)
+    skin, shirt, pants = (120, 150, 210), (150, 80, 40), (60, 50, 40)
+    unit = h / 100
+
+    def at(x, y):
+        return int(w / 2 + x * unit), int(y * unit)
+
+    cv2.ellipse(img, at(0, 16), (int(5 * unit), int(6.5 * unit)), 0, 0, 360, skin, -1)  # Head
+    cv2.line(img, at(0, 22), at(0, 26), skin, int(3 * unit))  # Neck
+    cv2.fillConvexPoly(img, np.array([at(-9, 26), at(9, 26), at(7, 54), at(-7, 54)]), shirt)  # Torso
+    for side in (-1, 1):
+        cv2.line(img, at(9 * side, 28), at(13 * side, 42), shirt, int(4 * unit))  # Upper arm
+        cv2.line(img, at(13 * side, 42), at(14 * side, 55), skin, int(3 * unit))  # Forearm
+        cv2.circle(img, at(14 * side, 56), int(2 * unit), skin, -1)  # Hand
+        cv2.line(img, at(4 * side, 54), at(5 * side, 74), pants, int(5 * unit))  # Thigh
+        cv2.line(img, at(5 * side, 74), at(5 * side, 93), pants, int(4 * unit))  # Shin
+        cv2.line(img, at(5 * side, 94), at(9 * side, 95), (30, 30, 30), int(2 * unit))  # Foot
+    return img
+
+def warm_pose(pose):
+    """
+    Run a new graph once before a real frame reaches it: a graph's first
+    process() call initialises the model runtime (~250ms instead of ~25ms).
+    The drawn figure runs both the detector and the landmark model; a blank
+    frame then drops the track, so the first real frame starts with a clean
+    detection. Returns `pose`.
+    """
+    rgb = cv2.cvtColor(warmup_frame(), cv2.COLOR_BGR2RGB)
+    pose.process(rgb)
+    pose.process(np.full_like(rgb, WARMUP_BACKGROUND))
+    return pose
+
+def decode_base64_payload(base64_string):
+    """Strip an optional data-URL prefix and base64-decode. Returns bytes or None."""
+    try:
+        if ',' in base64_string:
+            base64_string = base64_string.split(',')[1]
+        return base64.b64decode(base64_string)
+    except (binascii.Error, TypeError, ValueError) as e:
+        log.warning("Error decoding image: %s", e)
+        return None
+
+def decode_image_bytes(buffer):
+    """Decode raw JPEG/PNG bytes (any buffer-protocol object) without copying them."""
+    try:
+        nparr = np.frombuffer(buffer, np.uint8)
+        if nparr.size == 0:
+            return None
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    except Exception as e:
+        log.warning("Error decoding image: %s", e)
+        return None
+
+def decode_image(base64_string):
+    img_data = decode_base64_payload(base64_string)
+    if img_data is None:
+        return None
+    return decode_image_bytes(img_data)
+
+def analyze_encoded(buffer, exercise_id, session_id, counters, analyze, frame_cache=None):
+    """
+    Decode one encoded frame and run `analyze(img, exercise_id, session_id)` on
+    it (analyze_frame with the caller's Pose graph and options). With a
+    `frame_cache` (frame_cache.FrameCache), a near-duplicate of a recent frame
+    skips decoding and inference. Returns None if the bytes are not an image.
+    """
+    started = time.perf_counter()
+    timings = {}
+    signature = None
+    if frame_cache is not None:
+        signature, cached = frame_cache.match(session_id, exercise_id, buffer)
+        timings["hash"] = elapsed_ms(started)
+        if cached is not None:
+            result = analyze_cached(cached, exercise_id, session_id, counters)
+            result["timings"] = {**timings, **result["timings"]}
+            return result
+
+    mark = time.perf_counter()
+    img = decode_image_bytes(buffer)
+    if img is None:
+        return None
+    timings["decode"] = elapsed_ms(mark)
+    result = analyze(img, exercise_id, session_id)
+    result["timings"] = {**timings, **result["timings"]}
+    if frame_cache is not None:
+        frame_cache.store(session_id, signature, exercise_id, result)
+    return result
+
+def analyze_frame(pose, img, exercise_id, session_id, counters, lock=None, recorder=None, preprocessor=None,
+                  smoother=None):
+    """
+    Run pose -> angles -> form -> reps on one decoded BGR frame.
+    `counters` is the RepCounterStore holding this session's state and `lock`
+    serialises access to a `pose` shared between threads. `recorder` (a
+    landmark_trace.TraceRecorder) keeps the landmarks for offline replay.
+    `preprocessor` (a frame_preprocess.FramePreprocessor) downscales and crops
+    the frame to the session's ROI before inference; `smoother` (a
+    landmark_filter.LandmarkSmoother) filters the landmarks over time.
+    """
+    detection_result, packed = detect_pose(pose, img, exercise_id, session_id, lock, recorder, preprocessor, smoother)
+    if packed is not None:
+        evaluate_landmarks(detection_result, packed, None, exercise_id, session_id, counters)
+    return detection_result
+
+def detect_pose(pose, img, exercise_id, session_id, lock=None, recorder=None, preprocessor=None, smoother=None,
+                is_rgb=False):
+    """
+    The inference half of analyze_frame: (result, packed landmarks or None).
+    The result has no angles, form or reps yet; evaluate_landmarks or
+    evaluate_batch fills them in. is_rgb=True: `img` was already converted.
+    """
+    started = time.perf_counter()
+    if preprocessor is None:
+        return _detect(pose, img, None, is_rgb, exercise_id, session_id, lock, recorder, smoother, started)
+    with preprocessor.frame(session_id, img, is_rgb) as prepared:
+        return _detect(pose, img, prepared, is_rgb, exercise_id, session_id, lock, recorder, smoother, started)
+
+def _detect(pose, img, prepared, is_rgb, exercise_id, session_id, lock, recorder, smoother, started):
+    h, w = img.shape[:2]
+    if prepared is not None:
+        img_rgb = prepared.rgb
+    else:
+        img_rgb = img if is_rgb else cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    timings = {"preprocess": elapsed_ms(started)}  # Color conversion, plus resize/crop with a preprocessor
+
+    # # DEBUG: Save image to verify what we are receiving
+    # debug_filename = f"debug_frame_{int(time.time())}.jpg"
+    # cv2.imwrite(debug_filename, img)
+    # print(f"📸 Saved debug frame to {debug_filename} ({w}x{h})")
+
+    mark = time.perf_counter()
+    if lock is not None:
+        with lock:  # Pose graph is not thread-safe (threaded server + streams)
+            results = pose.process(img_rgb)
+    else:
+        results = pose.process(img_rgb)
+    timings["inference"] = elapsed_ms(mark)  # Includes waiting for a shared graph's lock
+
+    if not results.pose_landmarks:
+         log.debug("⚠️ MediaPipe found NO landmarks in this image.")
+    else:
+         log.debug("✅ MediaPipe found %d landmarks.", len(results.pose_landmarks.landmark))
+    detection_result = _empty_result({"w": w, "h": h}, timings)
+
+    if results.pose_landmarks:
+        # 1. Landmarks packed once into a (33, 4) array for the angle calculation
+        mark = time.perf_counter()
+        packed = pack_landmarks(results.pose_landmarks)
+        if prepared is not None:
+            prepared.restore(packed)  # Crop -> full-frame coordinates
+        if recorder is not None:
+            recorder.record(session_id, exercise_id, packed)  # Raw, so replays can re-run the filter
+        if smoother is not None:
+            smoother.smooth(session_id, packed)
+        timings["landmarks"] = elapsed_ms(mark)  # Pack, map back from the crop, record, smooth
+        return detection_result, packed
+
+    log.debug("⚠️ No pose detected")
+    if prepared is not None:
+        prepared.restore(None)
+    if smoother is not None:
+        smoother.smooth(session_id, None)
+    return detection_result, None
+
+def analyze_cached(cached, exercise_id, session_id, counters):
+    """
+    Result for a frame that matched `cached` (a frame_cache.CachedPose): its
+    landmarks and angles are reused and only form and reps run again.
+    """
+    started = time.perf_counter()
+    detection_result = _empty_result(dict(cached.dims), {})
+    detection_result["cached"] = True
+    if cached.packed is not None:
+        evaluate_landmarks(detection_result, cached.packed.copy(), dict(cached.angles), exercise_id, session_id, counters)
+    detection_result["timings"]["cache"] = elapsed_ms(started)
+    return detection_result
+
+def _empty_result(dims, timings):
+    return {
+        "landmarks": None,  # Packed (33, 4) array; landmark_codec serializes it per client
+        "angles": {},
+        "confidence": 0,
+        "stage": None,
+        "rep_count": 0,
+        "feedback": [],
+        "processed_dims": dims,
+        "timings": timings,
+    }
+
+def evaluate_landmarks(detection_result, packed, angles, exercise_id, session_id, counters):
+    """Angles (unless given) -> form -> reps for one frame's landmarks."""
+    timings = detection_result["timings"]
+    detection_result["landmarks"] = packed
+    detection_result["confidence"] = 0.9
+    if angles is None:
+        mark = time.perf_counter()
+        angles = get_exercise_angles(packed, exercise_id)
+        timings["angles"] = elapsed_ms(mark)
+    detection_result["angles"] = angles
+
+    # 2. Form Validation (Do this before rep counting to use result)
+    mark = time.perf_counter()
+    feedback = validate_form(exercise_id, packed, angles)
+    timings["form"] = elapsed_ms(mark)
+    _count_reps(detection_result, feedback, exercise_id, session_id, counters)
+
+def evaluate_batch(frames, counters):
+    """
+    evaluate_landmarks for several frames at once. `frames` is a list of
+    (detection_result, packed, exercise_id, session_id); angles and form run
+    once per exercise over the stacked landmarks, with each frame timed at its
+    share of the batch. Reps update in list order.
+    """
+    by_exercise = {}
+    for index, (_, _, exercise_id, _) in enumerate(frames):
+        by_exercise.setdefault(exercise_id, []).append(index)
+
+    evaluated = [None] * len(frames)
+    for exercise_id, indices in by_exercise.items():
+        stacked = np.stack([frames[index][1] for index in indices])
+        mark = time.perf_counter()
+        batch_angles = get_batch_angles(stacked, exercise_id)
+        angles_ms = elapsed_ms(mark) / len(indices)
+        mark = time.perf_counter()
+        batch_feedback = validate_form_batch(exercise_id, stacked, batch_angles)
+        form_ms = elapsed_ms(mark) / len(indices)
+        for index, angles, feedback in zip(indices, batch_angles, batch_feedback):
+            evaluated[index] = angles, feedback
+            frames[index][0]["timings"].update(angles=angles_ms, form=form_ms)
+
+    for (detection_result, packed, exercise_id, session_id), (angles, feedback) in zip(frames, evaluated):
+        detection_result["landmarks"] = packed
+        detection_result["confidence"] = 0.9
+        detection_result["angles"] = angles
+        _count_reps(detection_result, feedback, exercise_id, session_id, counters)
+
+def _count_reps(detection_result, feedback, exercise_id, session_id, counters):
+    """Form-aware rep counting and the status log line, once angles and feedback are known."""
+    timings = detection_result["timings"]
+    angles = detection_result["angles"]
+    detection_result["feedback"] = feedback
+    form_is_valid = len(feedback) == 0
+
+    # 3. Stateful Rep Counting (Now form-aware)
+    mark = time.perf_counter()
+    rep_stats = counters.update(exercise_id, angles, form_is_valid, session_id)
+    timings["reps"] = elapsed_ms(mark)
+    detection_result["stage"] = rep_stats['current_stage']
+    detection_result["rep_count"] = rep_stats['count']
+    detection_result["form_score"] = int(rep_stats.get('score', 0))
+
+    # If a rep was just rejected, notify the user via feedback
+    if rep_stats.get('rejection_reason'):
+        detection_result["feedback"].append(rep_stats['rejection_reason'])
+
+    # High-visibility logging with feedback (every frame with DEBUG_LOGS, else sampled per session)
+    if DEBUG_LOGS or sample_status(session_id):
+        status_char = "✅" if form_is_valid else "⚠️"
+        stage_info = f"Stage: {rep_stats['current_stage'] or 'detecting'}"
+        score_info = f"Score: {detection_result['form_score']}%"
+
+        # Log feedback if present
+        if feedback:
+            feedback_str = " | 🗣️ " + ", ".join(feedback[:2])  # Show first 2 feedback items
+        else:
+            feedback_str = ""
+
+        log.info(f"{status_char} Reps: {rep_stats['count']} | {stage_info} | {score_info}{feedback_str}", extra={
+            "session": session_id, "exercise": exercise_id, "stage": rep_stats['current_stage'],
+            "reps": rep_stats['count'], "score": detection_result['form_score'],
+        })
@@ -0,0 +1,186 @@
+import json
+import threading
+import time
+
+from landmark_codec import DEFAULT_VIEW, VIEW_OPTIONS, view_from_options, encode_json
+from pose_pipeline import decode_base64_payload
+from server_logging import get_logger
+
+# WebSocket Streaming
+# One persistent connection per trainee. The client pushes frames (binary JPEG
+# or JSON with a base64 image) and receives one result message per processed
+# frame. Frames that arrive while the server is busy replace the one waiting,
+# so a slow server always works on the newest frame instead of building a queue.
+
+STREAM_MAX_FRAME_AGE = 0.5   # seconds - older frames are skipped as stale
+STREAM_IDLE_TIMEOUT = 30     # seconds without any message before we hang up
+
+log = get_logger('stream')
+
+
+class LatestFrameSlot:
+    """Single-slot mailbox: a newer frame replaces the one still waiting."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        with self._cond:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self.received += 1
+            self._cond.notify()
+
+    def take(self):
+        """Block until a frame is available; returns None once closed."""
+        with self._cond:
+            while self._frame is None and not self._closed:
+                self._cond.wait()
+            frame, self._frame = self._frame, None
+            return frame
+
+    @property
+    def pending(self):
+        return 1 if self._frame is not None else 0
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class PoseStream:
+    """
+    Drives one WebSocket connection.
+    `process(encoded_frame, exercise_id, session_id)` is the same pipeline
+    /detect uses (None for undecodable frames);
+    `reset(exercise_id, session_id)` clears the session's rep counter.
+    `view` (landmark_codec.LandmarkView) picks the landmark format; a config
+    message with landmarks / lmFormat / joints replaces it.
+    """
+
+    def __init__(self, ws, process, reset, exercise_id=None, session_id=None, view=DEFAULT_VIEW):
+        self.ws = ws
+        self.process = process
+        self.reset = reset
+        self.exercise_id = exercise_id
+        self.session_id = session_id
+        self.view = view
+        self.slot = LatestFrameSlot()
+        self.processed = 0
+        self.stale = 0
+        self._send_lock = threading.Lock()
+        self._next_frame_id = 0
+
+    def run(self):
+        worker = threading.Thread(target=self._process_loop, daemon=True)
+        worker.start()
+        try:
+            self._receive_loop()
+        finally:
+            self.slot.close()
+            worker.join(timeout=5)
+            log.info("🔌 Stream closed [%s] | received %d | processed %d | dropped %d | stale %d",
+                     self.session_id or 'default', self.slot.received, self.processed,
+                     self.slot.dropped, self.stale, extra={"session": self.session_id})
+
+    # --- Receiving ---
+
+    def _receive_loop(self):
+        while True:
+            try:
+                message = self.ws.receive(timeout=STREAM_IDLE_TIMEOUT)
+            except Exception:
+                return  # Connection closed by client
+            if message is None:
+                return  # Idle timeout
+
+            if isinstance(message, (bytes, bytearray)):
+                self._enqueue(message, None)
+                continue
+
+            try:
+                data = json.loads(message)
+            except ValueError:
+                self._send({"type": "error", "error": "Invalid message"})
+                continue
+
+            msg_type = data.get('type', 'frame')
+            if msg_type == 'config':
+                self.exercise_id = data.get('exerciseId', self.exercise_id)
+                self.session_id = data.get('sessionId', self.session_id)
+                if any(key in data for key in VIEW_OPTIONS):
+                    try:
+                        self.view = view_from_options(data)
+                    except ValueError as e:
+                        self._send({"type": "error", "error": str(e)})
+                        continue
+                self._send({"type": "config", "exerciseId": self.exercise_id, "sessionId": self.session_id,
+                            "landmarks": self.view.mode})
+            elif msg_type == 'reset':
+                self.exercise_id = data.get('exerciseId', self.exercise_id)
+                self.reset(self.exercise_id, self.session_id)
+                self._send({"type": "reset", "exerciseId": self.exercise_id})
+            elif 'image' in data:
+                if data.get('exerciseId'):
+                    self.exercise_id = data['exerciseId']
+                self._enqueue(data['image'], data.get('frameId'))
+            else:
+                self._send({"type": "error", "error": "No image data"})
+
+    def _enqueue(self, payload, frame_id):
+        if frame_id is None:
+            frame_id = self._next_frame_id
+        self._next_frame_id += 1
+        self.slot.put((time.monotonic(), frame_id, payload))
+
+    # --- Processing ---
+
+    def _process_loop(self):
+        while True:
+            frame = self.slot.take()
+            if frame is None:
+                return
+            received_at, frame_id, payload = frame
+
+            if time.monotonic() - received_at > STREAM_MAX_FRAME_AGE:
+                self.stale += 1
+                continue
+
+            try:
+                if not isinstance(payload, (bytes, bytearray)):
+                    payload = decode_base64_payload(payload)
+                result = self.process(payload, self.exercise_id, self.session_id) if payload else None
+                if result is None:
+                    self._send({"type": "error", "frameId": frame_id, "error": "Invalid image data"})
+                    continue
+            except Exception as e:
+                log.exception("Error in stream: %s", e)
+                self._send({"type": "error", "frameId": frame_id, "error": str(e)})
+                continue
+
+            self.processed += 1
+            self.view.apply(result)
+            result["type"] = "result"
+            result["frameId"] = frame_id
+            result["latency_ms"] = round((time.monotonic() - received_at) * 1000, 1)
+            result["stream"] = {
+                "received": self.slot.received,
+                "processed": self.processed,
+                "dropped": self.slot.dropped,
+                "stale": self.stale,
+                "pending": self.slot.pending,
+            }
+            self._send(result)
+
+    def _send(self, message):
+        try:
+            with self._send_lock:
+                self.ws.send(encode_json(message))
+        except Exception:
+            self.slot.close()
@@ -1,46 +1,113 @@
-
 from exercise_configs import EXERCISE_CONFIGS
+from session_store import SessionStore, DEFAULT_SESSION_ID
+from state_log import StateLog
+from landmark_filter import LANDMARK_SMOOTHING
+from server_logging import get_logger
 import time
 
-import json
-import os
+log = get_logger('reps')
+
+STATE_FILE = "reps_state.json"
+
+# Minimum hold time to prevent false transitions (debounce). Smoothed
+# landmarks (landmark_filter.py) no longer flicker between stages, so the
+# wait before accepting a transition can be halved.
+MIN_STAGE_HOLD_TIME = 0.05 if LANDMARK_SMOOTHING else 0.1  # seconds
+MIN_FORM_SCORE = 20  # Minimum 20% match - OPTIMIZED: more lenient
+
+# Compiled Stage Tables
+# Stage ranges are flattened once per exercise into (joint, min, max, center,
+# half_span) rows, pre-split into limb (left/right) and mandatory joints, so a
+# frame is scored without string tests or range arithmetic.
+
+def _is_limb(joint):
+    return 'left' in joint or 'right' in joint
+
+def _bounds(joint, min_angle, max_angle):
+    return (joint, min_angle, max_angle, (min_angle + max_angle) / 2, (max_angle - min_angle) / 2)
+
+class StageTable:
+    __slots__ = ('names', 'rows')
+
+    def __init__(self, stages):
+        self.names = tuple(stage['name'] for stage in stages)
+        self.rows = tuple(
+            (
+                tuple(_bounds(j, *r) for j, r in stage['ranges'].items() if not _is_limb(j)),
+                tuple(_bounds(j, *r) for j, r in stage['ranges'].items() if _is_limb(j)),
+            )
+            for stage in stages
+        )
+
+    def scores(self, angles):
+        """
+        Match score (0-100) for every stage, in stage order.
+        In-range joints score 100, out-of-range ones fall off 2 points per degree;
+        a stage scores the mean of its mandatory joints and the best limb joint.
+        """
+        scores = []
+        for mandatory, limbs in self.rows:
+            m_total = 0
+            m_count = 0
+            for joint, min_angle, max_angle, center, half_span in mandatory:
+                angle = angles.get(joint)
+                if angle is None:
+                    continue
+                if min_angle <= angle <= max_angle:
+                    m_total += 100
+                else:
+                    m_total += max(0, 100 - ((abs(angle - center) - half_span) * 2))
+                m_count += 1
+
+            l_max = None
+            for joint, min_angle, max_angle, center, half_span in limbs:
+                angle = angles.get(joint)
+                if angle is None:
+                    continue
+                if min_angle <= angle <= max_angle:
+                    score = 100
+                else:
+                    score = max(0, 100 - ((abs(angle - center) - half_span) * 2))
+                if l_max is None or score > l_max:
+                    l_max = score
+
+            m_avg = m_total / m_count if m_count else 100
+            scores.append((m_avg + (100 if l_max is None else l_max)) / 2)
+        return scores
+
+STAGE_TABLES = {exercise_id: StageTable(config['stages']) for exercise_id, config in EXERCISE_CONFIGS.items()}
+
+def new_state():
+    return {
+        'count': 0,
+        'current_stage': None,
+        'previous_stage': None,
+        'last_transition_time': 0,
+        'exercise_id': None,
+        'active_hit': False,
+        'total_frames': 0,
+        'initialized': False
+    }
 
 class RepCounter:
-    def __init__(self):
-        self.state_file = "reps_state.json"
-        self.state = self.load_state() or {
-            'count': 0,
-            'current_stage': None,
-            'previous_stage': None,
-            'last_transition_time': 0,
-            'exercise_id': None,
-            'active_hit': False,
-            'total_frames': 0,
-            'initialized': False
-        }
+    """Rep counting state machine for a single session."""
+    __slots__ = ('session_id', 'state', '_on_save')
 
-    def load_state(self):
-        try:
-            if os.path.exists(self.state_file):
-                with open(self.state_file, 'r') as f:
-                    print("📂 Loaded saved rep state")
-                    return json.load(f)
-        except Exception as e:
-            print(f"⚠️ Failed to load state: {e}")
-        return None
+    def __init__(self, session_id=DEFAULT_SESSION_ID, state=None, on_save=None):
+        self.session_id = session_id
+        self.state = state or new_state()
+        self._on_save = on_save
 
     def save_state(self):
-        try:
-            with open(self.state_file, 'w') as f:
-                json.dump(self.state, f)
-        except Exception as e:
-             print(f"⚠️ Failed to save state: {e}")
+        if self._on_save:
+            self._on_save(self)
 
     def reset(self, exercise_id=None):
         """Explicitly reset rep counter - only called from /reset endpoint"""
         old_count = self.state.get('count', 0)
         old_id = self.state.get('exercise_id')
-        print(f"🔄 EXPLICIT RESET: Count {old_count} -> 0 | Exercise: '{old_id}' -> '{exercise_id}'")
+        log.info("🔄 EXPLICIT RESET [%s]: Count %s -> 0 | Exercise: '%s' -> '%s'", self.session_id, old_count, old_id, exercise_id,
+                 extra={"session": self.session_id, "exercise": exercise_id})
         self.state = {
             'count': 0,
             'current_stage': None,
@@ -53,13 +120,15 @@ class RepCounter:
             'initialized': True
         }
         self.save_state()
-        print(f"✅ Rep counter reset complete. Starting fresh for '{exercise_id}'")
+        log.debug("✅ Rep counter reset complete. Starting fresh for '%s'", exercise_id)
 
-    def update(self, exercise_id, angles, form_is_valid=True):
+    def update(self, exercise_id, angles, form_is_valid=True, now=None):
+        """`now` overrides the wall clock (offline video uses the frame timestamp)."""
         # Handle exercise switching - reset stage tracking but KEEP rep count
         if exercise_id and self.state['exercise_id'] != exercise_id:
             old_count = self.state.get('count', 0)  # Preserve the count
-            print(f"🔄 Exercise changed: '{self.state['exercise_id']}' -> '{exercise_id}' | Keeping count: {old_count}")
+            log.info("🔄 Exercise changed: '%s' -> '%s' | Keeping count: %s", self.state['exercise_id'], exercise_id, old_count,
+                     extra={"session": self.session_id, "exercise": exercise_id})
             
             # Only reset stage tracking, NOT the rep count
             self.state['current_stage'] = None
@@ -73,72 +142,47 @@ class RepCounter:
             # First detection for this exercise
             self.state['exercise_id'] = exercise_id
             self.state['initialized'] = True
-            print(f"🏋️ Initialized tracking for: {exercise_id} | Current count: {self.state.get('count', 0)}")
+            log.info("🏋️ Initialized tracking for: %s | Current count: %s", exercise_id, self.state.get('count', 0),
+                     extra={"session": self.session_id, "exercise": exercise_id})
             
         config = EXERCISE_CONFIGS.get(exercise_id)
-        if not config or not angles:
+        # An empty dict still counts as a frame: it means none of the exercise's
+        # joints were visible (angles outside the plan are not computed any more)
+        if not config or angles is None:
             return self.state
 
         # DEBUG: Log angles every 60 frames to verify input
         if self.state['total_frames'] % 60 == 0:
-             print(f"📐 ANGLES: {angles}")
+             log.debug("📐 ANGLES: %s", angles)
 
-        stages = config['stages']
-        if len(stages) < 2: return self.state # Needs at least 2 stages to count
+        table = STAGE_TABLES[exercise_id]
+        if len(table.names) < 2: return self.state # Needs at least 2 stages to count
 
-        rest_stage = stages[0]['name']
-        active_stage = stages[1]['name']
+        rest_stage = table.names[0]
+        active_stage = table.names[1]
         
         best_stage = None
         max_score = -1.0
 
-        # === 1. Permissive Joint Scoring ===
-        for stage in stages:
-            mandatory_scores = []
-            limb_scores = [] # For left/right pairs
-            
-            for joint, (min_angle, max_angle) in stage['ranges'].items():
-                if joint in angles:
-                    angle = angles[joint]
-                    if min_angle <= angle <= max_angle:
-                        score = 100
-                    else:
-                        center = (min_angle + max_angle) / 2
-                        span = (max_angle - min_angle)
-                        diff = abs(angle - center) - span/2
-                        score = max(0, 100 - (diff * 2))
-                    
-                    if 'left' in joint or 'right' in joint:
-                        limb_scores.append(score)
-                    else:
-                        mandatory_scores.append(score)
-            
-            m_avg = sum(mandatory_scores)/len(mandatory_scores) if mandatory_scores else 100
-            l_max = max(limb_scores) if limb_scores else 100
-            
-            final_score = (m_avg + l_max) / 2
-            
+        # === 1. Permissive Joint Scoring (compiled tables, see StageTable) ===
+        for stage_name, final_score in zip(table.names, table.scores(angles)):
             if self.state['total_frames'] % 30 == 0:
-                 print(f"   ? Check {stage['name']}: {final_score:.1f}%")
+                 log.debug("   ? Check %s: %.1f%%", stage_name, final_score)
 
             if final_score >= max_score and final_score > 10:  # OPTIMIZED: Very lenient threshold 
                 max_score = final_score
-                best_stage = stage['name']
+                best_stage = stage_name
         
         # DEBUG LOGGING for stage detection
         if best_stage and best_stage != self.state['current_stage']:
-            print(f"👀 Stage Detected: {best_stage.upper()} (Score: {max_score:.1f}%)")
+            log.debug("👀 Stage Detected: %s (Score: %.1f%%)", best_stage.upper(), max_score)
         elif best_stage and self.state['total_frames'] % 30 == 0:
             # Print occasionally to show it's tracking
-            print(f"   ... holding {best_stage} ({max_score:.1f}%)")
+            log.debug("   ... holding %s (%.1f%%)", best_stage, max_score)
 
-        current_time = time.time()
+        current_time = time.time() if now is None else now
         
         if best_stage:
-            # Add minimum hold time to prevent false transitions (debounce)
-            MIN_STAGE_HOLD_TIME = 0.1  # seconds - OPTIMIZED: faster response
-            MIN_FORM_SCORE = 20  # Minimum 20% match - OPTIMIZED: more lenient
-            
             stage_changed = best_stage != self.state['current_stage']
             time_since_transition = current_time - self.state.get('last_transition_time', 0)
             
@@ -146,7 +190,7 @@ class RepCounter:
             if stage_changed and time_since_transition < MIN_STAGE_HOLD_TIME and self.state['current_stage']:
                 # Too quick, ignore this transition (likely noise)
                 if self.state['total_frames'] % 30 == 0:
-                    print(f"   ⏱️ Debouncing: {best_stage} (waiting {MIN_STAGE_HOLD_TIME - time_since_transition:.1f}s)")
+                    log.debug("   ⏱️ Debouncing: %s (waiting %.1fs)", best_stage, MIN_STAGE_HOLD_TIME - time_since_transition)
             else:
                 # Valid stage detection
                 # State Machine for counting: Rest -> Active -> Rest = 1 Rep
@@ -158,9 +202,9 @@ class RepCounter:
                         if max_score >= MIN_FORM_SCORE:
                             self.state['active_hit'] = True
                             self.state['last_transition_time'] = current_time
-                            print(f"🔹 DOWN (Half Rep) - {exercise_id} (Score: {max_score:.1f}%)")
+                            log.debug("🔹 DOWN (Half Rep) - %s (Score: %.1f%%)", exercise_id, max_score)
                         else:
-                            print(f"   ⚠️ Form too poor to count (Score: {max_score:.1f}%)")
+                            log.debug("   ⚠️ Form too poor to count (Score: %.1f%%)", max_score)
                 
                 # If we return to Rest stage (Up) AND we hit active previously
                 elif best_stage == rest_stage:
@@ -170,7 +214,10 @@ class RepCounter:
                         self.state['active_hit'] = False
                         self.state['last_transition_time'] = current_time
                         self.save_state()  # PERSIST STATE
-                        print(f"✅ REP #{self.state['count']} COMPLETE (Score: {max_score:.1f}%)")
+                        log.info("✅ REP #%d COMPLETE (Score: %.1f%%)", self.state['count'], max_score, extra={
+                            "session": self.session_id, "exercise": exercise_id,
+                            "reps": self.state['count'], "score": round(max_score, 1),
+                        })
                 
                 # Update current stage
                 if stage_changed:
@@ -181,15 +228,53 @@ class RepCounter:
                 
                 # Debugging
                 if self.state['total_frames'] % 30 == 0:
-                    print(f"   Status: {best_stage} | Active Hit: {self.state['active_hit']} | Score: {max_score:.1f}%")
+                    log.debug("   Status: %s | Active Hit: %s | Score: %.1f%%", best_stage, self.state['active_hit'], max_score)
         else:
              if self.state['total_frames'] % 30 == 0:
-                 print("   (No pose matching config...)")
+                 log.debug("   (No pose matching config...)")
 
         self.state['total_frames'] += 1
 
 
         return self.state
 
-# Global singleton for simplicity in local dev
-rep_counter = RepCounter()
+class RepCounterStore:
+    """
+    Per-session rep counters. Sessions are keyed by the client's session id
+    (legacy clients without one share DEFAULT_SESSION_ID) and idle sessions are
+    evicted by the underlying SessionStore.
+    """
+
+    def __init__(self, state_file=STATE_FILE, **store_options):
+        self.state_file = state_file
+        self.persistence = StateLog(state_file)  # Write-behind: reps never wait on disk
+        self.load_state()
+        # An evicted session is written out and picked up again from the log when it returns
+        self.sessions = SessionStore(self._create, on_evict=lambda sid, counter: self._save_counter(counter),
+                                     **store_options)
+        self.persistence.start()
+
+    def _create(self, session_id):
+        return RepCounter(session_id, self.persistence.get(session_id), on_save=self._save_counter)
+
+    def _save_counter(self, counter):
+        self.persistence.mark(counter.session_id, counter.state)
+
+    def get(self, session_id=None):
+        return self.sessions.get(session_id)
+
+    def update(self, exercise_id, angles, form_is_valid=True, session_id=None):
+        return self.get(session_id).update(exercise_id, angles, form_is_valid)
+
+    def reset(self, exercise_id=None, session_id=None):
+        self.get(session_id).reset(exercise_id)
+
+    def load_state(self):
+        """Replay the snapshot and state log written by earlier runs."""
+        return self.persistence.load()
+
+    def save_state(self):
+        """Persist every live session now (normally the background flush does this)."""
+        for sid, counter in self.sessions.items():
+            self.persistence.mark(sid, counter.state)
+        self.persistence.flush()
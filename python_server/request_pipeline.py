@@ -0,0 +1,260 @@
+import os
+import queue
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+
+import cv2
+
+from inference_batcher import INFERENCE_BATCH_SIZE
+from pose_pipeline import analyze_cached, decode_image_bytes, evaluate_batch, elapsed_ms
+from server_logging import get_logger
+
+# Request Pipeline
+# Without it each /detect request runs decode -> color conversion -> pose ->
+# angles -> form -> reps on its own thread, one step after another. With
+# REQUEST_PIPELINE=1 a frame moves through three stages joined by bounded
+# queues instead, so one frame's decode overlaps another's inference:
+#
+#   decode      PIPELINE_DECODE_THREADS threads: frame cache lookup, JPEG
+#               decode and BGR -> RGB (OpenCV releases the GIL for both)
+#   inference   PIPELINE_INFERENCE_WORKERS threads: crop/resize, pose.process,
+#               landmark packing
+#   post        one thread: whatever frames are waiting go through angles and
+#               form as one batch (pose_pipeline.evaluate_batch), then reps,
+#               in queue order, then the frame cache is updated
+#
+# Decode and inference threads each own the sessions that hash to them, so a
+# session's frames stay in order all the way to its Pose graph, smoother and
+# rep counter. A full entry queue answers 503 right away instead of queueing
+# more work; the queues between stages block, so a slow stage pushes back on
+# the ones before it. Frame cache hits skip decoding and inference (they still
+# pass through their session's inference queue to keep their place).
+#
+#   REQUEST_PIPELINE=0              1 = staged pipeline for in-process inference
+#   PIPELINE_DECODE_THREADS=2       decode + color conversion threads
+#   PIPELINE_INFERENCE_WORKERS=1    inference threads
+#   PIPELINE_QUEUE_SIZE=8           frames each stage's queue holds
+
+REQUEST_PIPELINE = os.environ.get('REQUEST_PIPELINE', '0').lower() in ('1', 'true', 'yes')
+PIPELINE_DECODE_THREADS = int(os.environ.get('PIPELINE_DECODE_THREADS', 2))
+PIPELINE_INFERENCE_WORKERS = int(os.environ.get('PIPELINE_INFERENCE_WORKERS', 1))
+PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', 8))
+PIPELINE_RESULT_TIMEOUT = 10  # seconds
+STAGES = ('decode', 'inference', 'post')
+
+log = get_logger('pipeline')
+
+
+class PipelineFull(Exception):
+    """Raised when the pipeline's entry queue is full."""
+
+
+class FrameJob:
+    __slots__ = ('future', 'buffer', 'exercise_id', 'session_id', 'signature', 'cached', 'img', 'result',
+                 'packed', 'timings', 'queued_at')
+
+    def __init__(self, buffer, exercise_id, session_id):
+        self.future = Future()
+        self.buffer = buffer
+        self.exercise_id = exercise_id
+        self.session_id = session_id
+        self.signature = None
+        self.cached = None   # frame_cache.CachedPose for a near-duplicate frame
+        self.img = None      # Decoded RGB frame
+        self.result = None
+        self.packed = None
+        self.timings = {}
+        self.queued_at = time.perf_counter()
+
+    def waited(self, stage):
+        """Record the time since the job was queued for `stage`."""
+        now = time.perf_counter()
+        self.timings[f"queue_{stage}"] = (now - self.queued_at) * 1000
+        return now
+
+
+class RequestPipeline:
+    """
+    `detect(rgb, exercise_id, session_id)` runs inference on one decoded RGB
+    frame and returns (result, packed landmarks or None), as
+    pose_pipeline.detect_pose with is_rgb=True; `counters` is the
+    RepCounterStore reps are counted in.
+    """
+
+    def __init__(self, detect, counters, frame_cache=None, decode_threads=PIPELINE_DECODE_THREADS,
+                 inference_workers=PIPELINE_INFERENCE_WORKERS, queue_size=PIPELINE_QUEUE_SIZE,
+                 batch_size=INFERENCE_BATCH_SIZE):
+        self._detect = detect
+        self._counters = counters
+        self._frame_cache = frame_cache
+        self.queue_size = max(1, queue_size)
+        self.batch_size = max(1, batch_size)
+        self._decode = [queue.Queue(self.queue_size) for _ in range(max(1, decode_threads))]
+        self._inference = [queue.Queue(self.queue_size) for _ in range(max(1, inference_workers))]
+        self._post = queue.Queue(self.queue_size)
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.post_batches = 0
+        self._frames = dict.fromkeys(STAGES, 0)
+        self._busy = dict.fromkeys(STAGES, 0.0)  # seconds
+        self._threads = {'decode': len(self._decode), 'inference': len(self._inference), 'post': 1}
+
+        for index, jobs in enumerate(self._decode):
+            threading.Thread(target=self._decode_loop, args=(jobs,), name=f'pipeline-decode-{index}',
+                             daemon=True).start()
+        for index, jobs in enumerate(self._inference):
+            threading.Thread(target=self._inference_loop, args=(jobs,), name=f'pipeline-inference-{index}',
+                             daemon=True).start()
+        threading.Thread(target=self._post_loop, name='pipeline-post', daemon=True).start()
+        log.info("🚰 Request pipeline started: %d decode, %d inference thread(s)",
+                 self._threads['decode'], self._threads['inference'])
+
+    def submit(self, buffer, exercise_id, session_id):
+        """
+        Queue an encoded frame; the Future resolves to its result dict, or None
+        if the bytes are not an image. Raises PipelineFull when the session's
+        decode queue is full.
+        """
+        job = FrameJob(buffer, exercise_id, session_id)
+        try:
+            self._route(self._decode, session_id).put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise PipelineFull("Request pipeline queue full") from None
+        return job.future
+
+    def process(self, buffer, exercise_id, session_id):
+        """Blocking helper: submit and wait for the result."""
+        return self.submit(buffer, exercise_id, session_id).result(timeout=PIPELINE_RESULT_TIMEOUT)
+
+    @staticmethod
+    def _route(queues, session_id):
+        """The queue of `queues` that owns a session (its frames must not overtake each other)."""
+        key = (session_id or 'default').encode('utf-8')
+        return queues[zlib.crc32(key) % len(queues)]
+
+    def _done(self, stage, started, frames=1):
+        with self._lock:
+            self._frames[stage] += frames
+            self._busy[stage] += time.perf_counter() - started
+
+    def _forward(self, jobs, job):
+        job.queued_at = time.perf_counter()
+        jobs.put(job)
+
+    def _decode_loop(self, jobs):
+        while True:
+            job = jobs.get()
+            started = job.waited('decode')
+            try:
+                if self._frame_cache is not None:
+                    job.signature, job.cached = self._frame_cache.match(job.session_id, job.exercise_id, job.buffer)
+                    job.timings["hash"] = elapsed_ms(started)
+                if job.cached is None:
+                    mark = time.perf_counter()
+                    img = decode_image_bytes(job.buffer)
+                    if img is None:
+                        job.future.set_result(None)
+                        continue
+                    job.timings["decode"] = elapsed_ms(mark)
+                    mark = time.perf_counter()
+                    job.img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+                    job.timings["color"] = elapsed_ms(mark)
+            except Exception as e:
+                log.exception("Error decoding frame: %s", e, extra={"session": job.session_id})
+                job.future.set_exception(e)
+                continue
+            finally:
+                self._done('decode', started)
+            job.buffer = None  # The request keeps its own reference until the result arrives
+            self._forward(self._route(self._inference, job.session_id), job)
+
+    def _inference_loop(self, jobs):
+        while True:
+            job = jobs.get()
+            if job.cached is not None:
+                self._forward(self._post, job)  # Behind the session's earlier frames
+                continue
+            started = job.waited('inference')
+            try:
+                job.result, job.packed = self._detect(job.img, job.exercise_id, job.session_id)
+            except Exception as e:
+                log.exception("Error in inference: %s", e, extra={"session": job.session_id})
+                job.future.set_exception(e)
+                continue
+            finally:
+                job.img = None
+                self._done('inference', started)
+            self._forward(self._post, job)
+
+    def _post_loop(self):
+        while True:
+            batch = [self._post.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._post.get_nowait())
+                except queue.Empty:
+                    break
+            started = time.perf_counter()
+            try:
+                self._evaluate(batch)
+            except Exception as e:
+                log.exception("Error in post-processing: %s", e)
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+            self._done('post', started, len(batch))
+            with self._lock:
+                self.post_batches += 1
+
+    def _evaluate(self, batch):
+        for job in batch:
+            job.waited('post')
+        # Cache hits and freshly inferred frames go through the rep counters in queue order
+        inferred = []
+        for job in batch:
+            if job.cached is not None:
+                self._flush(inferred)
+                inferred = []
+                job.result = analyze_cached(job.cached, job.exercise_id, job.session_id, self._counters)
+            else:
+                inferred.append(job)
+        self._flush(inferred)
+
+        for job in batch:
+            result = job.result
+            result["timings"] = {**job.timings, **result["timings"]}
+            if job.cached is None and self._frame_cache is not None:
+                self._frame_cache.store(job.session_id, job.signature, job.exercise_id, result)
+            job.future.set_result(result)
+
+    def _flush(self, jobs):
+        evaluate_batch([(job.result, job.packed, job.exercise_id, job.session_id)
+                        for job in jobs if job.packed is not None], self._counters)
+
+    def stats(self):
+        queues = {'decode': sum(q.qsize() for q in self._decode), 'inference': sum(q.qsize() for q in self._inference),
+                  'post': self._post.qsize()}
+        with self._lock:
+            frames = dict(self._frames)
+            return {
+                "stages": {
+                    stage: {
+                        "threads": self._threads[stage],
+                        "queue_depth": queues[stage],
+                        "frames": frames[stage],
+                        "mean_ms": round(self._busy[stage] * 1000 / frames[stage], 2) if frames[stage] else 0,
+                    }
+                    for stage in STAGES
+                },
+                "queue_size": self.queue_size,
+                "rejected": self.rejected,
+                "mean_post_batch": round(frames['post'] / self.post_batches, 2) if self.post_batches else 0,
+            }
+
+
+def create_pipeline(detect, counters, frame_cache=None):
+    return RequestPipeline(detect, counters, frame_cache) if REQUEST_PIPELINE else None
@@ -0,0 +1,125 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+# Server Logging
+# Request threads only format a record and drop it on a bounded queue; one
+# listener thread does the stdout writes. Per-frame detail is DEBUG (enable with
+# DEBUG_LOGS=1) and per-frame status lines are sampled per session, so logging
+# can stay on in production without adding latency to /detect.
+#
+#   LOG_LEVEL=INFO          DEBUG / INFO / WARNING / ERROR
+#   DEBUG_LOGS=1            shortcut for LOG_LEVEL=DEBUG (the old print detail)
+#   LOG_FORMAT=text         or "json" for one structured object per line
+#   LOG_SAMPLE_EVERY=30     per-session status line every N frames (1 = all)
+
+DEBUG_LOGS = os.environ.get('DEBUG_LOGS', '').lower() in ('1', 'true', 'yes')
+LOG_LEVEL = 'DEBUG' if DEBUG_LOGS else os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+LOG_SAMPLE_EVERY = max(1, int(os.environ.get('LOG_SAMPLE_EVERY', 30)))
+LOG_QUEUE_SIZE = 10000  # records; beyond this new records are dropped, never waited on
+
+ROOT_LOGGER = 'trainer'
+STRUCTURED_FIELDS = ('session', 'exercise', 'stage', 'reps', 'score', 'latency_ms', 'status')
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller: a full queue drops the record."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SessionSampler:
+    """`sampler(session_id)` is True once every `every` calls for that session."""
+
+    MAX_KEYS = 4096
+
+    def __init__(self, every=LOG_SAMPLE_EVERY):
+        self.every = every
+        self._counts = {}
+
+    def __call__(self, session_id):
+        count = self._counts.get(session_id, 0)
+        if len(self._counts) >= self.MAX_KEYS and count == 0:
+            self._counts.clear()  # Forget departed sessions; costs at most one extra line each
+        self._counts[session_id] = count + 1
+        return count % self.every == 0
+
+
+_handler = None
+_listener = None
+_configure_lock = threading.Lock()
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """Install the queue handler on the 'trainer' logger (idempotent; re-call to change level)."""
+    global _handler, _listener
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level)
+    with _configure_lock:
+        if _handler is not None:
+            return root
+        output = logging.StreamHandler(sys.stdout)
+        if fmt == 'json':
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter('%(message)s'))
+        _handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=False)
+        _listener.start()
+        root.addHandler(_handler)
+        root.propagate = False
+        atexit.register(_listener.stop)  # Drain what is queued before exit
+    return root
+
+
+def get_logger(name):
+    configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def stats():
+    return {
+        "level": logging.getLevelName(logging.getLogger(ROOT_LOGGER).level),
+        "queued": _handler.queue.qsize() if _handler else 0,
+        "dropped": _handler.dropped if _handler else 0,
+        "sample_every": LOG_SAMPLE_EVERY,
+    }
+
+
+def flush(timeout=1.0):
+    """Wait (briefly) for the listener to drain the queue. For CLIs, not the request path."""
+    deadline = time.monotonic() + timeout
+    while _handler and not _handler.queue.empty() and time.monotonic() < deadline:
+        time.sleep(0.01)
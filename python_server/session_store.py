@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from server_logging import get_logger
+
+# Session Store
+# Keeps one small object per client session (rep state, trackers, caches...)
+# so concurrent trainees on the same process never share state.
+# Memory is bounded two ways: idle sessions are evicted after a timeout and
+# the least recently used session is dropped once the cap is reached.
+
+DEFAULT_SESSION_ID = 'default'
+MAX_SESSIONS = int(os.environ.get('MAX_SESSIONS', 256))
+SESSION_IDLE_TIMEOUT = float(os.environ.get('SESSION_IDLE_TIMEOUT', 900))  # seconds
+SWEEP_INTERVAL = 30  # seconds between idle sweeps
+
+log = get_logger('sessions')
+
+
+def normalize_session_id(session_id):
+    """Fall back to the shared default session for legacy clients."""
+    if session_id is None:
+        return DEFAULT_SESSION_ID
+    session_id = str(session_id).strip()
+    return session_id[:64] or DEFAULT_SESSION_ID
+
+
+class SessionStore:
+    """
+    Thread-safe LRU map of session_id -> object.
+    Objects are created lazily by `factory(session_id)`. `on_evict(session_id, obj)`
+    is called (outside the lock) whenever an object is dropped.
+    """
+
+    def __init__(self, factory, max_sessions=MAX_SESSIONS, idle_timeout=SESSION_IDLE_TIMEOUT, on_evict=None):
+        self.factory = factory
+        self.max_sessions = max(1, max_sessions)
+        self.idle_timeout = idle_timeout
+        self.on_evict = on_evict
+        self._items = OrderedDict()  # session_id -> [obj, last_seen]
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.evictions = 0
+
+    def get(self, session_id):
+        """Return the object for a session, creating it if needed."""
+        session_id = normalize_session_id(session_id)
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            entry = self._items.get(session_id)
+            if entry is None:
+                entry = [self.factory(session_id), now]
+                self._items[session_id] = entry
+            else:
+                entry[1] = now
+                self._items.move_to_end(session_id)
+            evicted.extend(self._evict_locked(now))
+        self._notify(evicted)
+        return entry[0]
+
+    def peek(self, session_id):
+        """Return the object for a session without creating or touching it."""
+        with self._lock:
+            entry = self._items.get(normalize_session_id(session_id))
+            return entry[0] if entry else None
+
+    def put(self, session_id, obj):
+        session_id = normalize_session_id(session_id)
+        now = time.monotonic()
+        with self._lock:
+            self._items[session_id] = [obj, now]
+            self._items.move_to_end(session_id)
+            evicted = self._evict_locked(now)
+        self._notify(evicted)
+
+    def discard(self, session_id):
+        session_id = normalize_session_id(session_id)
+        with self._lock:
+            entry = self._items.pop(session_id, None)
+        if entry:
+            self._notify([(session_id, entry[0])])
+
+    def items(self):
+        """Snapshot of (session_id, obj) pairs, oldest first."""
+        with self._lock:
+            return [(sid, entry[0]) for sid, entry in self._items.items()]
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, session_id):
+        return normalize_session_id(session_id) in self._items
+
+    def stats(self):
+        return {
+            "sessions": len(self._items),
+            "max_sessions": self.max_sessions,
+            "idle_timeout": self.idle_timeout,
+            "evictions": self.evictions,
+        }
+
+    def sweep(self):
+        """Evict idle sessions now instead of at the next periodic sweep."""
+        with self._lock:
+            evicted = self._sweep_locked(time.monotonic())
+            self.evictions += len(evicted)
+        self._notify(evicted)
+
+    def _sweep_locked(self, now):
+        # Cheap: oldest entries sit at the front
+        self._last_sweep = now
+        evicted = []
+        while self._items:
+            sid, entry = next(iter(self._items.items()))
+            if now - entry[1] < self.idle_timeout:
+                break
+            self._items.popitem(last=False)
+            evicted.append((sid, entry[0]))
+        return evicted
+
+    def _evict_locked(self, now):
+        evicted = []
+        # Idle sweep
+        if now - self._last_sweep >= SWEEP_INTERVAL:
+            evicted.extend(self._sweep_locked(now))
+        # Hard cap (LRU)
+        while len(self._items) > self.max_sessions:
+            sid, entry = self._items.popitem(last=False)
+            evicted.append((sid, entry[0]))
+        self.evictions += len(evicted)
+        return evicted
+
+    def _notify(self, evicted):
+        if not self.on_evict:
+            return
+        for sid, obj in evicted:
+            try:
+                self.on_evict(sid, obj)
+            except Exception as e:
+                log.warning("⚠️ Session eviction hook failed for '%s': %s", sid, e)
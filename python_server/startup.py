@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from server_logging import get_logger
+
+# Startup
+# A cold process pays for its imports (Flask ~0.2s, OpenCV, NumPy, MediaPipe
+# ~1s), the exercise tables built on import, and for every new Pose graph's
+# first frame, which initialises the model runtime (~10x a normal frame).
+# main.py times the imports as it goes and then warms up in the background:
+# MediaPipe is imported and the graphs that will serve the first sessions
+# are built and run on a synthetic frame (pose_pipeline.warm_pose). /health
+# answers 503 until that has finished, so a load balancer only routes to a
+# warm process. The breakdown is logged once ready and served as "startup"
+# on /metrics.
+#
+#   WARMUP=1     0 = ready right after import (graphs are built on first use)
+
+WARMUP = os.environ.get('WARMUP', '1').lower() in ('1', 'true', 'yes')
+PROCESS_STARTED = time.perf_counter()  # First thing main.py imports
+
+log = get_logger('startup')
+
+
+class StartupReport:
+    """Named startup phases (seconds, in order) and whether the process is ready to serve."""
+
+    def __init__(self, started=PROCESS_STARTED):
+        self.started = started
+        self.phases = {}
+        self.error = None
+        self.ready_after = None  # seconds since start
+        self._last = started
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def lap(self, name):
+        """Record the time since the previous lap as `name` (import sequence on the main thread)."""
+        now = time.perf_counter()
+        self._add(name, now - self._last)
+        self._last = now
+
+    @contextmanager
+    def phase(self, name):
+        """`with report.phase(name):` time one step (warm-up runs on its own thread)."""
+        mark = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, time.perf_counter() - mark)
+
+    def _add(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def mark_ready(self):
+        self.ready_after = time.perf_counter() - self.started
+        self._done.set()
+        with self._lock:
+            breakdown = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        log.info("🚀 Ready %.2fs after start (%s)", self.ready_after, breakdown)
+
+    def mark_failed(self, error):
+        self.error = str(error)
+        self._done.set()
+        log.error("❌ Warm-up failed: %s", error)
+
+    @property
+    def ready(self):
+        return self._done.is_set() and self.error is None
+
+    def wait(self, timeout=None):
+        """Block until warm-up has finished; True if the process is ready."""
+        self._done.wait(timeout)
+        return self.ready
+
+    def summary(self):
+        with self._lock:
+            phases = {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()}
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "ready_after_s": round(self.ready_after, 3) if self.ready_after is not None else None,
+            "phases_ms": phases,
+        }
@@ -0,0 +1,179 @@
+import atexit
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from session_store import DEFAULT_SESSION_ID
+from server_logging import get_logger
+
+# Write-Behind State Log
+# Rep state used to be rewritten as one JSON file, synchronously, on every rep.
+# Now request threads only record "session X changed" in memory; a background
+# thread appends the latest state of each changed session to an append-only
+# log every STATE_FLUSH_INTERVAL seconds and, every STATE_COMPACT_EVERY
+# records, folds the log into the snapshot file (written to a temp file and
+# renamed, so a crash never leaves a half-written snapshot).
+#
+#   reps_state.json       snapshot {"sessions": {session_id: state}}
+#   reps_state.json.log   one {"s": session_id, "state": {...}} per line
+
+STATE_FLUSH_INTERVAL = float(os.environ.get('STATE_FLUSH_INTERVAL', 2.0))  # seconds
+STATE_COMPACT_EVERY = int(os.environ.get('STATE_COMPACT_EVERY', 500))  # log records
+STATE_MAX_SESSIONS = int(os.environ.get('STATE_MAX_SESSIONS', 10000))  # persisted sessions kept
+
+log = get_logger('state')
+
+
+class StateLog:
+    """Snapshot + append-only log for per-session state, flushed off the request path."""
+
+    def __init__(self, path, flush_interval=STATE_FLUSH_INTERVAL, compact_every=STATE_COMPACT_EVERY,
+                 max_sessions=STATE_MAX_SESSIONS):
+        self.path = path
+        self.log_path = path + '.log'
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self.max_sessions = max_sessions
+        self._persisted = OrderedDict()  # session_id -> last state written (oldest first)
+        self._dirty = {}                 # session_id -> state waiting for the next flush
+        self._lock = threading.Lock()    # Guards _dirty
+        self._io_lock = threading.Lock()  # One writer for the files
+        self._wake = threading.Event()
+        self._log_records = 0
+        self._closed = False
+        self.flushes = 0
+        self.compactions = 0
+        self._thread = None
+
+    # --- Startup ---
+
+    def load(self):
+        """Replay snapshot + log. Returns {session_id: state}."""
+        sessions = {}
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                sessions = data['sessions'] if 'sessions' in data else {DEFAULT_SESSION_ID: data}  # Legacy single-session file
+        except Exception as e:
+            log.warning("⚠️ Failed to load state snapshot: %s", e)
+
+        replayed = 0
+        try:
+            if os.path.exists(self.log_path):
+                with open(self.log_path, 'r') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            break  # Torn last line from a crash
+                        sessions[record['s']] = record['state']
+                        replayed += 1
+        except Exception as e:
+            log.warning("⚠️ Failed to replay state log: %s", e)
+
+        self._persisted = OrderedDict(sessions)
+        self._log_records = replayed
+        if sessions:
+            log.info("📂 Loaded saved rep state (%d sessions, %d log records)", len(sessions), replayed)
+        return dict(sessions)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    # --- Hot path ---
+
+    def mark(self, session_id, state):
+        """Record a session's new state; it reaches disk on the next flush."""
+        with self._lock:
+            self._dirty[session_id] = dict(state)
+
+    def get(self, session_id):
+        """Latest state recorded for a session (pending or on disk), or None."""
+        with self._lock:
+            state = self._dirty.get(session_id)
+            if state is None:
+                state = self._persisted.get(session_id)
+            return dict(state) if state is not None else None
+
+    # --- Background ---
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        with self._io_lock:
+            try:
+                with open(self.log_path, 'a') as f:
+                    f.write(''.join(
+                        json.dumps({"s": sid, "state": state}, separators=(',', ':')) + '\n'
+                        for sid, state in dirty.items()))
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception as e:
+                log.warning("⚠️ Failed to save state: %s", e)
+                with self._lock:
+                    for sid, state in dirty.items():
+                        self._dirty.setdefault(sid, state)  # Retry next flush, newer marks win
+                return
+            for sid, state in dirty.items():
+                self._persisted.pop(sid, None)
+                self._persisted[sid] = state
+            self._log_records += len(dirty)
+            self.flushes += 1
+            if self._log_records >= self.compact_every:
+                self._compact_locked()
+
+    def compact(self):
+        with self._io_lock:
+            self._compact_locked()
+
+    def _compact_locked(self):
+        while len(self._persisted) > self.max_sessions:
+            self._persisted.popitem(last=False)
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({'sessions': self._persisted}, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            # The snapshot now holds everything in the log
+            open(self.log_path, 'w').close()
+        except Exception as e:
+            log.warning("⚠️ Failed to compact state: %s", e)
+            return
+        self._log_records = 0
+        self.compactions += 1
+
+    def close(self):
+        """Flush pending changes and compact (called at interpreter exit)."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self.flush()
+        if self._log_records:
+            self.compact()
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._dirty)
+        return {
+            "pending": pending,
+            "persisted_sessions": len(self._persisted),
+            "log_records": self._log_records,
+            "flushes": self.flushes,
+            "compactions": self.compactions,
+        }
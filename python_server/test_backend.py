@@ -1,5 +1,4 @@
 from exercise_configs import EXERCISE_CONFIGS
-import inspect
 
 print("=" * 60)
 print("COMPREHENSIVE BACKEND VALIDATION TEST")
@@ -47,24 +46,16 @@ print(f"  Time-based:               {time_based:3}")
 print("\n✅ Test 4: Form Validation Coverage")
 print("-" * 60)
 
-import form_validator
-source = inspect.getsource(form_validator.validate_form)
-
-# Extract exercise IDs that have validation
-validated_exercises = set()
-for line in source.split('\n'):
-    if "exercise_id ==" in line or "exercise_id in" in line:
-        # Extract exercise IDs from the line
-        if "'" in line:
-            parts = line.split("'")
-            for i in range(1, len(parts), 2):
-                ex_id = parts[i]
-                if ex_id in EXERCISE_CONFIGS:
-                    validated_exercises.add(ex_id)
+from form_validator import form_coverage
+coverage = form_coverage()
+validated_exercises = set(coverage['validated'])
 
 coverage_pct = (len(validated_exercises) / total) * 100
 print(f"  Exercises with validation: {len(validated_exercises)}/{total}")
 print(f"  Coverage:                  {coverage_pct:.1f}%")
+print(f"  Form rules:                {coverage['rules']}")
+if coverage['unknown']:
+    print(f"  ❌ Rules for unknown exercises: {coverage['unknown']}")
 print(f"\n  Validated exercises:")
 for ex in sorted(validated_exercises):
     print(f"    • {ex}")
@@ -103,6 +94,166 @@ if narrow_ranges:
 else:
     print("  ✅ All angle ranges are sufficiently wide")
 
+# Test 7: Angle Plans
+print("\n📐 Test 7: Angle Plans")
+print("-" * 60)
+from angle_calculator import ANGLE_PLANS, check_angle_plans
+
+plan_problems = check_angle_plans()
+if plan_problems:
+    for problem in plan_problems:
+        print(f"  ❌ {problem}")
+else:
+    print("  ✅ Every stage angle is covered by its exercise's angle plan")
+avg_plan = sum(len(p.angle_names) for p in ANGLE_PLANS.values()) / len(ANGLE_PLANS)
+print(f"  Average angles computed per frame: {avg_plan:.1f} (of 9)")
+
+# Test 8: Frames Without Visible Plan Joints
+print("\n🙈 Test 8: Frames Without Visible Plan Joints")
+print("-" * 60)
+# An exercise's angles dict is empty when none of its plan's joints are
+# visible; landmark rules (angle defaults) and the rep counter must still run
+import numpy as np
+from angle_calculator import get_exercise_angles
+from form_validator import validate_form
+from rep_counter import RepCounter
+
+hidden = np.zeros((33, 4))
+hidden[:, 0] = np.linspace(0.2, 0.8, 33)
+hidden[:, 1] = np.linspace(0.1, 0.9, 33)  # Visibility column stays 0
+hidden_problems = []
+for ex_id, expected in (('downward-dog', 'Adjust hips - form inverted V'), ('kb_swing', 'Hinge at hips - explosive drive')):
+    hidden_angles = get_exercise_angles(hidden, ex_id)
+    feedback = validate_form(ex_id, hidden, hidden_angles)
+    if hidden_angles or expected not in feedback:
+        hidden_problems.append(f"{ex_id}: angles {hidden_angles}, feedback {feedback}")
+hidden_counter = RepCounter('hidden-joints')
+hidden_counter.update('kb_swing', get_exercise_angles(hidden, 'kb_swing'), False, now=1.0)
+if hidden_counter.state['total_frames'] != 1:
+    hidden_problems.append("kb_swing: rep counter skipped a frame with empty angles")
+if hidden_problems:
+    for problem in hidden_problems:
+        print(f"  ❌ {problem}")
+else:
+    print("  ✅ Form rules and rep counting still run when no plan joint is visible")
+
+# Test 9: Admission Without Session Ids
+print("\n🚦 Test 9: Admission Without Session Ids")
+print("-" * 60)
+# Legacy clients send no sessionId and all map to the default session; two of
+# them sending at once must not supersede each other or hit the session limit
+import threading
+from admission import AdmissionController, Rejected
+
+gate = AdmissionController(concurrency=1, budget_ms=5000, session_limit=1)
+outcomes = []
+release = threading.Event()
+
+def legacy_client():
+    try:
+        ticket = gate.enter(None)
+    except Rejected as e:
+        outcomes.append(e.status)
+        return
+    admitted = gate.wait(ticket)
+    outcomes.append(ticket.state if admitted else f"skipped ({ticket.state})")
+    if admitted:
+        release.wait(5)
+    gate.leave(ticket)
+
+legacy_clients = [threading.Thread(target=legacy_client) for _ in range(3)]
+for client in legacy_clients:
+    client.start()
+while gate.running + len(gate._queue) < 3 and len(outcomes) < 3:
+    release.wait(0.01)
+release.set()
+for client in legacy_clients:
+    client.join()
+admission_problems = [outcome for outcome in outcomes if outcome != 'running']
+if admission_problems:
+    print(f"  ❌ Anonymous frames refused or skipped: {admission_problems}")
+else:
+    print(f"  ✅ {len(outcomes)} concurrent clients without a session id were all served")
+
+named = gate.enter('named-session')
+newer = gate.enter('named-session')
+if named.state != 'superseded':
+    admission_problems.append("named session: older waiting frame not superseded")
+    print("  ❌ A named session's older waiting frame was not superseded")
+for ticket in (named, newer):
+    gate.leave(ticket)
+
+# Test 10: Frame Skipping Behind Admission Control
+print("\n⏭️  Test 10: Frame Skipping Behind Admission Control")
+print("-" * 60)
+# Admission keeps running inferences down to its slots (one per CPU by
+# default), so the scheduler skips on the gate's queueing pressure instead
+import os
+import time
+from admission import ADMIT_LATENCY_BUDGET_MS
+from frame_scheduler import FrameScheduler
+
+gate = AdmissionController(os.cpu_count() or 1)  # Defaults as main.py builds it in-process
+first = gate.enter('skip-probe')
+gate.wait(first)
+time.sleep(0.15)  # One 150 ms frame sets the service time
+gate.leave(first)
+tickets = []
+for index in range(3 * gate.concurrency):  # Every slot busy, two rounds queued behind them
+    ticket = gate.enter(f'skip-load-{index}')
+    if index < gate.concurrency:
+        gate.wait(ticket)
+    tickets.append(ticket)
+pressure = gate.pressure()
+
+clock = [0.0]
+frame_scheduler = FrameScheduler(clock=lambda: clock[0])
+frame_scheduler.observe('skip-probe', 'squats', {"landmarks": hidden, "feedback": [], "rep_count": 0})
+clock[0] = 0.01
+skipped = frame_scheduler.extrapolate('skip-probe', 'squats', pressure)
+for ticket in tickets:
+    gate.leave(ticket)
+skip_problems = []
+if skipped is None:
+    skip_problems.append(f"pressure {pressure:.2f} with {gate.concurrency} slot(s) did not skip")
+    print(f"  ❌ No frame skipped at pressure {pressure:.2f} ({ADMIT_LATENCY_BUDGET_MS:.0f} ms budget)")
+else:
+    print(f"  ✅ Frames are extrapolated at pressure {pressure:.2f} with {gate.concurrency} admission slot(s)")
+
+# Test 11: More Sessions Than Pose Trackers
+print("\n🧍 Test 11: More Sessions Than Pose Trackers")
+print("-" * 60)
+# A session arriving at a full pool must not close an active session's graph
+# (both would rebuild one on every frame); it runs on the shared graph instead
+from tracker_pool import TrackerPool
+
+class StubGraph:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+trackers = TrackerPool(max_trackers=2, idle_timeout=0.2, factory=StubGraph, spares=0)
+first, second = trackers.get('tracked-1'), trackers.get('tracked-2')
+pool_problems = []
+if trackers.get('extra') is not None:
+    pool_problems.append("a third session got a tracker from a full pool")
+if trackers.get('tracked-1') is not first or trackers.get('tracked-2') is not second or first.pose.closed:
+    pool_problems.append("an active session lost its tracker")
+time.sleep(0.25)
+trackers.get('tracked-2')
+if trackers.get('extra') is None or not first.pose.closed:
+    pool_problems.append("an idle session's tracker was not handed over")
+pool_stats = trackers.stats()
+if pool_stats['created'] != 3 or pool_stats['shared_frames'] != 1:
+    pool_problems.append(f"{pool_stats['created']} graphs built, {pool_stats['shared_frames']} shared frame(s)")
+
+if pool_problems:
+    for problem in pool_problems:
+        print(f"  ❌ {problem}")
+else:
+    print("  ✅ Extra sessions share a graph until a tracker goes idle; no graph is rebuilt")
+
 # Final Summary
 print("\n" + "=" * 60)
 print("FINAL SUMMARY")
@@ -111,6 +262,18 @@ print("=" * 60)
 issues = []
 if broken:
     issues.append(f"❌ {len(broken)} exercise(s) with identical stages")
+if plan_problems:
+    issues.append(f"❌ {len(plan_problems)} angle plan problem(s)")
+if hidden_problems:
+    issues.append(f"❌ {len(hidden_problems)} frame(s) without visible joints handled differently")
+if admission_problems:
+    issues.append(f"❌ {len(admission_problems)} admission problem(s)")
+if skip_problems:
+    issues.append("❌ Frame skipping never triggers behind admission control")
+if pool_problems:
+    issues.append(f"❌ {len(pool_problems)} pose tracker pool problem(s)")
+if coverage['unknown']:
+    issues.append(f"❌ Form rules for {len(coverage['unknown'])} unknown exercise(s)")
 if coverage_pct < 50:
     issues.append(f"⚠️  Low form validation coverage ({coverage_pct:.1f}%)")
 
@@ -0,0 +1,142 @@
+import os
+import threading
+
+from session_store import SessionStore
+from pose_pipeline import create_pose, warm_pose
+from server_logging import get_logger
+
+# Per-Session Pose Trackers
+# With static_image_mode=False a Pose graph carries temporal tracking state.
+# Sharing one graph between users makes every interleaved frame look like a
+# new person, so the graph keeps falling back to full detection. Each session
+# gets its own graph here, up to POSE_TRACKERS. A graph is only closed once its
+# session has been idle for TRACKER_IDLE_TIMEOUT: closing one still in use would
+# make two sessions rebuild a graph (hundreds of ms each) over and over. A
+# session arriving while every graph is in use runs on the shared graph
+# instead (see TrackerPool.get) until one frees up.
+# A graph's first frame is ~10x slower than the rest, so POSE_TRACKER_SPARES
+# warmed graphs are kept ready (built at startup, refilled in the background
+# whenever a new session takes one).
+
+POSE_TRACKERS = int(os.environ.get('POSE_TRACKERS', 4))  # 0 = one shared graph
+POSE_TRACKER_SPARES = int(os.environ.get('POSE_TRACKER_SPARES', 1))
+TRACKER_IDLE_TIMEOUT = float(os.environ.get('TRACKER_IDLE_TIMEOUT', 120))  # seconds
+
+log = get_logger('trackers')
+
+
+class SessionTracker:
+    __slots__ = ('pose', 'lock', 'frames', 'tracking', 'losses', 'redetections')
+
+    def __init__(self, pose):
+        self.pose = pose
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.tracking = False   # Did the previous frame yield landmarks?
+        self.losses = 0         # Tracked -> no landmarks
+        self.redetections = 0   # Frames run without a track to follow
+
+
+class TrackerPool:
+    def __init__(self, max_trackers=POSE_TRACKERS, idle_timeout=TRACKER_IDLE_TIMEOUT, factory=create_pose,
+                 spares=POSE_TRACKER_SPARES):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self.spares = max(0, spares)
+        self._spares = []  # Warmed graphs for new sessions
+        self._refilling = False
+        self.spares_used = 0
+        self.created = 0
+        self.frames = 0
+        self.losses = 0
+        self.redetections = 0
+        self.shared_frames = 0  # Frames sent to the shared graph because the pool was full
+        self.sessions = SessionStore(
+            self._create,
+            max_sessions=max_trackers,
+            idle_timeout=idle_timeout,
+            on_evict=self._close,
+        )
+
+    def _create(self, session_id):
+        self.created += 1
+        with self._lock:
+            spare = self._spares.pop() if self._spares else None
+        if spare is None:
+            return SessionTracker(self._factory())
+        self.spares_used += 1
+        self._refill_later()
+        return SessionTracker(spare)
+
+    def prefill(self):
+        """Build and warm graphs until POSE_TRACKER_SPARES are ready (blocking)."""
+        while True:
+            with self._lock:
+                if len(self._spares) >= self.spares:
+                    return
+            pose = warm_pose(self._factory())
+            with self._lock:
+                self._spares.append(pose)
+
+    def _refill_later(self):
+        with self._lock:
+            if self._refilling:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, name='tracker-refill', daemon=True).start()
+
+    def _refill(self):
+        try:
+            self.prefill()
+        except Exception as e:
+            log.warning("⚠️ Could not warm a spare pose tracker: %s", e)
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def _close(self, session_id, tracker):
+        with tracker.lock:
+            tracker.pose.close()
+        log.info("♻️ Closed pose tracker for session '%s' (%d frames, %d losses)", session_id, tracker.frames, tracker.losses)
+
+    def get(self, session_id):
+        """
+        The session's tracker, or None when every tracker belongs to another
+        active session: the caller then uses the shared graph for this frame.
+        """
+        sessions = self.sessions
+        if session_id not in sessions and len(sessions) >= sessions.max_sessions:
+            sessions.sweep()  # A tracker idle past the timeout is free to take
+            if len(sessions) >= sessions.max_sessions:
+                with self._lock:
+                    self.shared_frames += 1
+                return None
+        return sessions.get(session_id)
+
+    def record(self, tracker, found):
+        """Update tracking metrics after a frame went through `tracker`."""
+        with self._lock:
+            tracker.frames += 1
+            self.frames += 1
+            if not tracker.tracking:
+                tracker.redetections += 1
+                self.redetections += 1
+            elif not found:
+                tracker.losses += 1
+                self.losses += 1
+            tracker.tracking = found
+
+    def stats(self):
+        with self._lock:
+            frames = self.frames
+            return {
+                **self.sessions.stats(),
+                "created": self.created,
+                "spares": len(self._spares),
+                "spares_used": self.spares_used,
+                "frames": frames,
+                "tracking_losses": self.losses,
+                "redetections": self.redetections,
+                "redetection_rate": round(self.redetections / frames, 3) if frames else 0,
+                "shared_frames": self.shared_frames,
+            }
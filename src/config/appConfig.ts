@@ -53,6 +53,24 @@ export const AppConfig = {
          * Frame rate for pose detection (lower = better performance)
          */
         detectionFPS: 15,
+
+        /**
+         * Upload frames as raw JPEG files instead of base64 inside JSON
+         * (smaller payloads, no base64 decode on the server)
+         */
+        binaryFrameUpload: true,
+
+        /**
+         * Landmark format requested from the backend:
+         * 'compact' = quantized int16 array (~5x smaller responses),
+         * 'full' = legacy JSON objects, 'none' = rep counting only (no overlay)
+         */
+        landmarkFormat: 'compact' as 'full' | 'compact' | 'none',
+
+        /**
+         * Only request these MediaPipe landmark indices (empty = all 33)
+         */
+        landmarkJoints: [] as number[],
     },
 
     /**
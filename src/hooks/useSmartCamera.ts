@@ -48,19 +48,20 @@ export const useSmartCamera = (
         try {
             // 1. Capture Frame (Single source of truth)
             // Use low quality for speed, just like Gesture-Sense
+            const binaryUpload = AppConfig.poseDetection.binaryFrameUpload;
             const photo = await cameraRef.current.takePictureAsync({
                 quality: 0.5, // Increase quality for better detection
-                base64: true,
+                base64: !binaryUpload,
                 shutterSound: false,
                 skipProcessing: true, // skip orienting/cropping for speed (server handles rotation if needed)
             });
 
-            if (photo && photo.base64) {
-                const base64 = photo.base64;
-
+            if (photo && (binaryUpload ? photo.uri : photo.base64)) {
                 // 2. Process Pose & Stats via Backend
                 if (AppConfig.features.enablePoseDetection) {
-                    const result = await poseDetectionService.detectPose(base64, exerciseId);
+                    const result = binaryUpload
+                        ? await poseDetectionService.detectPoseFromUri(photo.uri, exerciseId)
+                        : await poseDetectionService.detectPose(photo.base64, exerciseId);
 
                     if (result.poses && result.poses.length > 0) {
                         setPoses(result.poses);
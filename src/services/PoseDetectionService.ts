@@ -23,9 +23,89 @@ export interface BackendAnalysisResult {
     error: string | null;
 }
 
+/**
+ * Create a random id so the backend can keep this device's rep state separate
+ */
+const createSessionId = (): string =>
+    `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+
+const NUM_LANDMARKS = 33;
+
+/**
+ * Landmark options sent with every request (see python_server/landmark_codec.py)
+ */
+const landmarkOptions = (): Record<string, string> => {
+    const { landmarkFormat, landmarkJoints } = AppConfig.poseDetection;
+    const options: Record<string, string> = { landmarks: landmarkFormat };
+    if (landmarkJoints.length > 0) options.joints = landmarkJoints.join(',');
+    return options;
+};
+
+const landmarkQuery = (): string =>
+    Object.entries(landmarkOptions()).map(([key, value]) => `&${key}=${encodeURIComponent(value)}`).join('');
+
+/**
+ * Server-side stage timings for the request log, when the server sends them
+ * (SERVER_TIMING=1, see python_server/latency_stats.py)
+ */
+const serverTiming = (response: Response): string => {
+    const timing = response.headers.get('Server-Timing');
+    return timing ? ` | Server: ${timing}` : '';
+};
+
+/**
+ * Decode a compact "lm" block: base64 of joints x (x, y, z, score), little-endian
+ * int16 (divided by `scale`) or float32. Returns all 33 keypoints in MediaPipe
+ * order; joints that were not requested get score 0.
+ */
+const decodeCompactLandmarks = (lm: any): Keypoint[] => {
+    const binary = atob(lm.data);
+    const view = new DataView(new ArrayBuffer(binary.length));
+    for (let i = 0; i < binary.length; i++) view.setUint8(i, binary.charCodeAt(i));
+
+    const isFloat = lm.dtype === 'f32';
+    const size = isFloat ? 4 : 2;
+    const scale = lm.scale || 1;
+    const count = binary.length / (size * 4);
+    const joints: number[] = lm.joints ?? Array.from({ length: count }, (_, i) => i);
+    const read = (offset: number) =>
+        isFloat ? view.getFloat32(offset, true) : view.getInt16(offset, true) / scale;
+
+    const keypoints: Keypoint[] = Array.from({ length: NUM_LANDMARKS }, (_, i) => ({
+        name: `point_${i}`, x: 0, y: 0, z: 0, score: 0,
+    }));
+    joints.forEach((joint, row) => {
+        const offset = row * 4 * size;
+        keypoints[joint] = {
+            name: `point_${joint}`,
+            x: read(offset),
+            y: read(offset + size),
+            z: read(offset + 2 * size),
+            score: read(offset + 3 * size),
+        };
+    });
+    return keypoints;
+};
+
+export interface PoseStreamHandle {
+    /** Send a frame; returns false (frame skipped) while the previous one is in flight */
+    sendFrame: (base64Image: string) => boolean;
+    setExercise: (exerciseId: string) => void;
+    close: () => void;
+}
+
 class PoseDetectionService {
     private isInitialized: boolean = false;
     private initializationError: string | null = null;
+    private sessionId: string = createSessionId();
+    private backoffUntil: number = 0; // Date.now() before which /detect is not called (server shed load)
+
+    /**
+     * Session id sent with every request (backend keys rep state by it)
+     */
+    get currentSessionId(): string {
+        return this.sessionId;
+    }
 
     /**
      * Check if the service is ready
@@ -53,6 +133,12 @@ class PoseDetectionService {
                 this.isInitialized = true;
                 this.initializationError = null;
                 return true;
+            } else if (response.status === 503 && (await response.json().catch(() => null))?.status === 'starting') {
+                // Reachable but still warming up; the first frames just wait a little longer
+                console.log('[PoseDetection] ⏳ Backend is warming up');
+                this.isInitialized = true;
+                this.initializationError = null;
+                return true;
             } else {
                 console.warn('[PoseDetection] ❌ Backend returned error:', response.status);
                 Alert.alert('Connection Error', `Cannot connect to AI Server at ${POSE_API_URL}\nStatus: ${response.status}`);
@@ -67,14 +153,10 @@ class PoseDetectionService {
     }
 
     /**
-     * Detect poses from a base64 image string
-     * @param base64Image - Base64 encoded image frame
-     * @param exerciseId - The ID of the exercise being performed
-     * @returns BackendAnalysisResult containing poses and workout stats
+     * Default empty result
      */
-    async detectPose(base64Image: string, exerciseId: string = 'push-ups'): Promise<BackendAnalysisResult> {
-        // Default empty result
-        const emptyResult: BackendAnalysisResult = {
+    private emptyResult(): BackendAnalysisResult {
+        return {
             poses: [],
             rep_count: 0,
             stage: null,
@@ -83,8 +165,66 @@ class PoseDetectionService {
             isReady: this.isInitialized,
             error: null
         };
+    }
+
+    /**
+     * Honour Retry-After on a 429/503 from /detect so an overloaded server is not hammered
+     */
+    private backOff(response: Response): void {
+        if (response.status !== 429 && response.status !== 503) return;
+        const seconds = Number(response.headers.get('Retry-After')) || 1;
+        this.backoffUntil = Date.now() + seconds * 1000;
+        console.log(`[PoseDetection] ⏳ Server busy (${response.status}), pausing ${seconds}s`);
+    }
+
+    /**
+     * Map a /detect response body to a BackendAnalysisResult
+     */
+    private parseDetectResponse(data: any): BackendAnalysisResult {
+        if (data.skipped) {
+            // Superseded by a newer frame or dropped as stale under load
+            return this.emptyResult();
+        }
+        if (data.error) {
+            return { ...this.emptyResult(), error: data.error };
+        }
+
+        // Map backend landmarks to our Keypoint interface
+        const keypoints: Keypoint[] = data.lm ? decodeCompactLandmarks(data.lm) : (data.landmarks || []).map((kp: any) => ({
+            name: kp.name,
+            x: kp.x, // Normalized 0-1
+            y: kp.y, // Normalized 0-1
+            z: kp.z,
+            score: kp.score
+        }));
+
+        // Wrap in Pose object
+        const pose: Pose = {
+            keypoints: keypoints,
+            score: data.confidence || 0
+        };
+
+        return {
+            poses: keypoints.length > 0 ? [pose] : [],
+            rep_count: data.rep_count || 0,
+            stage: data.stage || null,
+            feedback: data.feedback || [],
+            form_score: (data.confidence || 0) * 100, // Assuming 0-1 from backend, converting to 0-100 for frontend
+            isReady: true,
+            error: null
+        };
+    }
+
+    /**
+     * Detect poses from a base64 image string
+     * @param base64Image - Base64 encoded image frame
+     * @param exerciseId - The ID of the exercise being performed
+     * @returns BackendAnalysisResult containing poses and workout stats
+     */
+    async detectPose(base64Image: string, exerciseId: string = 'push-ups'): Promise<BackendAnalysisResult> {
+        const emptyResult = this.emptyResult();
 
-        if (!this.isInitialized) return emptyResult;
+        if (!this.isInitialized || Date.now() < this.backoffUntil) return emptyResult;
 
         try {
             const t0 = performance.now();
@@ -95,44 +235,58 @@ class PoseDetectionService {
                 },
                 body: JSON.stringify({
                     image: base64Image,
-                    exerciseId: exerciseId
+                    exerciseId: exerciseId,
+                    sessionId: this.sessionId,
+                    ...landmarkOptions(),
                 }),
             });
             const t1 = performance.now();
-            console.log(`[PoseDetection] Request took ${Math.round(t1 - t0)}ms | Payload: ~${Math.round(base64Image.length / 1024)}KB`);
+            console.log(`[PoseDetection] Request took ${Math.round(t1 - t0)}ms | Payload: ~${Math.round(base64Image.length / 1024)}KB${serverTiming(response)}`);
+
+            if (!response.ok) {
+                this.backOff(response);
+                return emptyResult;
+            }
+
+            return this.parseDetectResponse(await response.json());
+
+        } catch (error: any) {
+            console.warn('[PoseDetection] Request failed:', error.message);
+            return emptyResult;
+        }
+    }
+
+    /**
+     * Detect poses from a captured image file (binary upload, no base64)
+     * @param imageUri - Local file URI returned by takePictureAsync
+     * @param exerciseId - The ID of the exercise being performed
+     * @returns BackendAnalysisResult containing poses and workout stats
+     */
+    async detectPoseFromUri(imageUri: string, exerciseId: string = 'push-ups'): Promise<BackendAnalysisResult> {
+        const emptyResult = this.emptyResult();
 
-            if (!response.ok) return emptyResult;
+        if (!this.isInitialized || Date.now() < this.backoffUntil) return emptyResult;
 
-            const data = await response.json();
+        try {
+            const form = new FormData();
+            // React Native uploads the file straight from disk when given a uri
+            form.append('image', { uri: imageUri, name: 'frame.jpg', type: 'image/jpeg' } as any);
 
-            if (data.error) {
-                return { ...emptyResult, error: data.error };
+            const query = `exerciseId=${encodeURIComponent(exerciseId)}&sessionId=${encodeURIComponent(this.sessionId)}${landmarkQuery()}`;
+            const t0 = performance.now();
+            const response = await fetch(`${POSE_API_URL}/detect?${query}`, {
+                method: 'POST',
+                body: form,
+            });
+            const t1 = performance.now();
+            console.log(`[PoseDetection] Request took ${Math.round(t1 - t0)}ms | Binary upload${serverTiming(response)}`);
+
+            if (!response.ok) {
+                this.backOff(response);
+                return emptyResult;
             }
 
-            // Map backend landmarks to our Keypoint interface
-            const keypoints: Keypoint[] = (data.landmarks || []).map((kp: any) => ({
-                name: kp.name,
-                x: kp.x, // Normalized 0-1
-                y: kp.y, // Normalized 0-1
-                z: kp.z,
-                score: kp.score
-            }));
-
-            // Wrap in Pose object
-            const pose: Pose = {
-                keypoints: keypoints,
-                score: data.confidence || 0
-            };
-
-            return {
-                poses: keypoints.length > 0 ? [pose] : [],
-                rep_count: data.rep_count || 0,
-                stage: data.stage || null,
-                feedback: data.feedback || [],
-                form_score: (data.confidence || 0) * 100, // Assuming 0-1 from backend, converting to 0-100 for frontend
-                isReady: true,
-                error: null
-            };
+            return this.parseDetectResponse(await response.json());
 
         } catch (error: any) {
             console.warn('[PoseDetection] Request failed:', error.message);
@@ -140,6 +294,51 @@ class PoseDetectionService {
         }
     }
 
+    /**
+     * Open a persistent WebSocket stream for continuous analysis.
+     * Frames are only sent while no frame is in flight, so a slow server
+     * never builds a backlog (the newest frame always wins).
+     * @param exerciseId - The ID of the exercise being performed
+     * @param onResult - Called with each analysed frame
+     */
+    openStream(exerciseId: string, onResult: (result: BackendAnalysisResult) => void): PoseStreamHandle {
+        const wsUrl = POSE_API_URL.replace(/^http/, 'ws');
+        const query = `exerciseId=${encodeURIComponent(exerciseId)}&sessionId=${encodeURIComponent(this.sessionId)}${landmarkQuery()}`;
+        const socket = new WebSocket(`${wsUrl}/stream?${query}`);
+        let inFlight = false;
+        let frameId = 0;
+        let sentAt = 0;
+
+        socket.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            if (data.type === 'result' || data.type === 'error') {
+                inFlight = false;
+                console.log(`[PoseDetection] Stream frame took ${Math.round(performance.now() - sentAt)}ms | Dropped: ${data.stream?.dropped ?? 0}`);
+                onResult(this.parseDetectResponse(data));
+            }
+        };
+        socket.onerror = (event: any) => {
+            inFlight = false;
+            console.warn('[PoseDetection] Stream error:', event.message);
+        };
+
+        return {
+            sendFrame: (base64Image: string): boolean => {
+                if (socket.readyState !== WebSocket.OPEN || inFlight) return false;
+                inFlight = true;
+                sentAt = performance.now();
+                socket.send(JSON.stringify({ image: base64Image, frameId: frameId++ }));
+                return true;
+            },
+            setExercise: (id: string) => {
+                if (socket.readyState === WebSocket.OPEN) {
+                    socket.send(JSON.stringify({ type: 'config', exerciseId: id }));
+                }
+            },
+            close: () => socket.close(),
+        };
+    }
+
     /**
      * Reset stats for a specific exercise on the backend
      */
@@ -150,7 +349,7 @@ class PoseDetectionService {
             await fetch(`${POSE_API_URL}/reset`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ exerciseId }),
+                body: JSON.stringify({ exerciseId, sessionId: this.sessionId }),
             });
             console.log(`[PoseDetection] Stats reset for ${exerciseId}`);
             return true;